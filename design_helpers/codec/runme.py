@@ -0,0 +1,66 @@
+'''
+Compare the JSON and binary codecs for task messages on the PLCpep7 task used in
+procs_throughput: encoded size, and encode and decode time per task, for single
+task messages and for batches of tasks. This includes converting from/to Task
+objects, as done by the WFprocessor and the helper.
+'''
+
+from radical.entk import Task
+from radical.entk.appman.codec import get_codec, JSONCodec, BinaryCodec
+import time
+
+
+def create_task():
+
+    t = Task()
+    t.arguments = ["--template=PLCpep7_template.mdp",
+                    "--newname=PLCpep7_run.mdp",
+                    "--wldelta=100",
+                    "--equilibrated=False",
+                    "--lambda_state=0",
+                    "--seed=1"]
+    t.cores = 20
+    t.copy_input_data = ['$STAGE_2_TASK_1/PLCpep7.tpr']
+    t.download_output_data = ['PLCpep7.xtc > PLCpep7_run1_gen0.xtc',
+                                'PLCpep7.log > PLCpep7_run1_gen0.log',
+                                'PLCpep7_dhdl.xvg > PLCpep7_run1_gen0_dhdl.xvg',
+                                'PLCpep7_pullf.xvg > PLCpep7_run1_gen0_pullf.xvg',
+                                'PLCpep7_pullx.xvg > PLCpep7_run1_gen0_pullx.xvg',
+                                'PLCpep7.gro > PLCpep7_run1_gen0.gro'
+                            ]
+    t._parent_stage = 'radical.entk.stage.0001'
+    t._parent_pipeline = 'radical.entk.pipeline.0001'
+    return t
+
+
+if __name__ == '__main__':
+
+    num_tasks = 100000
+    tasks = [create_task() for i in range(num_tasks)]
+
+    codecs = [  ('json', JSONCodec()), 
+                ('binary', BinaryCodec(omit_empty=False)), 
+                ('binary, omit empty', BinaryCodec(omit_empty=True))]
+
+    for batch_size in [1, 64]:
+
+        batches = [tasks[i:i+batch_size] for i in range(0, num_tasks, batch_size)]
+
+        for name, codec in codecs:
+
+            start = time.time()
+            bodies = [codec.encode([t.to_dict() for t in batch]) for batch in batches]
+            encode_time = time.time() - start
+
+            start = time.time()
+            for body in bodies:
+                for task_desc in codec.decode(body):
+                    t = Task()
+                    t.load_from_dict(task_desc)
+            decode_time = time.time() - start
+
+            print 'batch size %4s, %-18s: %6.1f bytes/task, encode %5.2f us/task, decode %5.2f us/task'%(
+                                    batch_size, name,
+                                    sum(len(body) for body in bodies)/float(num_tasks),
+                                    encode_time/num_tasks*1e6,
+                                    decode_time/num_tasks*1e6)
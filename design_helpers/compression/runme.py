@@ -0,0 +1,90 @@
+'''
+Bytes on the wire and encoding time per task of the task messages of a replica
+exchange like ensemble of PLCpep7 tasks (see codec/runme.py), whose tasks differ only
+in their seed, lambda state and output names, without and with zlib compression, for
+single task messages and for batches.
+
+The last column emulates a dictionary shared per stage: the zlib stream is primed with
+a message of the stage's first task, which the receiver would need to hold as well, so
+that only what differs from it is sent. Python 2's zlib does not support preset
+dictionaries, the primed stream is copied for each message instead.
+'''
+
+from radical.entk import Task
+from radical.entk.appman.codec import get_codec, compress, decode, ZLIB_TAG
+import zlib
+import time
+
+
+def create_task(replica):
+
+    t = Task()
+    t.pre_exec = ['module load gromacs/5.1.4', 'export OMP_NUM_THREADS=1']
+    t.executable = ['gmx_mpi']
+    t.arguments = ["--template=PLCpep7_template.mdp",
+                    "--newname=PLCpep7_run.mdp",
+                    "--wldelta=100",
+                    "--equilibrated=False",
+                    "--lambda_state=%s"%(replica%16),
+                    "--seed=%s"%replica]
+    t.cores = 20
+    t.copy_input_data = ['$STAGE_2_TASK_%s/PLCpep7.tpr'%replica]
+    t.download_output_data = ['PLCpep7.%s > PLCpep7_run%s_gen0.%s'%(ext, replica, ext)
+                                for ext in ['xtc', 'log', 'gro']] + \
+                             ['PLCpep7_%s.xvg > PLCpep7_run%s_gen0_%s.xvg'%(ext, replica, ext)
+                                for ext in ['dhdl', 'pullf', 'pullx']]
+    t._parent_stage = 'radical.entk.stage.0001'
+    t._parent_pipeline = 'radical.entk.pipeline.0001'
+    return t
+
+
+def primed_compress(compressor, body):
+
+    c = compressor.copy()
+    return ZLIB_TAG + c.compress(body) + c.flush()
+
+
+if __name__ == '__main__':
+
+    num_tasks = 16384
+    tasks = [create_task(i) for i in range(num_tasks)]
+
+    for codec_name in ['json', 'binary']:
+
+        codec = get_codec(codec_name)
+
+        # Stream primed with the message of the first task of the stage
+        primer = codec.encode([tasks[0].to_dict()])
+        compressor = zlib.compressobj(1)
+        compressor.compress(primer)
+        compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        for batch_size in [1, 16, 64]:
+
+            batches = [tasks[i:i+batch_size] for i in range(0, num_tasks, batch_size)]
+
+            start = time.time()
+            bodies = [codec.encode([t.to_dict() for t in batch]) for batch in batches]
+            encode_time = time.time() - start
+
+            start = time.time()
+            compressed = [compress(body, 0) for body in bodies]
+            compress_time = time.time() - start
+
+            start = time.time()
+            for body in compressed:
+                decode(body)
+            decode_time = time.time() - start
+
+            primed = [primed_compress(compressor, body) for body in bodies]
+
+            print '%-6s batch size %2s: %6.1f bytes/task, zlib %5.1f bytes/task '%(
+                        codec_name, batch_size,
+                        sum(len(body) for body in bodies)/float(num_tasks),
+                        sum(len(body) for body in compressed)/float(num_tasks)) + \
+                  '(encode %4.1f + compress %4.1f us/task, decode %4.1f us/task), '%(
+                        encode_time/num_tasks*1e6,
+                        compress_time/num_tasks*1e6,
+                        decode_time/num_tasks*1e6) + \
+                  'stage dictionary %5.1f bytes/task'%(
+                        sum(len(body) for body in primed)/float(num_tasks))
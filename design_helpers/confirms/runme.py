@@ -0,0 +1,60 @@
+'''
+Publish throughput of batches of tasks to a pending queue through the RabbitMQ
+transport, without and with publisher confirms. In confirm mode publishing waits for
+the confirmation of each message, one round trip per batch of tasks, which larger
+batches amortize. Requires a RabbitMQ server on RMQ_HOSTNAME, localhost by default.
+'''
+
+from radical.entk import Task
+from radical.entk.appman.batch import Batcher
+from radical.entk.appman.transport import get_transport
+import time
+import sys
+import os
+
+
+def create_tasks(num_tasks):
+
+    tasks = list()
+    for i in range(num_tasks):
+        t = Task()
+        t.executable = ['/bin/sleep']
+        t.arguments = ['0']
+        tasks.append(t)
+
+    return tasks
+
+
+def publish(tasks, batch_size, confirm_window):
+
+    transport = get_transport('rabbitmq', os.environ.get('RMQ_HOSTNAME', 'localhost'))
+    channel = transport.channel()
+    channel.declare_queue('confirms-pendingq')
+
+    batcher = Batcher(channel, '', batch_size=batch_size, confirm_window=confirm_window)
+
+    start = time.time()
+    for task in tasks:
+        batcher.add(task, 'confirms-pendingq')
+    batcher.close()
+    duration = time.time() - start
+
+    channel.delete_queue('confirms-pendingq')
+    channel.close()
+
+    return duration, batcher.stats['nacked']
+
+
+if __name__ == '__main__':
+
+    num_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    for batch_size in [1, 16, 64, 256]:
+
+        tasks = create_tasks(num_tasks)
+
+        for name, confirm_window in [('no confirms', None), ('confirms', 1)]:
+            duration, nacked = publish(tasks, batch_size, confirm_window)
+            print 'batch size %3s, %-12s: %8.0f tasks/s, %6.0f messages/s, %s nacked'%(
+                        batch_size, name, num_tasks/duration,
+                        num_tasks/batch_size/duration, nacked)
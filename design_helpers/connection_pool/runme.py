@@ -0,0 +1,55 @@
+'''
+Compare the time to open channels for worker threads starting and restarting, with a
+new connection per channel (as before connection pooling) against channels of the
+RabbitMQ transport, whose connections are returned to a per-process pool when closed.
+Prints the connections opened on the RabbitMQ server in each case. Requires a RabbitMQ
+server on localhost.
+'''
+
+from radical.entk.appman.transport import get_transport
+import pika
+import time
+
+
+def unpooled(num_workers, num_restarts):
+
+    for i in range(num_restarts):
+        for j in range(num_workers):
+            connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost'))
+            channel = connection.channel()
+            channel.queue_declare(queue='pool-%s'%j)
+            connection.close()
+
+    return num_workers*num_restarts
+
+
+def pooled(num_workers, num_restarts):
+
+    transport = get_transport('rabbitmq')
+
+    for i in range(num_restarts):
+        channels = list()
+        for j in range(num_workers):
+            channel = transport.channel()
+            channel.declare_queue('pool-%s'%j)
+            channels.append(channel)
+        for channel in channels:
+            channel.close()
+
+    return transport.stats['opened']
+
+
+if __name__ == '__main__':
+
+    # Workers of a sharded application manager (e.g. 4 push, pull and sync threads),
+    # each started and restarted
+    num_workers = 12
+    num_restarts = 10
+
+    for name, func in [('unpooled', unpooled), ('pooled', pooled)]:
+
+        start = time.time()
+        connections = func(num_workers, num_restarts)
+        print '%s: %.2f secs for %s channels, %s connections opened'%(
+                                                    name, time.time() - start,
+                                                    num_workers*num_restarts, connections)
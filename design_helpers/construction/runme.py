@@ -0,0 +1,102 @@
+'''
+Time and memory to construct workflows of 10^4 to 10^7 tasks: one pipeline of 10
+stages, tasks with an executable and arguments. Uids are either formatted when the
+objects are created or kept as integers and formatted when read (lazy). Memory is
+measured as the growth of the resident set size of a fresh process that creates the
+workflow. Before that, the cost per uid of ru.generate_id() and of the allocator.
+
+10^7 tasks take several GB of memory, the largest size is given on the command line:
+
+    python runme.py [max tasks, default 10^6]
+'''
+
+from radical.entk import Pipeline, Stage, Task, uids
+import radical.utils as ru
+import multiprocessing as mp
+import resource
+import time
+import sys
+import gc
+
+
+def rss():
+
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1])*resource.getpagesize()
+
+
+def create_workflow(num_tasks, stages):
+
+    pipe = Pipeline()
+
+    for s in range(stages):
+
+        tasks = set()
+        for i in range(num_tasks/stages):
+            t = Task()
+            t.executable = ['/bin/sleep']
+            t.arguments = ['0']
+            tasks.add(t)
+
+        stage = Stage()
+        stage.add_tasks(tasks)
+        pipe.add_stages(stage)
+
+    return pipe
+
+
+def measure(num_tasks, lazy, results):
+
+    uids.set_lazy(lazy)
+
+    gc.collect()
+    before = rss()
+
+    start = time.time()
+    pipe = create_workflow(num_tasks, 10)
+    elapsed = time.time() - start
+
+    gc.collect()
+    results.put((elapsed, float(rss() - before)/num_tasks))
+
+
+if __name__ == '__main__':
+
+    max_tasks = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10**6
+
+    num_uids = 10**6
+
+    start = time.time()
+    for i in xrange(num_uids):
+        ru.generate_id('radical.entk.task')
+    generate = (time.time() - start)/num_uids
+
+    for lazy in [False, True]:
+        uids.set_lazy(lazy)
+        start = time.time()
+        for i in xrange(num_uids):
+            uids.TASK_UIDS.new()
+        allocate = (time.time() - start)/num_uids
+        print 'uid, lazy=%s: ru.generate_id %0.3f us, allocator %0.3f us'%(
+                    lazy, generate*1e6, allocate*1e6)
+
+    uids.set_lazy(False)
+
+    print
+    print 'tasks, lazy, construction (s), construction (us/task), bytes per task'
+
+    num_tasks = 10**4
+    while num_tasks <= max_tasks:
+
+        for lazy in [False, True]:
+
+            results = mp.Queue()
+            proc = mp.Process(target=measure, args=(num_tasks, lazy, results))
+            proc.start()
+            elapsed, per_task = results.get()
+            proc.join()
+
+            print '%s, %s, %0.2f, %0.2f, %0.1f'%(num_tasks, lazy, elapsed,
+                                                    elapsed/num_tasks*1e6, per_task)
+
+        num_tasks *= 10
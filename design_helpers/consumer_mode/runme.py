@@ -0,0 +1,105 @@
+'''
+Compare the poll (basic_get) and push (prefetch window, batched acks) consumer
+modes used by the dequeue, synchronizer and helper components. For each mode, this
+script measures against a RabbitMQ server on localhost:
+
+    * the throughput of consuming and acking a prefilled queue of task messages
+    * the CPU utilization of the consumer while the queue is empty
+'''
+
+from radical.entk import Task
+from radical.entk.appman.consumer import Consumer, POLL, PUSH
+from threading import Thread, Event
+import psutil
+import pika
+import json
+import time
+import os
+
+queue = 'consumer-benchmark'
+
+
+def create_task():
+
+    t = Task()
+    t.arguments = ["--template=PLCpep7_template.mdp",
+                    "--newname=PLCpep7_run.mdp",
+                    "--wldelta=100",
+                    "--equilibrated=False",
+                    "--lambda_state=0",
+                    "--seed=1"]
+    t.cores = 20
+    t.copy_input_data = ['$STAGE_2_TASK_1/PLCpep7.tpr']
+    t.download_output_data = ['PLCpep7.xtc > PLCpep7_run1_gen0.xtc',
+                                'PLCpep7.log > PLCpep7_run1_gen0.log',
+                                'PLCpep7_dhdl.xvg > PLCpep7_run1_gen0_dhdl.xvg',
+                                'PLCpep7_pullf.xvg > PLCpep7_run1_gen0_pullf.xvg',
+                                'PLCpep7_pullx.xvg > PLCpep7_run1_gen0_pullx.xvg',
+                                'PLCpep7.gro > PLCpep7_run1_gen0.gro'
+                            ]
+    return t
+
+
+def consume(mode, prefetch_count, num_msgs, terminate):
+
+    mq_connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost'))
+    mq_channel = mq_connection.channel()
+    consumer = Consumer(mq_channel, queue, mode, prefetch_count)
+
+    received = 0
+    start = time.time()
+
+    while received < num_msgs:
+        tag, body = consumer.get()
+        if body:
+            json.loads(body)
+            consumer.ack(tag)
+            received += 1
+
+    consumer.flush()
+    print '%s: %s msgs/sec'%(mode, num_msgs/(time.time() - start))
+
+    # Idle till terminated
+    while not terminate.is_set():
+        consumer.get()
+
+    consumer.close()
+    mq_connection.close()
+
+
+if __name__ == '__main__':
+
+    num_msgs = 100000
+    prefetch_count = 64
+    idle_period = 10
+
+    mq_connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost'))
+    mq_channel = mq_connection.channel()
+    body = json.dumps(create_task().to_dict())
+
+    for mode in [POLL, PUSH]:
+
+        mq_channel.queue_delete(queue=queue)
+        mq_channel.queue_declare(queue=queue)
+
+        for i in range(num_msgs):
+            mq_channel.basic_publish(exchange='', routing_key=queue, body=body)
+
+        terminate = Event()
+        consumer_thread = Thread(target=consume, args=(mode, prefetch_count, num_msgs, terminate))
+        consumer_thread.start()
+
+        while mq_channel.queue_declare(queue=queue, passive=True).method.message_count:
+            time.sleep(1)
+        time.sleep(1)
+
+        proc = psutil.Process(os.getpid())
+        proc.cpu_percent()
+        time.sleep(idle_period)
+        print '%s: idle CPU %s %%'%(mode, proc.cpu_percent())
+
+        terminate.set()
+        consumer_thread.join()
+
+    mq_channel.queue_delete(queue=queue)
+    mq_connection.close()
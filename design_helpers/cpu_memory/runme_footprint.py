@@ -0,0 +1,69 @@
+'''
+Memory footprint per task of a workflow, as the growth of the resident set size of a
+fresh process that creates the workflow, divided by the number of tasks. Tasks set the
+executable and its arguments, and either no other list attribute (bare) or one input
+and one output file (staging) as most tasks of an ensemble do.
+
+Run it on two revisions to compare the footprint of their Task, Stage and Pipeline
+objects.
+'''
+
+from radical.entk import Pipeline, Stage, Task
+import multiprocessing as mp
+import resource
+import gc
+
+
+def rss():
+
+    # Resident set size in bytes
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1])*resource.getpagesize()
+
+
+def create_task(i, staging):
+
+    t = Task()
+    t.executable = ['/bin/sleep']
+    t.arguments = ['%s'%(i%10)]
+
+    if staging:
+        t.copy_input_data = ['$SHARED/input_%s.dat'%i]
+        t.download_output_data = ['output_%s.dat'%i]
+
+    return t
+
+
+def measure(num_tasks, stages, staging, results):
+
+    gc.collect()
+    before = rss()
+
+    pipe = Pipeline()
+    for s in range(stages):
+        stage = Stage()
+        stage.add_tasks(set([create_task(i, staging) for i in range(num_tasks/stages)]))
+        pipe.add_stages(stage)
+
+    gc.collect()
+    after = rss()
+
+    results.put(float(after - before)/num_tasks)
+
+
+if __name__ == '__main__':
+
+    stages = 10
+
+    print 'tasks, staging, bytes per task'
+
+    for num_tasks in [10**4, 10**5, 10**6]:
+        for staging in [False, True]:
+
+            results = mp.Queue()
+            proc = mp.Process(target=measure, args=(num_tasks, stages, staging, results))
+            proc.start()
+            per_task = results.get()
+            proc.join()
+
+            print '%s, %s, %0.1f'%(num_tasks, staging, per_task)
@@ -0,0 +1,58 @@
+'''
+Compare the time to execute a workflow of many small pipelines with the threads engine
+(4 enqueue, dequeue and synchronizer threads) against the event loop engine, over the
+shm transport, and the peak resident memory of the application manager process.
+'''
+
+from radical.entk import Pipeline, Stage, Task, AppManager
+import resource
+import time
+import sys
+
+
+def create_workflow(num_pipes, num_stages, num_tasks):
+
+    pipes = set()
+
+    for i in range(num_pipes):
+
+        p = Pipeline()
+
+        for j in range(num_stages):
+
+            s = Stage()
+            for k in range(num_tasks):
+                t = Task()
+                t.executable = ['/bin/sleep']
+                t.arguments = ['0']
+                s.add_tasks(t)
+
+            p.add_stages(s)
+
+        pipes.add(p)
+
+    return pipes
+
+
+if __name__ == '__main__':
+
+    num_pipes = 512
+    num_stages = 4
+    num_tasks = 4
+
+    if len(sys.argv) > 1:
+        engines = sys.argv[1:]
+    else:
+        engines = ['threads', 'loop']
+
+    for engine in engines:
+
+        appman = AppManager(transport='shm', engine=engine, push_threads=4, pull_threads=4,
+                            sync_threads=4, pending_qs=4, completed_qs=4)
+        appman.assign_workflow(create_workflow(num_pipes, num_stages, num_tasks))
+
+        start = time.time()
+        appman.run()
+        print '%s engine: %.2f secs for %s tasks, max RSS %s MB'%(
+                        engine, time.time() - start, num_pipes*num_stages*num_tasks,
+                        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024)
@@ -0,0 +1,65 @@
+'''
+Compare the execution of one wide stage without a bound on the tasks in flight and
+with max_in_flight set: execution time and the highest number of messages waiting
+on the pending queue of the local transport. The highest number of tasks in
+flight is logged by the WFprocessor ('Tasks in flight').
+'''
+
+from radical.entk import Pipeline, Stage, Task, AppManager
+from threading import Thread, Event
+import time
+import sys
+
+
+def create_workflow(num_tasks):
+
+    p = Pipeline()
+    s = Stage()
+    for k in range(num_tasks):
+        t = Task()
+        t.executable = ['/bin/sleep']
+        t.arguments = ['0']
+        s.add_tasks(t)
+    p.add_stages(s)
+
+    return set([p])
+
+
+def sample_depth(appman, done, depths):
+
+    # Messages on the pending queue, of batch_size tasks each
+    while not done.is_set():
+        queues = appman._transport._queues
+        if appman._pending_queue and appman._pending_queue[0] in queues:
+            depths.append(queues[appman._pending_queue[0]].qsize())
+        time.sleep(0.01)
+
+
+if __name__ == '__main__':
+
+    num_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    if len(sys.argv) > 2:
+        limits = [int(l) for l in sys.argv[2:]]
+    else:
+        limits = [0, 1024]
+
+    for limit in limits:
+
+        appman = AppManager(transport='local', batch_size=64, max_in_flight=limit or None)
+        appman.assign_workflow(create_workflow(num_tasks))
+
+        done = Event()
+        depths = [0]
+        sampler = Thread(target=sample_depth, args=(appman, done, depths))
+        sampler.start()
+
+        start = time.time()
+        appman.run()
+        duration = time.time() - start
+
+        done.set()
+        sampler.join()
+
+        print 'max_in_flight %s: %.2f secs for %s tasks, up to %s messages pending'%(
+                                limit or None, duration, num_tasks, max(depths))
@@ -0,0 +1,67 @@
+'''
+Latency of small interactive pipelines running next to a wide throughput pipeline,
+with and without a higher priority for the interactive pipelines. The interactive
+pipelines are assigned with the throughput pipeline and complete when all their
+stages did, the time they take is sampled in the AppManager process.
+'''
+
+from radical.entk import Pipeline, Stage, Task, AppManager, states
+from threading import Thread, Event
+import time
+import sys
+
+
+def create_pipeline(num_stages, num_tasks):
+
+    p = Pipeline()
+    for i in range(num_stages):
+        s = Stage()
+        for k in range(num_tasks):
+            t = Task()
+            t.executable = ['/bin/sleep']
+            t.arguments = ['0']
+            s.add_tasks(t)
+        p.add_stages(s)
+
+    return p
+
+
+def sample_done(pipes, done, start, durations):
+
+    while not done.is_set() and len(durations) < len(pipes):
+        for p in pipes:
+            if p.uid not in durations and p.state == states.DONE:
+                durations[p.uid] = time.time() - start[0]
+        time.sleep(0.01)
+
+
+if __name__ == '__main__':
+
+    num_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    max_in_flight = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+
+    for priority in [0, 1]:
+
+        throughput = create_pipeline(1, num_tasks)
+        interactive = [create_pipeline(3, 4) for i in range(4)]
+
+        for p in interactive:
+            p.priority = priority
+
+        appman = AppManager(transport='local', batch_size=16, max_in_flight=max_in_flight)
+        appman.assign_workflow(set([throughput] + interactive))
+
+        done = Event()
+        start = [time.time()]
+        durations = dict()
+        sampler = Thread(target=sample_done, args=(interactive, done, start, durations))
+        sampler.start()
+
+        appman.run()
+        total = time.time() - start[0]
+
+        done.set()
+        sampler.join()
+
+        print 'priority %s: interactive pipelines done after %.2f secs (max), all %.2f secs'%(
+                    priority, max(durations.values()), total)
@@ -0,0 +1,46 @@
+'''
+Measure the time to set up and clean up the queues of many application managers
+sharing one RabbitMQ server, each with its own namespaced pending, completed and
+synchronizer queues, against deleting and declaring fixed queue names as before
+sessions were namespaced. Requires a RabbitMQ server on localhost.
+'''
+
+from radical.entk import AppManager
+from radical.entk.appman.transport import get_transport
+import time
+
+
+if __name__ == '__main__':
+
+    num_sessions = 16
+    num_qs = 4
+
+    transport = get_transport('rabbitmq')
+
+    # Fixed names, deleted before being declared
+    start = time.time()
+    for i in range(num_sessions):
+        channel = transport.channel()
+        for name in ['pendingq', 'completedq', 'synchronizerq']:
+            for j in range(1, num_qs+1):
+                channel.delete_queue('%s-%s'%(name, j))
+                channel.declare_queue('%s-%s'%(name, j))
+        channel.close()
+    print 'fixed names: %.3f secs per session'%((time.time() - start)/num_sessions)
+
+    # Namespaced queues, declared and cleaned up in bulk
+    appmans = [AppManager(transport=transport, pending_qs=num_qs, completed_qs=num_qs,
+                            sync_threads=num_qs) for i in range(num_sessions)]
+
+    start = time.time()
+    for appman in appmans:
+        appman._setup_mqs()
+    setup = time.time() - start
+
+    start = time.time()
+    for appman in appmans:
+        appman._cleanup_mqs()
+    cleanup = time.time() - start
+
+    print 'namespaced: %.3f secs setup, %.3f secs cleanup per session'%(
+                                        setup/num_sessions, cleanup/num_sessions)
@@ -0,0 +1,98 @@
+'''
+The enqueue thread of the WFprocessor blocks on a queue of pipelines whose
+current stage is ready for execution instead of polling every pipeline. This
+script measures, against a RabbitMQ server on localhost:
+
+    * the CPU utilization of an idle WFprocessor process, i.e. while all
+      submitted tasks are still executing
+    * the time-to-submit of a newly unblocked stage, i.e. the time between
+      the completion of the last task of a stage being published and the
+      first task of the next stage appearing in the pending queue
+
+as a function of the number of pipelines.
+'''
+
+from radical.entk import Pipeline, Stage, Task, AppManager, states
+from radical.entk.appman.wfprocessor import WFprocessor
+import psutil
+import pika
+import json
+import time
+
+
+def create_workflow(pipes):
+
+    workflow = set()
+
+    for p in range(pipes):
+        pipe = Pipeline()
+        for s in range(2):
+            stage = Stage()
+            stage.add_tasks(Task())
+            pipe.add_stages(stage)
+        workflow.add(pipe)
+
+    return workflow
+
+
+def drain(channel, queue, count):
+
+    tasks = []
+    while len(tasks) < count:
+        method_frame, header_frame, body = channel.basic_get(queue=queue, no_ack=True)
+        if body:
+            tasks.append(json.loads(body))
+
+    return tasks
+
+
+if __name__ == '__main__':
+
+    pipe_list = [1, 10, 100, 1000]
+    idle_period = 10
+
+    f = open('ready_queue_variation.csv','w')
+    f.write('Pipelines, Idle CPU(%), Time-to-submit(secs)\n')
+
+    for pipes in pipe_list:
+
+        appman = AppManager()
+        appman.assign_workflow(create_workflow(pipes))
+        appman._setup_mqs()
+
+        mq_connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost'))
+        mq_channel = mq_connection.channel()
+
+        wfp = WFprocessor(  workflow = appman._workflow, 
+                            pending_queue = appman._pending_queue, 
+                            completed_queue = appman._completed_queue,
+                            mq_hostname = 'localhost')
+        wfp.start_processor()
+
+        # First stage of each pipeline is submitted, nothing completes
+        submitted = drain(mq_channel, appman._pending_queue[0], pipes)
+
+        proc = psutil.Process(wfp._wfp_process.pid)
+        proc.cpu_percent()
+        time.sleep(idle_period)
+        idle_cpu = proc.cpu_percent()
+
+        # Complete the first stage of all pipelines and wait for the second
+        # stages to be submitted
+        start = time.time()
+        for task in submitted:
+            task['state'] = states.DONE
+            mq_channel.basic_publish(exchange='fork', routing_key='', body=json.dumps(task))
+        drain(mq_channel, appman._pending_queue[0], pipes)
+        submit = (time.time() - start)/pipes
+
+        wfp.end_processor()
+        mq_connection.close()
+
+        print 'Pipes: %s'%pipes
+        print 'Idle CPU: %s %%'%idle_cpu
+        print 'Time-to-submit: %s secs/stage'%submit
+
+        f.write('%s, %s, %s\n'%(pipes, idle_cpu, submit))
+
+    f.close()
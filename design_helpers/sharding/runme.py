@@ -0,0 +1,103 @@
+'''
+Compare the time to execute a workflow with a single enqueue, dequeue and
+synchronizer thread and a single pending and completed queue against the same
+workflow sharded over multiple threads and queues, in one WFprocessor process or
+over multiple WFprocessor and helper processes. Pipelines are sharded by uid,
+so that the tasks of a pipeline are always handled by the same threads and
+queues.
+
+The time till all pipelines completed is reported separately from the time of
+the whole run, which includes stopping the threads and processes. Threads share
+the interpreter of their process, only processes can use more than one core.
+
+usage: python runme.py [transport] [counts...], e.g. python runme.py local 1 2 4
+'''
+
+from radical.entk import Pipeline, Stage, Task, AppManager
+import threading
+import multiprocessing as mp
+import time
+import sys
+
+
+def create_workflow(num_pipes, num_stages, num_tasks):
+
+    pipes = set()
+
+    for i in range(num_pipes):
+
+        p = Pipeline()
+
+        for j in range(num_stages):
+
+            s = Stage()
+            for k in range(num_tasks):
+                t = Task()
+                t.executable = ['/bin/sleep']
+                t.arguments = ['0']
+                s.add_tasks(t)
+
+            p.add_stages(s)
+
+        pipes.add(p)
+
+    return pipes
+
+
+def run(pipes, count, processes, transport):
+
+    appman = AppManager(    push_threads=count, pull_threads=count, sync_threads=count,
+                            pending_qs=count, completed_qs=count, processes=processes,
+                            transport=transport)
+    appman.assign_workflow(pipes)
+
+    # Time at which the last pipeline completed
+    completed = dict()
+
+    def watch():
+        while not all(pipe._completed for pipe in pipes):
+            time.sleep(0.01)
+        completed['time'] = time.time()
+
+    watcher = threading.Thread(target=watch)
+
+    start = time.time()
+    watcher.start()
+    appman.run()
+    watcher.join()
+
+    return completed['time'] - start, time.time() - start
+
+
+if __name__ == '__main__':
+
+    num_pipes = 32
+    num_stages = 4
+    task_list = [64, 512]
+
+    transport = sys.argv[1] if len(sys.argv) > 1 else 'rabbitmq'
+
+    if len(sys.argv) > 2:
+        counts = [int(c) for c in sys.argv[2:]]
+    else:
+        counts = [1, 2, 4]
+
+    print 'Transport: %s, cores: %s'%(transport, mp.cpu_count())
+
+    for num_tasks in task_list:
+
+        for count in counts:
+
+            # Shards as threads and queues of one process, then as processes
+            configs = [(count, 1)]
+            if count > 1:
+                configs.append((1, count))
+
+            for threads, processes in configs:
+
+                pipes = create_workflow(num_pipes, num_stages, num_tasks)
+                completed, total = run(pipes, threads, processes, transport)
+
+                print '%6s tasks, %s threads/queues per component, %s processes: '%(
+                            num_pipes*num_stages*num_tasks, threads, processes) + \
+                      'completed in %.2f secs, run %.2f secs'%(completed, total)
@@ -0,0 +1,44 @@
+'''
+Cost of the state bookkeeping of the tasks of a stage: validated state transitions,
+one task at a time, the completion check of the stage and the task count per state,
+as a function of the number of tasks of the stage.
+
+Run it on two revisions to compare their state representations.
+'''
+
+from radical.entk import Stage, Task, states
+import time
+
+
+def timed(func, repeat):
+
+    start = time.time()
+    for i in range(repeat):
+        func()
+    return (time.time() - start)/repeat
+
+
+if __name__ == '__main__':
+
+    transitions = [states.QUEUED, states.EXECUTING, states.DONE]
+
+    print 'tasks, transition (us/task), completion check (us), progress (us)'
+
+    for num_tasks in [100, 1000, 10000, 100000]:
+
+        stage = Stage()
+        stage.add_tasks(set([Task() for i in range(num_tasks)]))
+        tasks = list(stage.tasks)
+
+        start = time.time()
+        for state in transitions:
+            for task in tasks:
+                task.state = state
+        transition = (time.time() - start)/(len(transitions)*num_tasks)
+
+        assert stage._check_tasks_status()
+
+        check = timed(stage._check_tasks_status, 100000)
+        prog = timed(lambda: stage.progress, 100000)
+
+        print '%s, %0.3f, %0.3f, %0.3f'%(num_tasks, transition*1e6, check*1e6, prog*1e6)
@@ -0,0 +1,75 @@
+'''
+Compare the messages of the completed path: the full description of the PLCpep7
+task (as published before state updates were introduced) against a state update.
+For each codec, measure the encoded size and the time to decode a message and
+apply the state to the task found in the task index.
+'''
+
+from radical.entk import Task, states
+from radical.entk.appman.codec import get_codec
+from radical.entk.appman.batch import state_update
+import time
+
+
+def create_task():
+
+    t = Task()
+    t.arguments = ["--template=PLCpep7_template.mdp",
+                    "--newname=PLCpep7_run.mdp",
+                    "--wldelta=100",
+                    "--equilibrated=False",
+                    "--lambda_state=0",
+                    "--seed=1"]
+    t.cores = 20
+    t.copy_input_data = ['$STAGE_2_TASK_1/PLCpep7.tpr']
+    t.download_output_data = ['PLCpep7.xtc > PLCpep7_run1_gen0.xtc',
+                                'PLCpep7.log > PLCpep7_run1_gen0.log',
+                                'PLCpep7_dhdl.xvg > PLCpep7_run1_gen0_dhdl.xvg',
+                                'PLCpep7_pullf.xvg > PLCpep7_run1_gen0_pullf.xvg',
+                                'PLCpep7_pullx.xvg > PLCpep7_run1_gen0_pullx.xvg',
+                                'PLCpep7.gro > PLCpep7_run1_gen0.gro'
+                            ]
+    t._parent_stage = 'radical.entk.stage.0001'
+    t._parent_pipeline = 'radical.entk.pipeline.0001'
+    return t
+
+
+if __name__ == '__main__':
+
+    num_tasks = 100000
+    tasks = [create_task() for i in range(num_tasks)]
+    index = dict((t.uid, t) for t in tasks)
+
+    for t in tasks:
+        t.state = states.DONE
+
+    for codec_name in ['json', 'binary']:
+
+        codec = get_codec(codec_name)
+
+        # Full task description, rebuilt into a Task to read uid and state
+        bodies = [codec.encode([t.to_dict()]) for t in tasks]
+
+        start = time.time()
+        for body in bodies:
+            for task_desc in codec.decode(body):
+                completed_task = Task()
+                completed_task.load_from_dict(task_desc)
+                index[completed_task.uid].state = str(completed_task.state)
+        full_time = time.time() - start
+        full_size = sum(len(body) for body in bodies)/float(num_tasks)
+
+        # State update
+        bodies = [codec.encode([state_update(t)]) for t in tasks]
+
+        start = time.time()
+        for body in bodies:
+            for update in codec.decode(body):
+                index[update['uid']].state = str(update['state'])
+        update_time = time.time() - start
+        update_size = sum(len(body) for body in bodies)/float(num_tasks)
+
+        print '%-6s full description: %6.1f bytes/msg, %5.2f us/msg'%(
+                        codec_name, full_size, full_time/num_tasks*1e6)
+        print '%-6s state update    : %6.1f bytes/msg, %5.2f us/msg'%(
+                        codec_name, update_size, update_time/num_tasks*1e6)
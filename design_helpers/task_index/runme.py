@@ -0,0 +1,116 @@
+'''
+Every completed task message has to be mapped back to the task object in the
+workflow held by the AppManager/WFprocessor. This script compares the cost per
+message of the nested pipeline/stage/task scan with a lookup in the workflow-wide
+task index, as a function of the number of tasks in the workflow. It also measures
+the full cost of an update message in the WFprocessor: decoding it, looking the task
+up, applying its EXECUTING or DONE state and progressing its stage and pipeline.
+'''
+
+from radical.entk import Pipeline, Stage, Task, states
+from radical.entk.appman.wfprocessor import WFprocessor
+from radical.entk.appman.batch import pack, state_update
+from Queue import Queue
+import random
+import time
+
+
+def create_workflow(pipes, stages, tasks):
+
+    workflow = set()
+
+    for p in range(pipes):
+
+        pipe = Pipeline()
+
+        for s in range(stages):
+            stage = Stage()
+            stage.add_tasks([Task() for t in range(tasks)])
+            pipe.add_stages(stage)
+
+        workflow.add(pipe)
+
+    return workflow
+
+
+def nested_scan(workflow, uid, parent_stage, parent_pipeline):
+
+    for pipe in workflow:
+        if pipe.uid == parent_pipeline:
+            for stage in pipe.stages:
+                if stage.uid == parent_stage:
+                    for task in stage.tasks:
+                        if task.uid == uid:
+                            return task
+
+
+def index_lookup(index, uid):
+
+    return index[uid][0]
+
+
+def create_wfprocessor(workflow):
+
+    wfp = WFprocessor(workflow, ['pendingq'], ['completedq'], 'localhost', transport='local')
+    wfp._ready_queues = [Queue()]
+    wfp._index_workflow()
+    wfp._setup_ready_queue()
+
+    return wfp
+
+
+if __name__ == '__main__':
+
+    pipes = 10
+    stages = 10
+    task_list = [1, 10, 100, 1000]
+    messages = 1000
+
+    f = open('task_index_variation.csv','w')
+    f.write('Pipelines, Stages, Tasks, Scan(secs/msg), Index(secs/msg), Update(secs/msg)\n')
+
+    for tasks in task_list:
+
+        workflow = create_workflow(pipes, stages, tasks)
+
+        index = dict()
+        for pipe in workflow:
+            pipe._assign_index(index)
+
+        # Completed task messages carry uid, parent stage and parent pipeline
+        msgs = [(task.uid, task._parent_stage, task._parent_pipeline) 
+                    for task, stage, pipe in random.sample(index.values(), min(messages, len(index)))]
+
+        start = time.time()
+        for uid, parent_stage, parent_pipeline in msgs:
+            nested_scan(workflow, uid, parent_stage, parent_pipeline)
+        scan = (time.time() - start)/len(msgs)
+
+        start = time.time()
+        for uid, parent_stage, parent_pipeline in msgs:
+            index_lookup(index, uid)
+        lookup = (time.time() - start)/len(msgs)
+
+        # Update messages as received on the completed queue, one per message
+        wfp = create_wfprocessor(workflow)
+        updated = [wfp._task_index[uid][0] for uid, parent_stage, parent_pipeline in msgs]
+        bodies = list()
+        for state in [states.EXECUTING, states.DONE]:
+            for task in updated:
+                update = state_update(task)
+                update['state'] = state
+                bodies.append(pack([update]))
+
+        start = time.time()
+        for body in bodies:
+            wfp._apply_updates(body, None)
+        update = (time.time() - start)/len(bodies)
+
+        print 'Pipes: %s, Stages: %s, Tasks: %s'%(pipes, stages, tasks)
+        print 'Nested scan: %s secs/msg'%(scan)
+        print 'Index lookup: %s secs/msg'%(lookup)
+        print 'Update message: %s secs/msg'%(update)
+
+        f.write('%s, %s, %s, %s, %s, %s\n'%(pipes, stages, tasks, scan, lookup, update))
+
+    f.close()
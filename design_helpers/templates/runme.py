@@ -0,0 +1,112 @@
+'''
+Memory and bytes on the wire per task of a replica exchange like ensemble of PLCpep7
+tasks (see codec/runme.py), whose tasks differ only in their seed, lambda state and
+input and output names, with every task holding all its attributes and with the tasks
+created from a TaskTemplate holding the shared ones.
+
+Memory is measured as the growth of the resident set size of a fresh process that
+creates the tasks, bytes as the size of the task messages for different batch sizes.
+'''
+
+from radical.entk import Task, TaskTemplate
+from radical.entk.appman.batch import task_descs
+from radical.entk.appman.codec import get_codec
+import multiprocessing as mp
+import resource
+import gc
+
+
+PRE_EXEC = ['module load gromacs/5.1.4', 'export OMP_NUM_THREADS=1']
+ARGUMENTS = [   "--template=PLCpep7_template.mdp",
+                "--newname=PLCpep7_run.mdp",
+                "--wldelta=100",
+                "--equilibrated=False"]
+
+
+def outputs(replica):
+
+    return ['PLCpep7.%s > PLCpep7_run%s_gen0.%s'%(ext, replica, ext)
+                for ext in ['xtc', 'log', 'gro']]
+
+
+def create_task(replica, template):
+
+    if template is None:
+        t = Task()
+        t.pre_exec = list(PRE_EXEC)
+        t.executable = ['gmx_mpi']
+        t.cores = 20
+        arguments = list(ARGUMENTS)
+    else:
+        t = Task(template=template)
+        arguments = template.arguments
+
+    t.arguments = arguments + ["--lambda_state=%s"%(replica%16), "--seed=%s"%replica]
+    t.copy_input_data = ['$STAGE_2_TASK_%s/PLCpep7.tpr'%replica]
+    t.download_output_data = outputs(replica)
+    t._parent_stage = 'radical.entk.stage.0001'
+    t._parent_pipeline = 'radical.entk.pipeline.0001'
+
+    return t
+
+
+def create_template():
+
+    return TaskTemplate(pre_exec=PRE_EXEC, executable=['gmx_mpi'], arguments=ARGUMENTS,
+                        cores=20)
+
+
+def rss():
+
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1])*resource.getpagesize()
+
+
+def measure(num_tasks, use_template, results):
+
+    gc.collect()
+    before = rss()
+
+    template = create_template() if use_template else None
+    tasks = [create_task(i, template) for i in range(num_tasks)]
+
+    gc.collect()
+    results.put(float(rss() - before)/num_tasks)
+
+
+if __name__ == '__main__':
+
+    num_tasks = 100000
+
+    print 'tasks, template, bytes per task in memory'
+
+    for use_template in [False, True]:
+
+        results = mp.Queue()
+        proc = mp.Process(target=measure, args=(num_tasks, use_template, results))
+        proc.start()
+        per_task = results.get()
+        proc.join()
+
+        print '%s, %s, %0.1f'%(num_tasks, use_template, per_task)
+
+    print
+    print 'codec, batch size, template, bytes per task on the wire'
+
+    num_tasks = 4096
+
+    for codec_name in ['json', 'binary']:
+
+        codec = get_codec(codec_name)
+
+        for batch_size in [1, 16, 64]:
+            for use_template in [False, True]:
+
+                template = create_template() if use_template else None
+                tasks = [create_task(i, template) for i in range(num_tasks)]
+                batches = [tasks[i:i+batch_size] for i in range(0, num_tasks, batch_size)]
+
+                size = sum(len(codec.encode(task_descs(batch))) for batch in batches)
+
+                print '%s, %s, %s, %0.1f'%(codec_name, batch_size, use_template,
+                                            float(size)/num_tasks)
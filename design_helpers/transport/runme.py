@@ -0,0 +1,59 @@
+'''
+Compare the time to execute small and medium workflows over the RabbitMQ transport
+and over the brokerless local (multiprocessing queues), zmq (ZeroMQ ipc sockets) and
+shm (shared memory ring buffers) transports. The RabbitMQ runs require a RabbitMQ
+server on localhost, pass the names of the transports to run as arguments to select
+them.
+'''
+
+from radical.entk import Pipeline, Stage, Task, AppManager
+import time
+import sys
+
+
+def create_workflow(num_pipes, num_stages, num_tasks):
+
+    pipes = set()
+
+    for i in range(num_pipes):
+
+        p = Pipeline()
+
+        for j in range(num_stages):
+
+            s = Stage()
+            for k in range(num_tasks):
+                t = Task()
+                t.executable = ['/bin/sleep']
+                t.arguments = ['0']
+                s.add_tasks(t)
+
+            p.add_stages(s)
+
+        pipes.add(p)
+
+    return pipes
+
+
+if __name__ == '__main__':
+
+    # (pipelines, stages, tasks per stage)
+    workflows = [(1, 4, 1), (4, 4, 16), (16, 4, 64)]
+
+    if len(sys.argv) > 1:
+        transports = sys.argv[1:]
+    else:
+        transports = ['rabbitmq', 'local', 'zmq', 'shm']
+
+    for transport in transports:
+
+        for num_pipes, num_stages, num_tasks in workflows:
+
+            appman = AppManager(transport=transport)
+            appman.assign_workflow(create_workflow(num_pipes, num_stages, num_tasks))
+
+            start = time.time()
+            appman.run()
+            print '%s transport: %.2f secs for %s tasks'%(  transport,
+                                                            time.time() - start,
+                                                            num_pipes*num_stages*num_tasks)
@@ -0,0 +1,70 @@
+'''
+Measure the round trip latency of each transport: the main process publishes a state
+update message to a queue consumed by an echo process, which publishes it back on a
+second queue, one message at a time. The rabbitmq transport requires a RabbitMQ server
+on localhost, pass the names of the transports to run as arguments to select them.
+'''
+
+from radical.entk import Task, states
+from radical.entk.appman.transport import get_transport
+from radical.entk.appman.batch import pack, state_update
+from multiprocessing import Process
+import time
+import sys
+
+
+def echo(transport, num_msgs):
+
+    channel = transport.channel()
+    channel.consume('ping', 1)
+
+    for i in range(num_msgs):
+        delivery_tag, body = channel.next_delivery(10)
+        channel.publish('pong', body)
+        channel.ack(delivery_tag)
+
+    channel.close()
+
+
+if __name__ == '__main__':
+
+    num_msgs = 10000
+
+    if len(sys.argv) > 1:
+        transports = sys.argv[1:]
+    else:
+        transports = ['rabbitmq', 'local', 'zmq', 'shm']
+
+    t = Task()
+    t.state = states.DONE
+    body = pack([state_update(t)], codec='binary')
+
+    for name in transports:
+
+        transport = get_transport(name)
+        channel = transport.channel()
+        for queue in ['ping', 'pong']:
+            channel.delete_queue(queue)
+            channel.declare_queue(queue)
+        channel.consume('pong', 1)
+
+        proc = Process(target=echo, args=(transport, num_msgs))
+        proc.start()
+
+        latencies = list()
+        for i in range(num_msgs):
+            start = time.time()
+            channel.publish('ping', body)
+            delivery_tag, reply = channel.next_delivery(10)
+            latencies.append(time.time() - start)
+            channel.ack(delivery_tag)
+
+        proc.join()
+        channel.close()
+        transport.close()
+
+        latencies.sort()
+        print '%s transport: round trip median %.1f us, 99th percentile %.1f us'%(
+                                        name,
+                                        latencies[len(latencies)/2]*1e6,
+                                        latencies[int(len(latencies)*0.99)]*1e6)
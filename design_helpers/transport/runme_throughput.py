@@ -0,0 +1,74 @@
+'''
+Measure the rate of task state transitions carried by each transport: a producer
+process publishes state updates of num_tasks tasks, in batches of batch_size updates
+per message, to a queue consumed by the main process, which applies them to a task
+index. The rabbitmq transport requires a RabbitMQ server on localhost, pass the names
+of the transports to run as arguments to select them.
+'''
+
+from radical.entk import Task, states
+from radical.entk.appman.transport import get_transport
+from radical.entk.appman.batch import pack, unpack, state_update
+from multiprocessing import Process
+import time
+import sys
+
+
+def produce(transport, queue, tasks, batch_size):
+
+    channel = transport.channel()
+
+    for i in range(0, len(tasks), batch_size):
+        channel.publish(queue, pack([state_update(t) for t in tasks[i:i+batch_size]], 
+                                    codec='binary'))
+
+    channel.close()
+
+
+if __name__ == '__main__':
+
+    num_tasks = 200000
+    batch_size = 64
+
+    if len(sys.argv) > 1:
+        transports = sys.argv[1:]
+    else:
+        transports = ['rabbitmq', 'local', 'zmq', 'shm']
+
+    tasks = [Task() for i in range(num_tasks)]
+    for t in tasks:
+        t.state = states.DONE
+
+    for name in transports:
+
+        index = dict((t.uid, Task()) for t in tasks)
+
+        transport = get_transport(name)
+        channel = transport.channel()
+        channel.delete_queue('throughput')
+        channel.declare_queue('throughput')
+        channel.consume('throughput', 64)
+
+        start = time.time()
+
+        producer = Process(target=produce, args=(transport, 'throughput', tasks, batch_size))
+        producer.start()
+
+        received = 0
+        while received < num_tasks:
+            delivery_tag, body = channel.next_delivery(10)
+            if body is None:
+                break
+            for update in unpack(body):
+                index[update['uid']].state = str(update['state'])
+                received += 1
+            channel.ack(delivery_tag)
+
+        duration = time.time() - start
+        producer.join()
+
+        channel.close()
+        transport.close()
+
+        print '%s transport: %s transitions in %.2f secs, %d transitions/s'%(
+                                                name, received, duration, received/duration)
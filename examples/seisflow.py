@@ -1,13 +1,12 @@
-from radical.entk import Pipeline, Stage, Task, AppManager
+from radical.entk import Pipeline, Stage, Task, TaskTemplate, AppManager
+
+# Attributes shared by all tasks, sent once per task message
+template = TaskTemplate(executable=['placeholder'], arguments=['a','b','c'])
 
 def create_single_task():
 
-    t1 = Task()
+    t1 = Task(template=template)
     t1.name = 'dummy_task'
-    t1.executable = ['placeholder']
-    t1.arguments = ['a','b','c']
-    t1.copy_input_data = []
-    t1.copy_output_data = []
 
     return t1
 
@@ -196,7 +196,9 @@ setup_args = {
 
     'package_data'      :  {'': ['*.sh', '*.json', 'VERSION', 'VERSION.git']},
 
-    'install_requires'  :  ['radical.utils', 'setuptools>=1', 'pika'],
+    # The blocking channel API changed in pika 1.0
+    'install_requires'  :  ['radical.utils', 'setuptools>=1', 'pika>=0.11,<1.0'],
+    'extras_require'    :  {'zmq': ['pyzmq']},
     #'test_suite'        : 'radical.entk.tests',
 
     'zip_safe'          : False,
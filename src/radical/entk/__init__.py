@@ -4,6 +4,8 @@ from radical.entk.version import version, __version__
 from radical.entk.pipeline.pipeline import Pipeline
 from radical.entk.stage.stage import Stage
 from radical.entk.task.task import Task
+from radical.entk.task.template import TaskTemplate
 
 from radical.entk.appman.appmanager import AppManager
-import states
\ No newline at end of file
+import states
+import uids
\ No newline at end of file
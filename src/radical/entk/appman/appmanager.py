@@ -8,10 +8,14 @@ from radical.entk.pipeline.pipeline import Pipeline
 from radical.entk.task.task import Task
 from wfprocessor import WFprocessor
 from helper import Helper
-import sys, time, os
-import Queue
-import pika
-import json
+from consumer import Consumer, get_consumer_mode, PUSH
+from batch import unpack
+from codec import get_codec, JSON
+from supervisor import Supervisor, MAX_RESTARTS
+from engine import THREADS, LOOP, ENGINES
+from functools import partial
+import sys, os
+from transport import get_transport, RABBITMQ
 from threading import Thread, Event
 import traceback
 from radical.entk import states
@@ -27,44 +31,160 @@ class AppManager(object):
     according to their relative order to an underlying runtime system for execution.
 
     :hostname: host rabbitmq server is running
-    :push_threads: number of threads to push tasks on the pending_qs
-    :pull_threads: number of threads to pull tasks from the completed_qs
-    :sync_threads: number of threads to pull task from the synchronizer_q
+    :transport: 'rabbitmq' to exchange messages over a RabbitMQ server, 'local' to 
+                exchange them over multiprocessing queues, 'zmq' over ZeroMQ ipc sockets,
+                'shm' over ring buffers in shared memory, without a broker, or a transport
+                object
+    :push_threads: number of threads to push tasks on the pending_qs, each owning a shard of
+                   the pipelines
+    :pull_threads: number of threads to pull tasks from the completed_qs, each owning a shard 
+                   of the completed_qs
+    :sync_threads: number of threads to pull tasks from the synchronizer queues, one queue per
+                   thread
     :pending_qs: number of queues to hold pending tasks to be pulled by the helper/execution manager
     :completed_qs: number of queues to hold completed tasks pushed by the helper/execution manager
+    :processes: number of WFprocessor processes, each with a helper process of its own. The
+                pipelines are split over the processes, each process owns push_threads
+                enqueue and pull_threads dequeue threads and pending_qs pending and 
+                completed_qs completed queues, so that shards do not share an interpreter.
+    :consumer_mode: 'push' to have the broker deliver messages with a prefetch window, 'poll' to 
+                    fetch one message per round trip. Either a string for all components or a 
+                    dictionary with keys 'wfprocessor', 'synchronizer', 'helper'
+    :prefetch_count: maximum number of unacknowledged messages delivered to a consumer in push mode
+    :batch_size: number of tasks published per message to the pending_qs, None to adapt it to
+                 the width of the stage being submitted
+    :batch_linger: seconds a partially filled batch may wait for tasks of other stages
+    :codec: 'json' or 'binary', codec task messages of this session are encoded with. 
+            Messages of either codec are decoded by all components.
+    :compress_threshold: size in bytes from which task messages to the pending_qs are
+                         compressed with zlib, None to not compress them. The bytes 
+                         published are logged by the WFprocessor.
+    :confirm_window: maximum number of task messages published to the pending_qs and not
+                     confirmed by the broker yet, None to publish without confirmations.
+                     Tasks of messages the broker rejects are submitted again.
+    :max_restarts: maximum number of restarts of each process and thread after it died
+    :engine: 'threads' to run enqueue, dequeue and synchronization in threads per shard,
+             'loop' to run them in one event loop per process: the WFprocessor handles
+             all shards in one thread and run() consumes the synchronizer queues itself.
+             The thread counts are ignored by the event loop.
+    :max_in_flight: maximum number of tasks submitted and not completed yet, None for no
+                    limit. Further tasks are submitted as tasks complete. The limit is 
+                    split over the WFprocessor processes. With the 'shm' transport, each
+                    process is limited to the tasks that fit its queues if None.
+    :pipeline_in_flight: maximum number of tasks submitted and not completed yet per 
+                         pipeline, None for no limit
     """
 
 
     def __init__(self, hostname = 'localhost', push_threads=1, pull_threads=1, 
-                sync_threads=1, pending_qs=1, completed_qs=1):
-
-        self._uid       = ru.generate_id('radical.entk.appmanager')
+                sync_threads=1, pending_qs=1, completed_qs=1, processes=1, consumer_mode=PUSH,
+                prefetch_count=64, batch_size=None, batch_linger=0, codec=JSON,
+                max_restarts=MAX_RESTARTS, transport=RABBITMQ, engine=THREADS,
+                max_in_flight=None, pipeline_in_flight=None, compress_threshold=None,
+                confirm_window=None):
+
+        # Unique across processes and hosts, the queues of the session are namespaced 
+        # by it so that application managers can share a RabbitMQ server
+        self._uid       = ru.generate_id('radical.entk.appmanager', mode=ru.ID_PRIVATE)
         self._name      = str()
 
         self._workflow  = None
         self._resubmit_failed = False
 
+        # Workflow-wide task index: task uid -> (task, stage, pipeline)
+        self._task_index = dict()
+
         # RabbitMQ Queues
         self._num_pending_qs = pending_qs
         self._num_completed_qs = completed_qs
         self._pending_queue = list()
         self._completed_queue = list()
+        self._sync_queue = list()
         # RabbitMQ inits
-        self._mq_connection = None
         self._mq_channel = None
         self._mq_hostname = hostname
+        self._transport = get_transport(transport, hostname)
+        # Transports created by the application manager are closed after the run
+        self._close_transport = self._transport is not transport
+
+        # Consumer mode per component
+        self._consumer_mode = dict()
+        for component in ['wfprocessor', 'synchronizer', 'helper']:
+            self._consumer_mode[component] = get_consumer_mode(consumer_mode, component)
+
+        if not isinstance(prefetch_count, int):
+            raise TypeError(expected_type=int, actual_type=type(prefetch_count))
+        self._prefetch_count = prefetch_count
+
+        # Batching of published tasks
+        if batch_size is not None and not isinstance(batch_size, int):
+            raise TypeError(expected_type=int, actual_type=type(batch_size))
+        if not isinstance(batch_linger, (int, float)):
+            raise TypeError(expected_type=float, actual_type=type(batch_linger))
+        self._batch_size = batch_size
+        self._batch_linger = batch_linger
+
+        # Encoding of task messages
+        self._codec = get_codec(codec).name
+
+        if compress_threshold is not None:
+            if not isinstance(compress_threshold, int):
+                raise TypeError(expected_type=int, actual_type=type(compress_threshold))
+            if compress_threshold < 0:
+                raise ValueError(expected_value='non-negative integer', 
+                                actual_value=compress_threshold)
+        self._compress_threshold = compress_threshold
+
+        if confirm_window is not None:
+            if not isinstance(confirm_window, int):
+                raise TypeError(expected_type=int, actual_type=type(confirm_window))
+            if confirm_window < 1:
+                raise ValueError(expected_value='positive integer', actual_value=confirm_window)
+        self._confirm_window = confirm_window
 
 
         # Threads and procs counts
+        for count in [push_threads, pull_threads, sync_threads, pending_qs, completed_qs, 
+                        processes]:
+            if not isinstance(count, int):
+                raise TypeError(expected_type=int, actual_type=type(count))
+            if count < 1:
+                raise ValueError(expected_value='positive integer', actual_value=count)
+
         self._num_push_threads = push_threads
         self._num_pull_threads = pull_threads
         self._num_sync_threads = sync_threads
+        self._num_processes = processes
         self._end_sync = Event()
 
-        # Threads and procs
-        self._wfp = None
-        self._sync_thread = None
-        self._helper = None
+        # Threads and procs, a WFprocessor and a helper per shard of the pipelines
+        self._wfps = [None]*processes
+        self._sync_threads = list()
+        self._helpers = [None]*processes
+
+        if engine not in ENGINES:
+            raise ValueError(expected_value=ENGINES, actual_value=engine)
+        self._engine = engine
+
+        # Flow control of submitted tasks
+        for limit in [max_in_flight, pipeline_in_flight]:
+            if limit is not None:
+                if not isinstance(limit, int):
+                    raise TypeError(expected_type=int, actual_type=type(limit))
+                if limit < 1:
+                    raise ValueError(expected_value='positive integer', actual_value=limit)
+
+        self._max_in_flight = max_in_flight
+        self._pipeline_in_flight = pipeline_in_flight
+
+        # Supervision of threads and procs
+        if not isinstance(max_restarts, int):
+            raise TypeError(expected_type=int, actual_type=type(max_restarts))
+        self._max_restarts = max_restarts
+        self._supervisor = None
+
+        # Set when a pipeline completes, to wake up run()
+        self._pipe_completed = Event()
 
         
         # Logger
@@ -92,12 +212,44 @@ class AppManager(object):
     def resubmit_failed(self):
 
         """
-        Enable resubmission of failed tasks
+        Enable resubmission of failed tasks: a failed task is replicated with a new
+        uid into its stage, which completes once the replicas completed
 
         :getter: Returns the value of the resubmission flag
         :setter: Assigns a boolean value for the resubmission flag
         """
         return self._resubmit_failed
+
+    @property
+    def restarts(self):
+
+        """
+        Number of times each process and thread of the application manager was restarted
+        after it died
+
+        :getter: Returns a dictionary of process or thread name to number of restarts
+        """
+
+        if self._supervisor is None:
+            return dict()
+
+        return self._supervisor.restarts
+
+    @property
+    def progress(self):
+
+        """
+        Number of tasks of the workflow in each state
+
+        :getter: Returns a dictionary with the task count per state
+        """
+
+        progress = dict()
+        for pipe in self._workflow or []:
+            for state, count in pipe.progress.iteritems():
+                progress[state] = progress.get(state, 0) + count
+
+        return progress
     
     # -----------------------------------------------
     # Setter functions
@@ -109,6 +261,8 @@ class AppManager(object):
 
     @resubmit_failed.setter
     def resubmit_failed(self, value):
+        if not isinstance(value, bool):
+            raise TypeError(expected_type=bool, actual_type=type(value))
         self._resubmit_failed = value
 
 
@@ -150,6 +304,11 @@ class AppManager(object):
         try:
             
             self._workflow = self._validate_workflow(workflow)
+
+            self._task_index = dict()
+            for pipe in self._workflow:
+                pipe._assign_index(self._task_index)
+
             self._logger.info('Workflow assigned to Application Manager')
 
         except TypeError:
@@ -170,46 +329,39 @@ class AppManager(object):
     def _setup_mqs(self):
 
         """
-        Setup RabbitMQ system
+        Setup the queues on the transport
         """
 
         try:
 
             self._logger.debug('Setting up mq connection and channel')
 
-            self._mq_connection = pika.BlockingConnection(
-                                    pika.ConnectionParameters(host=self._mq_hostname)
-                                    )
-            self._mq_channel = self._mq_connection.channel()
+            self._mq_channel = self._transport.channel()
 
             self._logger.debug('Connection and channel setup successful')
 
             self._logger.debug('Setting up all exchanges and queues')
 
-            self._mq_channel.exchange_delete(exchange='fork')
-            self._mq_channel.exchange_declare(exchange='fork', type='fanout')
-
-            for i in range(1,self._num_pending_qs+1):
-                queue_name = 'pendingq-%s'%i
-                self._pending_queue.append(queue_name)
-                self._mq_channel.queue_delete(queue=queue_name)
-                self._mq_channel.queue_declare(queue=queue_name) 
-                                                # Durable Qs will not be lost if rabbitmq server crashes
-
-            for i in range(1,self._num_completed_qs+1):
-                queue_name = 'completedq-%s'%i
-                self._completed_queue.append(queue_name)
-                self._mq_channel.queue_delete(queue=queue_name)
-                self._mq_channel.queue_declare(queue=queue_name)
-                self._mq_channel.queue_bind(exchange='fork', queue=queue_name)
-                                                # Durable Qs will not be lost if rabbitmq server crashes
-
-            self._mq_channel.queue_delete(queue='synchronizerq')
-            self._mq_channel.queue_declare(queue='synchronizerq')
-                                                    # Durable Qs will not be lost if rabbitmq server crashes
-
-
-            self._mq_channel.queue_bind(exchange='fork', queue='synchronizerq')
+            # State updates of completed tasks are published to the completed queue of
+            # their pipeline's shard and applied by the WFprocessor, which publishes the 
+            # resulting state transitions to the synchronizer queue of the shard. Each 
+            # WFprocessor process has pending and completed queues of its own (see
+            # _shard_queues()).
+            self._pending_queue = ['%s.pendingq-%s'%(self._uid, i) 
+                                    for i in range(1, self._num_pending_qs*self._num_processes+1)]
+            self._completed_queue = ['%s.completedq-%s'%(self._uid, i) 
+                                    for i in range(1, self._num_completed_qs*self._num_processes+1)]
+            self._sync_queue = ['%s.synchronizerq-%s'%(self._uid, i) 
+                                    for i in range(1, self._num_sync_threads+1)]
+
+            # The names are new to the transport, no queues of earlier sessions have to 
+            # be deleted. Tasks of pipelines of higher priority overtake the others on
+            # the pending queues.
+            self._mq_channel.declare_queues(self._pending_queue, priorities=True)
+            self._mq_channel.declare_queues(self._completed_queue + self._sync_queue)
+
+            # Return the connection, to be used by a synchronizer thread
+            self._mq_channel.close()
 
             self._logger.debug('All exchanges and queues are setup')
 
@@ -227,153 +379,290 @@ class AppManager(object):
             raise UnknownError(text=ex)
 
 
-    def _synchronizer(self):
+    def _cleanup_mqs(self):
 
         """
-        Thread to keep the workflow data structure in appmanager up to date
+        Delete the queues of the session from the transport
         """
 
         try:
 
-            self._logger.info('Synchronizer thread started')
+            mq_channel = self._transport.channel()
+            mq_channel.delete_queues(self._pending_queue + self._completed_queue + 
+                                    self._sync_queue)
+            mq_channel.close()
+
+            self._logger.debug('All queues are deleted')
 
+        except Exception, ex:
 
-            mq_connection = pika.BlockingConnection(
-                                    pika.ConnectionParameters(host=self._mq_hostname)
-                                    )
-            mq_channel = mq_connection.channel()
+            # Queues left behind are deleted by the server once they expire
+            self._logger.error('Error deleting queues: %s'%ex)
 
-            while not self._end_sync.is_set():
 
-                method_frame, header_frame, body = mq_channel.basic_get(
-                                                            queue='synchronizerq'
-                                                            )                
+    def _apply_notification(self, notification):
 
-                if body:
+        """
+        Apply the state transitions the WFprocessor notified for a task (see 
+        batch.state_notification()) to the task, its stage and its pipeline, or the
+        state of a task whose batch was published or rolled back (see 
+        batch.submit_notification()) to the task
+        """
+
+        uid = notification['uid']
+
+        self._logger.debug('Got state notification of task %s from synchronizer queue'%(uid))
+
+        if uid not in self._task_index:
+            self._logger.error('Task %s not found in workflow'%uid)
+
+        else:
+
+            task, stage, pipe = self._task_index[uid]
+
+            # Submissions are notified by the enqueue threads, and may arrive after the 
+            # completion of the task was notified by the dequeue threads
+            code = states.CODES[notification['state']]
+            if not states.TASK_TRANSITIONS[task._state_code][code]:
+                self._logger.debug('Ignoring transition of task %s from %s to %s'%(
+                                            uid, task.state, notification['state']))
+                return
+
+            task.state = str(notification['state'])
+
+            if 'stage_state' not in notification:
+                return
+
+            if 'exit_code' in notification:
+                task._exit_code = notification['exit_code']
+
+            if 'replica' in notification:
+                new_task = Task()
+                new_task._replicate(task)
+                new_task._uid = str(notification['replica'])
+                stage.add_tasks(new_task)
+
+            stage.state = str(notification['stage_state'])
 
-                    completed_task = Task()
-                    completed_task.load_from_dict(json.loads(body))
+            pipe.state = str(notification['pipeline_state'])
+            pipe._cur_stage = notification['current_stage']
+            if notification['completed']:
+                pipe._completed_flag.set()
+                self._pipe_completed.set()
 
-                    self._logger.debug('Got finished task %s from synchronizer queue'%(completed_task.uid))
+            self._logger.debug('Task: %s,%s ; Stage: %s,%s; Pipeline: %s,%s'%(
+                                            uid, task.state,
+                                            stage.uid, stage.state,
+                                            pipe.uid, pipe.state)
+                                        )
 
-                    for pipe in self._workflow:
 
-                        if not pipe._completed:
+    def _shard_pipes(self, shard):
+
+        """
+        Pipelines owned by the WFprocessor process of a shard, assigned in turn in the
+        order of their uids so that the processes get as many pipelines each
+        """
+
+        pipes = sorted(self._workflow, key=lambda pipe: pipe.uid)
+
+        return set(pipes[shard::self._num_processes])
+
+
+    def _shard_queues(self, queues, shard):
+
+        """
+        Queues of the WFprocessor and helper processes of a shard
+        """
+
+        count = len(queues)/self._num_processes
+
+        return queues[shard*count:(shard+1)*count]
 
-                            if completed_task._parent_pipeline == pipe.uid:
 
-                                self._logger.debug('Found parent pipeline: %s'%pipe.uid)
-                            
-                                for stage in pipe.stages:
+    def _shard_limit(self, limit, shard):
 
-                                    if completed_task._parent_stage == stage.uid:
-                                        self._logger.debug('Found parent stage: %s'%(stage.uid))
+        """
+        Part of a limit of the tasks in flight given to the WFprocessor process of a
+        shard, at least one task
+        """
 
-                                        #task.state = states.DONE
-                                        self._logger.debug('Task: %s,%s ; Stage: %s; Pipeline: %s'%(
-                                                                        completed_task.uid,
-                                                                        completed_task.state,
-                                                                        pipe.stages[pipe._current_stage].uid,
-                                                                        pipe.uid)
-                                                                    )
+        if limit is None:
+            return None
 
-                                        for task in stage.tasks:
+        return max(limit/self._num_processes + (shard < limit%self._num_processes), 1)
 
-                                            if task.uid == completed_task.uid:
 
-                                                task.state = str(completed_task.state)
+    def _create_wfp(self, shard=0):
 
-                                                if task.state == states.DONE:
+        # The queues of some transports hold a bounded number of messages, each process
+        # has queues of its own
+        max_in_flight = self._shard_limit(self._max_in_flight, shard)
+        if max_in_flight is None:
+            max_in_flight = self._transport.max_in_flight
 
-                                                    if stage._check_tasks_status():
+        return WFprocessor( workflow = self._shard_pipes(shard), 
+                            pending_queue = self._shard_queues(self._pending_queue, shard), 
+                            completed_queue=self._shard_queues(self._completed_queue, shard),
+                            mq_hostname=self._mq_hostname,
+                            sync_queue=self._sync_queue,
+                            push_threads=self._num_push_threads,
+                            pull_threads=self._num_pull_threads,
+                            consumer_mode=self._consumer_mode['wfprocessor'],
+                            prefetch_count=self._prefetch_count,
+                            batch_size=self._batch_size,
+                            batch_linger=self._batch_linger,
+                            codec=self._codec,
+                            max_restarts=self._max_restarts,
+                            transport=self._transport,
+                            engine=self._engine,
+                            max_in_flight=max_in_flight,
+                            pipeline_in_flight=self._pipeline_in_flight,
+                            compress_threshold=self._compress_threshold,
+                            confirm_window=self._confirm_window,
+                            resubmit_failed=self._resubmit_failed)
 
-                                                        try:
 
-                                                            stage.state = states.DONE
+    def _create_helper(self, shard=0):
 
-                                                            self._logger.info('Stage %s of Pipeline %s: %s'%(
-                                                                                stage.uid,
-                                                                                pipe.uid,
-                                                                                stage.state))
+        return Helper(  pending_queue = self._shard_queues(self._pending_queue, shard), 
+                        completed_queue=self._shard_queues(self._completed_queue, shard),
+                        mq_hostname=self._mq_hostname,
+                        consumer_mode=self._consumer_mode['helper'],
+                        prefetch_count=self._prefetch_count,
+                        codec=self._codec,
+                        transport=self._transport)
 
-                                                            pipe._increment_stage()
 
-                                                        except Exception, ex:
-                                                            # Rolling back stage status
-                                                            self._logger.error('Error while updating stage '+
-                                                                    'state, rolling back. Error: %s'%ex)
-                                                            stage.state = states.SCHEDULED
-                                                            pipe._decrement_stage()                                                    
+    def _start_wfp(self, shard):
 
-                                                    if pipe._completed:
-                                                        #self._workflow.remove(pipe)
-                                                        pipe.state = states.DONE
+        self._wfps[shard] = self._create_wfp(shard)
+        self._wfps[shard].start_processor()
 
-                                                        self._logger.info('Pipeline %s: %s'%(
-                                                                                            pipe.uid, 
-                                                                                            pipe.state)
-                                                                                        )
 
-                                                elif task.state == states.FAILED:
+    def _start_helper(self, shard):
 
-                                                    if self._resubmit_failed:
+        self._helpers[shard] = self._create_helper(shard)
+        self._helpers[shard].start_helper()
 
-                                                        try:
-                                                            new_task = Task()
-                                                            new_task._replicate(completed_task)
 
-                                                            pipe.stages[pipe._current_stage].add_tasks(new_task)
+    def _start_sync_thread(self, shard):
 
-                                                        except Exception, ex:
-                                                            self._logger.error("Resubmission of task %s failed, error: %s"%
-                                                                                                (completed_task.uid,ex))
+        self._sync_threads[shard] = Thread( target=self._synchronizer, args=(shard,),
+                                            name='synchronizer-thread-%s'%shard)
+        self._sync_threads[shard].start()
 
-                                                    else:
 
-                                                        if stage._check_tasks_status():
+    def _process_alive(self, processes, shard):
 
-                                                            try:
-                                                                stage.state = states.DONE
+        return processes[shard].check_alive()
 
-                                                                self._logger.info('Stage %s of Pipeline %s: %s'%(
-                                                                                stage.uid,
-                                                                                pipe.uid,
-                                                                                stage.state))
 
+    def _end_processes(self):
 
-                                                                pipe._increment_stage()
+        # WFprocessors first, then helpers
+        for wfp in self._wfps:
+            if wfp:
+                wfp.end_processor()
 
-                                                            except Exception, ex:
-                                                                # Rolling back stage status
-                                                                self._logger.error('Error while updating stage '+
-                                                                        'state, rolling back. Error: %s'%ex)
-                                                                stage.state = states.SCHEDULED
-                                                                pipe._decrement_stage()                                                    
+        self._logger.info('WFprocessors closed')
 
-                                                            if pipe._completed:
-                                                                #self._workflow.remove(pipe)
-                                                                pipe.state = states.DONE
+        for helper in self._helpers:
+            if helper:
+                helper.end_helper()
 
-                                                                self._logger.info('Pipeline %s: %s'%(
-                                                                                            pipe.uid, 
-                                                                                            pipe.state)
-                                                                                        )
+        self._logger.info('Helpers closed')
 
-                                                else:
 
-                                                    # Task is canceled
-                                                    pass
+    def _sync_thread_alive(self, shard):
 
-                                                # Found the task and processed it -- no more iterations needed
-                                                break
+        return self._sync_threads[shard] is not None and self._sync_threads[shard].is_alive()
 
-                                        # Found the stage and processed it -- no more iterations neeeded
-                                        break
 
-                                # Found the pipeline and processed it -- no more iterations neeeded
-                                break
+    def _create_supervisor(self):
 
-                    mq_channel.basic_ack(delivery_tag=method_frame.delivery_tag)
+        """
+        Supervisor of the synchronizer threads, the WFprocessor and the helper
+        """
+
+        supervisor = Supervisor('AppManager', self._logger, self._max_restarts)
+
+        # Workers are started in order: the processes are forked before the
+        # synchronizers open their channels
+        for i in range(self._num_processes):
+            supervisor.add( 'wfprocessor-%s'%i, partial(self._start_wfp, i),
+                            partial(self._process_alive, self._wfps, i))
+            supervisor.add( 'helper-%s'%i, partial(self._start_helper, i),
+                            partial(self._process_alive, self._helpers, i))
+
+        # The synchronizer queues are consumed by run() in the event loop engine
+        if self._engine == LOOP:
+            self._sync_threads = list()
+        else:
+            self._sync_threads = [None]*len(self._sync_queue)
+
+        for i in range(len(self._sync_threads)):
+            supervisor.add( 'synchronizer-thread-%s'%i,
+                            partial(self._start_sync_thread, i),
+                            partial(self._sync_thread_alive, i))
+
+        return supervisor
+
+
+    def _count_pending_pipes(self):
+
+        pending = 0
+
+        for pipe in self._workflow:
+            with pipe._stage_lock:
+                if not pipe._completed:
+                    pending += 1
+
+        return pending
+
+
+    def _end_sync_threads(self):
+
+        self._end_sync.set()
+
+        for thread in self._sync_threads:
+            if thread:
+                thread.join()
+
+
+    def _synchronizer(self, shard=0):
+
+        """
+        Thread to keep the workflow data structure in appmanager up to date with the state
+        transitions notified by the WFprocessor, for the pipelines of the shard
+        """
+
+        mq_channel = None
+        consumer = None
+
+        try:
+
+            self._logger.info('Synchronizer thread %s started'%shard)
+
+
+            mq_channel = self._transport.channel()
+
+            consumer = Consumer(mq_channel, self._sync_queue[shard], 
+                                self._consumer_mode['synchronizer'], self._prefetch_count)
+
+            while not self._end_sync.is_set():
+
+                delivery_tag, body = consumer.get()
+
+                if body:
+
+                    for notification in unpack(body):
+                        self._apply_notification(notification)
+
+                    consumer.ack(delivery_tag)
+
+            consumer.close()
+            mq_channel.close()
 
         except KeyboardInterrupt:
 
@@ -386,9 +675,64 @@ class AppManager(object):
 
             self._logger.error('Unknown error in synchronizer: %s. \n Closing thread'%ex)
             print traceback.format_exc()
+
+            # Notifications not acknowledged are requeued for the restarted thread
+            if consumer:
+                consumer.abort()
+            if mq_channel:
+                mq_channel.close()
+
             raise UnknownError(text=ex)
 
 
+    def _event_loop(self):
+
+        """
+        Apply the state transitions of all synchronizer queues and supervise the 
+        WFprocessor and the helper in the calling thread (engine 'loop'), till all
+        pipelines completed. Blocks only on the synchronizer queues, till a message
+        arrives or till the next check of the processes is due.
+        """
+
+        # Start the WFprocessor and the helper before opening the channel
+        timeout = self._supervisor.check()
+
+        mq_channel = self._transport.channel()
+
+        consumer = Consumer(mq_channel, self._sync_queue, self._consumer_mode['synchronizer'],
+                            self._prefetch_count)
+
+        pending_pipes = None
+
+        while True:
+
+            # Pipelines are only counted again when one of them completed
+            if pending_pipes is None or self._pipe_completed.is_set():
+
+                self._pipe_completed.clear()
+
+                count = self._count_pending_pipes()
+                if count != pending_pipes:
+                    pending_pipes = count
+                    self._logger.info('Pending pipes: %s'%pending_pipes)
+
+            if not pending_pipes:
+                break
+
+            delivery_tag, body = consumer.get(timeout)
+            timeout = self._supervisor.check()
+
+            if body:
+
+                for notification in unpack(body):
+                    self._apply_notification(notification)
+
+                consumer.ack(delivery_tag)
+
+        consumer.close()
+        mq_channel.close()
+
+
     def run(self):
 
         """
@@ -405,91 +749,58 @@ class AppManager(object):
             else:
 
                 # Setup rabbitmq stuff
-                self._logger.info('Setting up RabbitMQ system')
+                self._logger.info('Setting up %s transport'%self._transport.name)
                 setup = self._setup_mqs()
 
                 if not setup:
                     raise
 
 
-                # Start synchronizer thread
-                self._logger.info('Starting synchronizer thread')
-                self._sync_thread = Thread(target=self._synchronizer, name='synchronizer-thread')
-                self._sync_thread.start()
-
-                # Create WFProcessor object
-                self._wfp = WFprocessor(  workflow = self._workflow, 
-                                    pending_queue = self._pending_queue, 
-                                    completed_queue=self._completed_queue,
-                                    mq_hostname=self._mq_hostname)
-                #wfp.resubmit_failed = self._resubmit_failed
-                self._logger.info('Starting WFProcessor process from AppManager')
-                self._wfp.start_processor()                
+                # Start synchronizer threads, WFprocessor and helper, restart them 
+                # when they die
+                self._supervisor = self._create_supervisor()
 
-                
-                self._helper = Helper(    pending_queue = self._pending_queue, 
-                                    completed_queue=self._completed_queue,
-                                    mq_hostname=self._mq_hostname)
-                self._logger.info('Starting helper process from AppManager')
-                self._helper.start_helper()
+                if self._engine == LOOP:
+                    self._event_loop()
 
-                
-                active_pipe_count = len(self._workflow)                
+                else:
 
-                while (active_pipe_count > 0)or(self._wfp.workflow_incomplete()):
+                    pending_pipes = None
 
-                    if slow_run:
-                        time.sleep(1)
+                    while True:
 
-                    if active_pipe_count > 0:
+                        self._pipe_completed.clear()
 
-                        for pipe in self._workflow:
+                        count = self._count_pending_pipes()
+                        if count != pending_pipes:
+                            pending_pipes = count
+                            self._logger.info('Pending pipes: %s'%pending_pipes)
 
-                            with pipe._stage_lock:
+                        if not pending_pipes:
+                            break
 
-                                if pipe._completed:
-                                    self._logger.info('Pipe %s completed'%pipe.uid)
-                                    active_pipe_count -= 1
-                                    self._logger.info('Pending pipes: %s'%active_pipe_count)
+                        # Block till a pipeline completes or till the next check of the 
+                        # processes and threads is due
+                        timeout = self._supervisor.check()
+                        self._pipe_completed.wait(timeout)
 
+                self._logger.info('Restarts: %s'%self._supervisor.restarts)
 
-                    
-                    if not self._wfp.check_alive():
 
-                        self._wfp = WFProcessor(  workflow = self._workflow, 
-                                            pending_queue = self._pending_queue, 
-                                            completed_queue=self._completed_queue,
-                                            mq_hostname=self._mq_hostname)
-
-                        self._logger.info('Restarting WFProcessor process from AppManager')
-                        self._wfp.start_processor()
+                # Terminate threads in following order: wfp, helper, synchronizer
+                self._logger.info('Closing WFprocessors and helpers')
+                self._end_processes()
 
-                    if not self._helper.check_alive():
-                        self._helper = Helper(    pending_queue = self._pending_queue, 
-                                            executed_queue=self._executed_queue,
-                                            mq_hostname=self._mq_hostname)
-                        self._logger.info('Restarting helper process from AppManager')
-                        self._helper.start_helper()
+                self._logger.info('Closing synchronizer threads')
+                self._end_sync_threads()
+                self._logger.info('Synchronizer threads closed')
 
-                    if not self._sync_thread.is_alive():
-                        self._sync_thread = Thread(   target=self._synchronizer, 
-                                                name='synchronizer-thread')
-                        self._logger.info('Restarting synchronizer thread')
-                        self._sync_thread.start()
-                    
+                self._cleanup_mqs()
 
-                # Terminate threads in following order: wfp, helper, synchronizer
-                self._logger.info('Closing WFprocessor')
-                self._wfp.end_processor()                
-                
-                self._logger.info('Closing helper thread')
-                self._helper.end_helper()
-                
+                self._logger.info('Transport connections: %s'%self._transport.stats)
 
-                self._logger.info('Closing synchronizer thread')
-                self._end_sync.set()
-                self._sync_thread.join()
-                self._logger.info('Synchronizer thread closed')
+                if self._close_transport:
+                    self._transport.close()
 
 
         except KeyboardInterrupt:
@@ -498,21 +809,15 @@ class AppManager(object):
                                 'trying to cancel enqueuer thread gracefully...')
 
             # Terminate threads in following order: wfp, helper, synchronizer
-            if self._wfp:
-                self._logger.info('Closing WFprocessor')
-                self._wfp.end_processor()
-                self._logger.info('WFprocessor closed')
-
-            if self._helper:
-                self._logger.info('Closing helper thread')
-                self._helper.end_helper()
-                self._logger.info('Helper thread closed')
-
-            if self._sync_thread:
-                self._logger.info('Closing synchronizer thread')
-                self._end_sync.set()
-                self._sync_thread.join()
-                self._logger.info('Synchronizer thread closed')
+            self._logger.info('Closing WFprocessors and helpers')
+            self._end_processes()
+
+            if self._sync_threads:
+                self._logger.info('Closing synchronizer threads')
+                self._end_sync_threads()
+                self._logger.info('Synchronizer threads closed')
+
+            self._cleanup_mqs()
 
         except Exception, ex:
 
@@ -520,20 +825,14 @@ class AppManager(object):
             print traceback.format_exc()
 
             ## Terminate threads in following order: wfp, helper, synchronizer
-            if self._wfp:
-                self._logger.info('Closing WFprocessor')
-                self._wfp.end_processor()
-                self._logger.info('WFprocessor closed')
-
-            if self._helper:
-                self._logger.info('Closing helper thread')
-                self._helper.end_helper()
-                self._logger.info('Helper thread closed')
-
-            if self._sync_thread:
-                self._logger.info('Closing synchronizer thread')
-                self._end_sync.set()
-                self._sync_thread.join()
-                self._logger.info('Synchronizer thread closed')
+            self._logger.info('Closing WFprocessors and helpers')
+            self._end_processes()
+
+            if self._sync_threads:
+                self._logger.info('Closing synchronizer threads')
+                self._end_sync_threads()
+                self._logger.info('Synchronizer threads closed')
+
+            self._cleanup_mqs()
             
             sys.exit(1)
@@ -0,0 +1,478 @@
+__copyright__   = "Copyright 2017-2018, http://radical.rutgers.edu"
+__author__      = "Vivek Balasubramanian <vivek.balasubramaniana@rutgers.edu>"
+__license__     = "MIT"
+
+from radical.entk.exceptions import *
+from radical.entk import states
+from codec import get_codec, compress, decode, JSON
+from collections import OrderedDict
+from functools import partial
+import math
+import time
+
+# Upper bound of the adaptive batch size
+MAX_BATCH_SIZE = 1024
+
+# Seconds to wait for space in a full queue before a batch is held back, so that the
+# publishing thread does not block while it holds a pipeline's lock
+PUBLISH_TIMEOUT = 0.01
+
+
+def pack(task_descs, codec=JSON):
+
+    """
+    Pack a list of task descriptions (dictionaries) into one message body
+
+    :arguments: list of dictionaries, codec name or object
+    :return: message body
+    """
+
+    return get_codec(codec).encode(task_descs)
+
+
+def unpack(body):
+
+    """
+    Unpack a message body into the list of task descriptions it carries, whichever
+    codec it was packed with
+
+    :arguments: message body
+    :return: list of dictionaries
+    """
+
+    return decode(body)
+
+
+def task_descs(tasks):
+
+    """
+    Task descriptions of a batch of tasks. Tasks created from a template are described
+    by the attributes they do not inherit, after the description of their template (see
+    TaskTemplate.to_dict()), which is included once per batch. A task that is the only
+    one of its template in the batch is fully described.
+
+    :arguments: list of Task objects
+    :return: list of dictionaries
+    """
+
+    descs = list()
+    templates = set()
+
+    # Number of tasks per template
+    counts = dict()
+    for task in tasks:
+        if task._template is not None:
+            counts[task._template] = counts.get(task._template, 0) + 1
+
+    for task in tasks:
+
+        template = task._template
+
+        if template is None or counts[template] == 1:
+            descs.append(task.to_dict())
+            continue
+
+        if template.uid not in templates:
+            templates.add(template.uid)
+            descs.append(template.to_dict())
+
+        descs.append(task._to_delta())
+
+    return descs
+
+
+def state_update(task, exit_code=None):
+
+    """
+    Message reporting a state transition of a task on the completed queues. The task
+    description itself is only sent on the pending queues, the receivers look up the
+    task by uid.
+
+    :arguments: Task object, exit code of its executable if known
+    :return: dictionary
+    """
+
+    update = {  'uid': task.uid,
+                'state': task.state,
+                'timestamp': time.time()}
+
+    if exit_code is not None:
+        update['exit_code'] = exit_code
+
+    return update
+
+
+def state_notification(update, task, stage, pipe, replica=None):
+
+    """
+    Message reporting the state transitions the WFprocessor applied for a state update
+    of a task, to the AppManager's synchronizer threads. The receivers apply the states
+    of the task, its stage and its pipeline as they are, so that the workflow logic
+    runs only in the WFprocessor.
+
+    :arguments: state update (see state_update()), Task, Stage and Pipeline objects, 
+                uid of the task resubmitted in place of the task if any
+    :return: dictionary
+    """
+
+    notification = dict(update)
+
+    notification.update({   'state': task.state,
+                            'stage_state': stage.state,
+                            'pipeline': pipe.uid,
+                            'pipeline_state': pipe.state,
+                            'current_stage': pipe._current_stage,
+                            'completed': pipe._completed})
+
+    if replica is not None:
+        notification['replica'] = replica
+
+    return notification
+
+
+def submit_notification(task, pipe):
+
+    """
+    Message reporting the state of a task whose batch was published, or rolled back,
+    to the AppManager's synchronizer threads. The receivers apply the state of the task
+    only, the states of its stage and its pipeline are reported by the state 
+    notifications (see state_notification()).
+
+    :arguments: Task and Pipeline objects
+    :return: dictionary
+    """
+
+    notification = state_update(task)
+    notification['pipeline'] = pipe.uid
+
+    return notification
+
+
+def adaptive_batch_size(stage_width):
+
+    """
+    Batch size used for a stage with the given number of tasks if no batch size is
+    configured: the square root of the stage width, so that wide stages need few
+    messages while still being spread over enough messages to keep multiple
+    consumers busy.
+
+    :arguments: number of tasks in the stage
+    :return: integer
+    """
+
+    return int(min(MAX_BATCH_SIZE, max(1, math.sqrt(stage_width))))
+
+
+class Batcher(object):
+
+    """
+    A Batcher collects tasks to be published and publishes them in batches of
+    batch_size tasks per message, keeping one batch per routing key and message
+    priority. A batch that is not full is published when the caller flushes it after
+    linger seconds.
+
+    A batch larger than the messages the channel takes (see
+    transport.Channel.max_message_size) is split in halves till the parts fit, a task
+    that does not fit on its own can not be published.
+
+    A batch whose queue is full (see transport.Channel.publish()) is held back and
+    published on the next flush, before the batches of its queue added after it, so
+    that the state updates making space in the queue are applied in the meantime.
+
+    With a confirm window, the broker confirms the published batches. The tasks of a
+    batch the broker rejects are rolled back like the tasks of a batch that could not
+    be published, unless the state of a task progressed in the meantime.
+
+    :mq_channel: transport channel to publish on (see transport.Channel)
+    :exchange: exchange to publish to
+    :batch_size: number of tasks per message, None to adapt it to the stage width
+    :linger: seconds a partial batch may wait for more tasks
+    :rollback: function invoked with the list of tasks of a batch that could not
+               be published, after their state was reverted to NEW
+    :codec: codec name or object the batches are packed with
+    :compress_threshold: size in bytes from which packed batches are compressed (see 
+                         codec.compress()), None to not compress
+    :confirm_window: maximum number of published batches not confirmed by the broker
+                     yet, None to publish without confirmations
+    :published: function invoked with the list of tasks of a batch once it was
+                published
+    :lock: function returning the lock guarding the state of a task, e.g. the stage
+           lock of its pipeline, None if no other thread changes the task states. The
+           caller of add() holds the lock of the task it adds.
+    """
+
+    def __init__(self, mq_channel, exchange, batch_size=None, linger=0, rollback=None,
+                codec=JSON, compress_threshold=None, confirm_window=None, published=None,
+                lock=None):
+
+        if batch_size is not None and not isinstance(batch_size, int):
+            raise TypeError(expected_type=int, actual_type=type(batch_size))
+
+        if not isinstance(linger, (int, float)):
+            raise TypeError(expected_type=float, actual_type=type(linger))
+
+        if compress_threshold is not None and not isinstance(compress_threshold, int):
+            raise TypeError(expected_type=int, actual_type=type(compress_threshold))
+
+        self._mq_channel = mq_channel
+        self._exchange = exchange
+        self._batch_size = batch_size
+        self._linger = linger
+        self._rollback = rollback
+        self._published = published
+        self._lock = lock
+
+        # Task being added, whose lock the caller holds
+        self._adding = None
+        self._codec = get_codec(codec)
+        self._compress_threshold = compress_threshold
+        self._confirm_window = confirm_window
+
+        if confirm_window is not None:
+            self._mq_channel.confirm_delivery(confirm_window)
+
+        # Messages and tasks published, bytes of the packed batches and bytes published
+        # after compression, messages not confirmed by the broker, batches held back by
+        # a full queue
+        self._stats = { 'messages': 0, 'tasks': 0, 'compressed': 0, 
+                        'packed_bytes': 0, 'wire_bytes': 0, 'nacked': 0, 'held': 0,
+                        'split': 0}
+
+        # Batches held back by a full queue, as (routing key, priority, tasks, packed
+        # batch, body) tuples in the order they are to be published
+        self._held = list()
+
+        # Per (routing key, priority): tasks of the current batch and time the first 
+        # one was added
+        self._tasks = dict()
+        self._first_add = dict()
+
+    def add(self, task, routing_key, stage_width=1, priority=0):
+
+        """
+        Add a task to the current batch of the routing key and priority, publish the
+        batch if it is full
+
+        :arguments: Task object, routing key, number of tasks of the task's stage,
+                    priority of the message the task is published with
+        """
+
+        key = (routing_key, priority)
+
+        if key not in self._tasks:
+            self._tasks[key] = list()
+            self._first_add[key] = time.time()
+
+        self._tasks[key].append(task)
+
+        if self._batch_size:
+            batch_size = self._batch_size
+        else:
+            batch_size = adaptive_batch_size(stage_width)
+
+        if len(self._tasks[key]) >= batch_size:
+
+            self._adding = task
+            try:
+                self._publish(key)
+            finally:
+                self._adding = None
+
+    @property
+    def stats(self):
+
+        """
+        Messages and tasks published, messages compressed, bytes of the published
+        batches before and after compression, batches held back by a full queue and
+        batches split as they were too large
+
+        :getter: Returns a dictionary
+        """
+
+        return dict(self._stats)
+
+    @property
+    def held(self):
+
+        """
+        Number of batches held back by a full queue
+
+        :getter: Returns an integer
+        """
+
+        return len(self._held)
+
+    def linger_timeout(self):
+
+        """
+        :return: seconds until the oldest batch has to be published, 0 if a batch is
+                 held back, None if there is no batch
+        """
+
+        if self._held:
+            return 0
+
+        if not self._first_add:
+            return None
+
+        return max(0, min(self._first_add.values()) + self._linger - time.time())
+
+    def flush(self, routing_key=None):
+
+        """
+        Publish the batches held back, then the current batches of the routing key, of
+        all routing keys if None, batches of higher priority first
+        """
+
+        self._publish_held()
+
+        for key in sorted(self._tasks.keys(), key=lambda key: -key[1]):
+            if routing_key is None or key[0] == routing_key:
+                self._publish(key)
+
+        # Roll back the batches rejected so far
+        if self._confirm_window is not None:
+            self._mq_channel.wait_for_confirms(0)
+
+    def close(self):
+
+        """
+        Publish all current batches and wait till the broker confirmed them. The tasks
+        of batches still held back by a full queue are rolled back.
+        """
+
+        self.flush()
+
+        if self._confirm_window is not None:
+            self._mq_channel.wait_for_confirms()
+
+        while self._held:
+            self._roll_back(self._held.pop(0)[2])
+
+    def _publish(self, key):
+
+        routing_key, priority = key
+
+        tasks = self._tasks.pop(key)
+        self._first_add.pop(key)
+
+        self._publish_tasks(routing_key, priority, tasks)
+
+    def _publish_tasks(self, routing_key, priority, tasks):
+
+        try:
+            packed = self._codec.encode(task_descs(tasks))
+            body = compress(packed, self._compress_threshold)
+
+        except Exception:
+            self._roll_back(tasks)
+            raise
+
+        max_size = self._mq_channel.max_message_size
+
+        if max_size is not None and len(body) > max_size and len(tasks) > 1:
+
+            self._stats['split'] += 1
+            half = len(tasks)/2
+
+            try:
+                self._publish_tasks(routing_key, priority, tasks[:half])
+            except Exception:
+                self._roll_back(tasks[half:])
+                raise
+
+            self._publish_tasks(routing_key, priority, tasks[half:])
+            return
+
+        batch = (routing_key, priority, tasks, packed, body)
+
+        # Batches of a queue are published in order, behind those held back
+        held = any(held_batch[0] == routing_key for held_batch in self._held)
+
+        if held or not self._send(batch):
+            self._held.append(batch)
+            self._stats['held'] += 1
+
+    def _publish_held(self):
+
+        # Queues found full are not tried again till the next flush
+        full = set()
+        held = list()
+
+        for batch in self._held:
+            if batch[0] in full or not self._send(batch):
+                full.add(batch[0])
+                held.append(batch)
+
+        self._held = held
+
+    def _send(self, batch):
+
+        # Publish a batch, return whether its queue had space for it
+        routing_key, priority, tasks, packed, body = batch
+
+        try:
+            self._mq_channel.publish(   routing_key=routing_key,
+                                        body=body,
+                                        exchange=self._exchange,
+                                        priority=priority,
+                                        on_nack=partial(self._nacked, tasks),
+                                        timeout=PUBLISH_TIMEOUT)
+
+        except QueueFullError:
+            return False
+
+        except Exception:
+            self._roll_back(tasks)
+            raise
+
+        self._stats['messages'] += 1
+        self._stats['tasks'] += len(tasks)
+        self._stats['packed_bytes'] += len(packed)
+        self._stats['wire_bytes'] += len(body)
+        if body is not packed:
+            self._stats['compressed'] += 1
+
+        if self._published:
+            self._published(tasks)
+
+        return True
+
+    def _roll_back(self, tasks):
+
+        # A batch holds tasks of all pipelines sharing its queue, their states are 
+        # reverted under the lock of each pipeline, but the one the caller holds
+        groups = OrderedDict()
+        for task in tasks:
+            groups.setdefault(self._lock(task) if self._lock else None, list()).append(task)
+
+        held = None
+        if self._lock and self._adding is not None:
+            held = self._lock(self._adding)
+
+        rolled_back = list()
+
+        for lock, group in groups.iteritems():
+            if lock is None or lock is held:
+                rolled_back.extend(self._revert(group))
+            else:
+                with lock:
+                    rolled_back.extend(self._revert(group))
+
+        if self._rollback:
+            self._rollback(rolled_back)
+
+    def _revert(self, tasks):
+
+        # Tasks reported by the executor in the meantime were published after all
+        reverted = [task for task in tasks if task._state_code == states.QUEUED_CODE]
+
+        for task in reverted:
+            task.state = states.NEW
+
+        return reverted
+
+    def _nacked(self, tasks):
+
+        self._stats['nacked'] += 1
+        self._roll_back(tasks)
@@ -0,0 +1,258 @@
+__copyright__   = "Copyright 2017-2018, http://radical.rutgers.edu"
+__author__      = "Vivek Balasubramanian <vivek.balasubramaniana@rutgers.edu>"
+__license__     = "MIT"
+
+from radical.entk.exceptions import *
+from radical.entk import states
+import marshal
+import json
+import zlib
+
+# Codec names
+JSON = 'json'
+BINARY = 'binary'
+
+CODECS = [JSON, BINARY]
+
+# First byte of binary encoded messages. JSON encoded messages start with '[' or '{',
+# so that consumers can decode messages of either codec.
+BINARY_TAG = '\x01'
+
+# First byte of compressed messages, followed by the zlib stream of a message of either
+# codec
+ZLIB_TAG = '\x02'
+
+# zlib compression level of task messages, favouring speed over size
+COMPRESS_LEVEL = 1
+
+# Positional schema of task descriptions (see Task.to_dict()) and their templates (see
+# batch.task_descs()), state updates (see batch.state_update()) and state notifications
+# (see batch.state_notification())
+FIELDS = [  'uid', 'name', 'state',
+            'pre_exec', 'executable', 'arguments', 'post_exec', 'cores',
+            'upload_input_data', 'copy_input_data', 'link_input_data',
+            'copy_output_data', 'download_output_data',
+            'parent_stage', 'parent_pipeline',
+            'timestamp', 'exit_code',
+            'stage_state', 'pipeline', 'pipeline_state', 'current_stage', 'completed',
+            'replica', 'priority', 'template']
+
+_field_set = frozenset(FIELDS)
+
+# Fields holding states
+STATE_FIELDS = frozenset(['state', 'stage_state', 'pipeline_state'])
+
+# Bit set in the field mask if the record carries a dictionary of fields that are
+# not part of the schema
+EXTRA_FIELDS = 1 << len(FIELDS)
+
+
+class JSONCodec(object):
+
+    """
+    Encodes a list of task descriptions as a JSON list of dictionaries
+    """
+
+    name = JSON
+
+    def encode(self, task_descs):
+
+        return json.dumps(task_descs)
+
+    def decode(self, body):
+
+        task_descs = json.loads(body)
+
+        # Single task messages
+        if isinstance(task_descs, dict):
+            return [task_descs]
+
+        return task_descs
+
+
+class BinaryCodec(object):
+
+    """
+    Encodes a list of task descriptions as a list of records in marshal format. A
+    record holds a mask of the fields present, followed by their values in schema
+    order, so field names are not repeated in every message. States are replaced by
+    small integer codes.
+
+    Marshal data is not meant to be read from untrusted sources. Messages are only
+    exchanged between the components of a session, over the session's broker.
+
+    :omit_empty: omit fields holding empty lists (e.g. staging lists of tasks without
+                 data movement), which decode to the defaults of a new Task. Empty lists
+                 of tasks created from a template override the template's and are kept.
+    """
+
+    name = BINARY
+
+    def __init__(self, omit_empty=True):
+
+        self._omit_empty = omit_empty
+
+    def encode(self, task_descs):
+
+        records = list()
+
+        for task_desc in task_descs:
+
+            mask = 0
+            record = [None]
+            omit_empty = self._omit_empty and 'template' not in task_desc
+
+            for i, field in enumerate(FIELDS):
+
+                if field not in task_desc:
+                    continue
+
+                value = task_desc[field]
+
+                if omit_empty and value == []:
+                    continue
+
+                if field in STATE_FIELDS:
+                    value = states.CODES.get(value, value)
+
+                mask |= 1 << i
+                record.append(value)
+
+            if not _field_set.issuperset(task_desc):
+                mask |= EXTRA_FIELDS
+                record.append(dict((k, v) for k, v in task_desc.iteritems() if k not in _field_set))
+
+            record[0] = mask
+            records.append(tuple(record))
+
+        return BINARY_TAG + marshal.dumps(records)
+
+    def decode(self, body):
+
+        if body[:1] != BINARY_TAG:
+            raise ValueError(expected_value='binary encoded message', actual_value=body[:1])
+
+        task_descs = list()
+
+        for record in marshal.loads(body[1:]):
+
+            mask = record[0]
+            task_desc = dict()
+            pos = 1
+
+            for i, field in enumerate(FIELDS):
+                if mask & (1 << i):
+                    value = record[pos]
+                    if field in STATE_FIELDS and isinstance(value, int):
+                        value = states.STATES[value]
+                    task_desc[field] = value
+                    pos += 1
+
+            if mask & EXTRA_FIELDS:
+                task_desc.update(record[pos])
+
+            task_descs.append(task_desc)
+
+        return task_descs
+
+
+_codecs = { JSON: JSONCodec(),
+            BINARY: BinaryCodec()}
+
+
+def get_codec(codec):
+
+    """
+    Resolve a codec
+
+    :arguments: codec name or codec object
+    :return: codec object
+    """
+
+    if isinstance(codec, (JSONCodec, BinaryCodec)):
+        return codec
+
+    if codec not in CODECS:
+        raise ValueError(expected_value=CODECS, actual_value=codec)
+
+    return _codecs[codec]
+
+
+def compress(body, threshold, level=COMPRESS_LEVEL):
+
+    """
+    Compress an encoded message body with zlib if it is at least threshold bytes long,
+    and if compression makes it smaller
+
+    :arguments: message body, size in bytes from which it is compressed, None to not
+                compress, zlib compression level
+    :return: message body, starting with ZLIB_TAG if it was compressed
+    """
+
+    if threshold is None or len(body) < threshold:
+        return body
+
+    compressed = ZLIB_TAG + zlib.compress(body, level)
+
+    if len(compressed) >= len(body):
+        return body
+
+    return compressed
+
+
+def expand_templates(task_descs):
+
+    """
+    Complete the descriptions of tasks created from a template with the attributes they
+    inherit from it. Template descriptions hold the template uid as 'template' and no
+    task uid, they precede the tasks referring to them.
+
+    :arguments: list of dictionaries
+    :return: list of dictionaries without the template descriptions
+    """
+
+    templates = dict()
+    expanded = list()
+
+    for task_desc in task_descs:
+
+        if 'template' not in task_desc:
+            expanded.append(task_desc)
+
+        elif 'uid' not in task_desc:
+            templates[task_desc['template']] = task_desc
+
+        else:
+            uid = task_desc.pop('template')
+            if uid not in templates:
+                raise ValueError(expected_value='description of template %s'%uid,
+                                actual_value=None)
+
+            for field, value in templates[uid].iteritems():
+                if field not in task_desc and field != 'template':
+                    task_desc[field] = value
+
+            expanded.append(task_desc)
+
+    return expanded
+
+
+def decode(body):
+
+    """
+    Decode a message body encoded by any codec, compressed or not, with the descriptions
+    of tasks created from a template completed (see expand_templates())
+
+    :arguments: message body
+    :return: list of dictionaries
+    """
+
+    if body[:1] == ZLIB_TAG:
+        body = zlib.decompress(body[1:])
+
+    if body[:1] == BINARY_TAG:
+        task_descs = _codecs[BINARY].decode(body)
+    else:
+        task_descs = _codecs[JSON].decode(body)
+
+    return expand_templates(task_descs)
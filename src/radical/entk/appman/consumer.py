@@ -0,0 +1,196 @@
+__copyright__   = "Copyright 2017-2018, http://radical.rutgers.edu"
+__author__      = "Vivek Balasubramanian <vivek.balasubramaniana@rutgers.edu>"
+__license__     = "MIT"
+
+from radical.entk.exceptions import *
+import time
+
+# Consumer modes
+POLL = 'poll'       # one get round trip per message, ack per message
+PUSH = 'push'       # broker pushes up to prefetch_count unacked messages, acks are batched
+
+CONSUMER_MODES = [POLL, PUSH]
+
+# Components consuming from a queue, the consumer mode can be selected per component
+COMPONENTS = ['wfprocessor', 'synchronizer', 'helper']
+
+# Seconds to wait for a message before returning control to the caller, so that
+# termination flags are checked and pending acks are flushed
+INACTIVITY_TIMEOUT = 1
+
+# Seconds to sleep after a round of polls of empty queues in poll mode, doubled after
+# each further empty round up to POLL_MAX_INTERVAL
+POLL_INTERVAL = 0.001
+POLL_MAX_INTERVAL = 0.05
+
+
+def get_consumer_mode(consumer_mode, component):
+
+    """
+    Resolve the consumer mode of a component
+
+    :arguments: consumer mode as a string (all components) or as a dictionary of
+                component name to mode, name of the component
+    :return: consumer mode of the component
+    """
+
+    if isinstance(consumer_mode, dict):
+
+        for key in consumer_mode:
+            if key not in COMPONENTS:
+                raise ValueError(expected_value=COMPONENTS, actual_value=key)
+
+        consumer_mode = consumer_mode.get(component, PUSH)
+
+    if consumer_mode not in CONSUMER_MODES:
+        raise ValueError(expected_value=CONSUMER_MODES, actual_value=consumer_mode)
+
+    return consumer_mode
+
+
+class Consumer(object):
+
+    """
+    A Consumer retrieves messages from one or more queues on a channel, either by
+    polling the queues with get() or by push delivery with a prefetch window. In
+    push mode, acks are sent for multiple messages at once: when half the prefetch
+    window has been processed, when the queues are idle, and when the consumer is
+    closed.
+
+    :mq_channel: transport channel to consume on (see transport.Channel)
+    :queues: name of the queue or list of names of queues
+    :mode: 'poll' or 'push'
+    :prefetch_count: maximum number of unacked messages delivered per queue (push mode)
+    """
+
+    def __init__(self, mq_channel, queues, mode=PUSH, prefetch_count=64):
+
+        if mode not in CONSUMER_MODES:
+            raise ValueError(expected_value=CONSUMER_MODES, actual_value=mode)
+
+        if not isinstance(prefetch_count, int):
+            raise TypeError(expected_type=int, actual_type=type(prefetch_count))
+
+        if not isinstance(queues, list):
+            queues = [queues]
+
+        self._mq_channel = mq_channel
+        self._queues = queues
+        self._mode = mode
+
+        self._prefetch_count = max(prefetch_count, 1)
+        self._ack_batch = max(self._prefetch_count/2, 1)
+
+        # Latest delivery tag processed but not acked yet, and number of such messages
+        self._unacked_tag = None
+        self._unacked_count = 0
+
+        # Next queue to poll
+        self._cur_queue = 0
+
+        if self._mode == PUSH:
+            for queue in self._queues:
+                self._mq_channel.consume(queue, self._prefetch_count)
+
+    def get(self, timeout=None):
+
+        """
+        Get the next message of the queues, waiting at most timeout seconds. In poll
+        mode, the queues are polled again after a sleep that grows while they are empty
+        (see POLL_INTERVAL).
+
+        :arguments: seconds to wait at most, INACTIVITY_TIMEOUT if None
+        :return: (delivery tag, body) tuple, (None, None) if no message arrived
+        """
+
+        if timeout is None:
+            timeout = INACTIVITY_TIMEOUT
+
+        if self._mode == POLL:
+            return self._poll(timeout)
+
+        delivery_tag, body = self._mq_channel.next_delivery(timeout)
+
+        if body is None:
+            # Queues idle, ack what has been processed so far
+            self.flush()
+
+        return delivery_tag, body
+
+    def _poll(self, timeout):
+
+        deadline = time.time() + timeout
+        interval = POLL_INTERVAL
+
+        while True:
+
+            for i in range(len(self._queues)):
+
+                queue = self._queues[self._cur_queue]
+                self._cur_queue = (self._cur_queue + 1) % len(self._queues)
+
+                delivery_tag, body = self._mq_channel.get(queue)
+
+                if body is not None:
+                    return delivery_tag, body
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None, None
+
+            time.sleep(min(interval, remaining))
+            interval = min(interval*2, POLL_MAX_INTERVAL)
+
+    def ack(self, delivery_tag):
+
+        """
+        Acknowledge a processed message. In push mode, the ack is deferred and sent for
+        multiple messages at once.
+        """
+
+        if self._mode == POLL:
+            self._mq_channel.ack(delivery_tag)
+            return
+
+        self._unacked_tag = delivery_tag
+        self._unacked_count += 1
+
+        if self._unacked_count >= self._ack_batch:
+            self.flush()
+
+    def flush(self):
+
+        """
+        Send pending acks
+        """
+
+        if self._unacked_count:
+            self._mq_channel.ack(self._unacked_tag, multiple=True)
+            self._unacked_tag = None
+            self._unacked_count = 0
+
+    def close(self):
+
+        """
+        Send pending acks and cancel push delivery. Messages delivered but not acked
+        are requeued by the broker.
+        """
+
+        self.flush()
+
+        if self._mode == PUSH:
+            self._mq_channel.cancel()
+
+    def abort(self):
+
+        """
+        Send pending acks after a failure of the consuming thread or process, so that
+        only the messages not processed are requeued when the channel is closed. Errors
+        are ignored: the channel may be what failed, and the broker then requeues the
+        messages whose acks were not sent.
+        """
+
+        try:
+            self.flush()
+        except Exception:
+            pass
@@ -0,0 +1,11 @@
+__copyright__   = "Copyright 2017-2018, http://radical.rutgers.edu"
+__author__      = "Vivek Balasubramanian <vivek.balasubramaniana@rutgers.edu>"
+__license__     = "MIT"
+
+# Execution engines
+THREADS = 'threads'     # threads per shard for enqueue, dequeue and synchronization, 
+                        # supervised by a thread of each process
+LOOP = 'loop'           # one event loop per process doing all of them, blocking only
+                        # on the queues it consumes
+
+ENGINES = [THREADS, LOOP]
@@ -0,0 +1,219 @@
+__copyright__   = "Copyright 2017-2018, http://radical.rutgers.edu"
+__author__      = "Vivek Balasubramanian <vivek.balasubramaniana@rutgers.edu>"
+__license__     = "MIT"
+
+from radical.entk.exceptions import *
+from collections import deque
+import threading
+
+
+class Credits(object):
+
+    """
+    Credits bound the number of tasks in flight, i.e. submitted and not completed yet,
+    over all pipelines and per pipeline. A pipeline acquires a credit per task it
+    submits and releases it when the task completes. A pipeline that was granted fewer
+    credits than it asked for waits: for credits of any pipeline if the overall limit
+    was reached, for its own credits if its limit was reached. Releasing credits
+    returns the waiting pipelines that can be granted credits again, in the order they
+    started to wait. Waiting pipelines are only woken up once a quarter of the overall
+    limit is available, so that they submit their tasks in batches rather than one by
+    one as tasks complete.
+
+    :max_in_flight: maximum number of tasks in flight, None for no limit
+    :pipeline_in_flight: maximum number of tasks in flight per pipeline, None for no
+                         limit
+    """
+
+    def __init__(self, max_in_flight=None, pipeline_in_flight=None):
+
+        for limit in [max_in_flight, pipeline_in_flight]:
+
+            if limit is None:
+                continue
+
+            if not isinstance(limit, int):
+                raise TypeError(expected_type=int, actual_type=type(limit))
+
+            if limit < 1:
+                raise ValueError(expected_value='positive integer', actual_value=limit)
+
+        self._max_in_flight = max_in_flight
+        self._pipeline_in_flight = pipeline_in_flight
+
+        if max_in_flight is not None:
+            self._wake_credits = max(1, max_in_flight/4)
+        else:
+            self._wake_credits = 1
+
+        self._lock = threading.Lock()
+
+        # Tasks in flight overall and per pipeline, and their highest numbers
+        self._in_flight = 0
+        self._pipe_in_flight = dict()
+        self._high_water = 0
+        self._pipe_high_water = 0
+
+        # Pipelines waiting for credits of any pipeline, and for their own credits
+        self._waiting = deque()
+        self._waiting_set = set()
+        self._blocked = set()
+
+        # Number of times a pipeline had to wait
+        self._waits = 0
+
+    @property
+    def in_flight(self):
+
+        """
+        Number of tasks in flight
+
+        :getter: Returns an integer
+        """
+
+        return self._in_flight
+
+    @property
+    def stats(self):
+
+        """
+        Limits, highest numbers of tasks in flight overall and in one pipeline, and
+        number of times a pipeline had to wait for credits
+
+        :getter: Returns a dictionary
+        """
+
+        with self._lock:
+            return {'max_in_flight': self._max_in_flight,
+                    'pipeline_in_flight': self._pipeline_in_flight,
+                    'high_water': self._high_water,
+                    'pipeline_high_water': self._pipe_high_water,
+                    'waits': self._waits}
+
+    def _available(self, pipe):
+
+        available = None
+
+        if self._max_in_flight is not None:
+            available = self._max_in_flight - self._in_flight
+
+        if self._pipeline_in_flight is not None:
+            pipe_available = self._pipeline_in_flight - self._pipe_in_flight.get(pipe, 0)
+            if available is None or pipe_available < available:
+                available = pipe_available
+
+        return available
+
+    def acquire(self, pipe, count):
+
+        """
+        Acquire credits for tasks of a pipeline to be submitted
+
+        :arguments: pipeline uid, number of tasks
+        :return: number of credits granted, the pipeline waits if less than count
+        """
+
+        with self._lock:
+
+            available = self._available(pipe)
+
+            granted = count if available is None else max(0, min(count, available))
+
+            if granted:
+                self._add(pipe, granted)
+
+            if granted < count:
+                self._wait(pipe)
+
+            return granted
+
+    def hold(self, pipe, count):
+
+        """
+        Count tasks of a pipeline as in flight without asking for credits, e.g. tasks
+        submitted by a previous process that did not complete yet. Their credits are
+        released when they complete, like acquired ones. The limits may be exceeded,
+        pipelines are granted credits again once enough of the tasks completed.
+
+        :arguments: pipeline uid, number of tasks
+        """
+
+        with self._lock:
+            self._add(pipe, count)
+
+    def _add(self, pipe, count):
+
+        self._in_flight += count
+        in_flight = self._pipe_in_flight.get(pipe, 0) + count
+        self._pipe_in_flight[pipe] = in_flight
+        self._high_water = max(self._high_water, self._in_flight)
+        self._pipe_high_water = max(self._pipe_high_water, in_flight)
+
+    def _wait(self, pipe):
+
+        if pipe in self._waiting_set or pipe in self._blocked:
+            return
+
+        self._waits += 1
+
+        if self._pipeline_in_flight is not None and \
+            self._pipe_in_flight.get(pipe, 0) >= self._pipeline_in_flight:
+            self._blocked.add(pipe)
+
+        else:
+            self._waiting.append(pipe)
+            self._waiting_set.add(pipe)
+
+    def release(self, pipe, count):
+
+        """
+        Release the credits of tasks of a pipeline that completed, or whose
+        submission failed
+
+        :arguments: pipeline uid, number of tasks
+        :return: list of uids of the pipelines to submit tasks again
+        """
+
+        with self._lock:
+
+            self._in_flight -= count
+            in_flight = self._pipe_in_flight.get(pipe, 0) - count
+            if in_flight > 0:
+                self._pipe_in_flight[pipe] = in_flight
+            else:
+                self._pipe_in_flight.pop(pipe, None)
+
+            # A pipeline waiting for its own credits waits for any credits from now on
+            if pipe in self._blocked:
+                self._blocked.discard(pipe)
+                self._waiting.append(pipe)
+                self._waiting_set.add(pipe)
+
+            ready = list()
+
+            if self._max_in_flight is None:
+                available = None
+            else:
+                available = self._max_in_flight - self._in_flight
+
+            if available is not None and available < self._wake_credits:
+                return ready
+
+            while self._waiting and (available is None or available > 0):
+
+                waiting = self._waiting.popleft()
+                self._waiting_set.discard(waiting)
+
+                pipe_available = self._available(waiting)
+                if pipe_available is not None and pipe_available <= 0:
+                    self._blocked.add(waiting)
+                    continue
+
+                ready.append(waiting)
+
+                # Credits are not reserved, the pipelines woken up are expected to use
+                # what is available
+                if available is not None:
+                    available -= pipe_available
+
+            return ready
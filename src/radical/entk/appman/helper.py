@@ -4,13 +4,15 @@ __license__     = "MIT"
 
 import radical.utils as ru
 from radical.entk.exceptions import *
-import threading
 from multiprocessing import Process, Event
-import Queue
 from radical.entk import states, Task
+from consumer import Consumer, PUSH
+from batch import pack, unpack, state_update
+from codec import JSON
+from shard import get_shard
 import time
 import json
-import pika
+from transport import get_transport, RABBITMQ
 import traceback
 import os
 
@@ -20,7 +22,8 @@ slow_run = os.environ.get('RADICAL_ENTK_SLOW',False)
 
 class Helper(object):
 
-    def __init__(self, pending_queue, completed_queue, mq_hostname):
+    def __init__(self, pending_queue, completed_queue, mq_hostname, 
+                consumer_mode=PUSH, prefetch_count=64, codec=JSON, transport=RABBITMQ):
 
         self._uid           = ru.generate_id('radical.entk.helper')
         self._logger        = ru.get_logger('radical.entk.helper')
@@ -28,6 +31,14 @@ class Helper(object):
         self._pending_queue = pending_queue
         self._completed_queue = completed_queue
         self._mq_hostname = mq_hostname
+        self._transport = get_transport(transport, mq_hostname)
+
+        # Consumption of the pending queue
+        self._consumer_mode = consumer_mode
+        self._prefetch_count = prefetch_count
+
+        # Encoding of completed task messages
+        self._codec = codec
 
         self._helper_process = None
 
@@ -85,49 +96,60 @@ class Helper(object):
         # This function extracts currently tasks from the pending_queue
         # and pushes it to the executed_queue. Thus mimicking an execution plugin
 
+        mq_channel = None
+        consumer = None
+
         try:
 
             self._logger.info('Helper process started')
 
             # Thread should run till terminate condtion is encountered
-            mq_connection = pika.BlockingConnection(pika.ConnectionParameters(host=self._mq_hostname))
-            mq_channel = mq_connection.channel()
+            mq_channel = self._transport.channel()
+
+            consumer = Consumer(mq_channel, self._pending_queue, 
+                                self._consumer_mode, self._prefetch_count)
 
             while not self._helper_terminate.is_set():
 
                 try:
 
-                    method_frame, header_frame, body = mq_channel.basic_get(queue=self._pending_queue[0])
+                    delivery_tag, body = consumer.get()
 
                     if body:
 
 
                         try:
-                            task = Task()
-                            task.load_from_dict(json.loads(body))
+                            # Completed tasks per completed queue
+                            tasks = dict()
+
+                            for task_desc in unpack(body):
+
+                                task = Task()
+                                task.load_from_dict(task_desc)
 
-                            task.state = states.DONE
+                                self._logger.debug('Got task %s from pending queue'%(task.uid))
 
-                            task_as_dict = json.dumps(task.to_dict())
+                                task.state = states.DONE
 
-                            self._logger.debug('Got task %s from pending_queue %s'%(task.uid, self._pending_queue[0]))
+                                completed_queue = self._completed_queue[get_shard(task._parent_pipeline, 
+                                                                                len(self._completed_queue))]
+                                tasks.setdefault(completed_queue, list()).append(task)
 
-                            mq_channel.basic_publish( exchange='fork',
-                                                            routing_key='',
-                                                            body=task_as_dict
-                                                            #properties=pika.BasicProperties(
-                                                                # make message persistent
-                                                            #    delivery_mode = 2, 
-                                                            #)
-                                                        )                    
-                        
-                            self._logger.debug('Pushed task %s with state %s to completed queue %s and synchronizerq'%(
-                                                                                    task.uid, 
-                                                                                    task.state,
-                                                                                    self._completed_queue[0])
-                                                                                )
+                            # State updates of completed tasks are published in the batches the tasks
+                            # were received in, split by the shard of their pipeline
+                            for completed_queue, queue_tasks in tasks.iteritems():
 
-                            mq_channel.basic_ack(delivery_tag=method_frame.delivery_tag)
+                                mq_channel.publish( completed_queue, 
+                                                    pack([state_update(task) for task in queue_tasks], self._codec))
+
+                                for task in queue_tasks:
+                                    self._logger.debug('Pushed task %s with state %s to completed queue %s'%(
+                                                                                        task.uid, 
+                                                                                        task.state,
+                                                                                        completed_queue)
+                                                                                    )
+
+                            consumer.ack(delivery_tag)
 
                         except Exception, ex:
 
@@ -146,6 +168,11 @@ class Helper(object):
                     self._logger.error('Error getting messages from pending queue: %s'%ex)
                     raise UnknownError(text=ex) 
 
+            consumer.close()
+            mq_channel.close()
+
+            self._logger.info('Transport connections: %s'%self._transport.stats)
+
 
         except KeyboardInterrupt:
 
@@ -158,6 +185,13 @@ class Helper(object):
 
             self._logger.error('Unknown error in helper process: %s'%ex)
             print traceback.format_exc()
+
+            # Tasks not acknowledged are requeued for the restarted helper
+            if consumer:
+                consumer.abort()
+            if mq_channel:
+                mq_channel.close()
+
             raise UnknownError(text=ex) 
 
 
@@ -0,0 +1,192 @@
+__copyright__   = "Copyright 2017-2018, http://radical.rutgers.edu"
+__author__      = "Vivek Balasubramanian <vivek.balasubramaniana@rutgers.edu>"
+__license__     = "MIT"
+
+from radical.entk.exceptions import *
+import multiprocessing as mp
+import struct
+import mmap
+import time
+
+# Header of the shared memory: number of slots written and read so far, whether the
+# consumer waits for data and whether the producer waits for space
+_HEADER = struct.Struct('QQQQ')
+_HEAD, _TAIL, _DATA_WAIT, _SPACE_WAIT = [i*8 for i in range(4)]
+_INDEX = struct.Struct('Q')
+
+# Messages are prefixed with their length
+_LENGTH = struct.Struct('I')
+
+# Offset of the slots, aligned to a cache line
+_DATA = 64
+
+def max_message_size(slots, slot_size):
+
+    """
+    :arguments: number of slots and bytes per slot of a ring buffer
+    :return: bytes of the largest message the ring buffer takes
+    """
+
+    return slots*slot_size - _LENGTH.size
+
+
+# Maximum number of seconds to block on a semaphore before checking the indices again,
+# bounds the delay of a wakeup lost to a concurrent update of the wait flags
+WAIT_SLICE = 0.01
+
+
+class RingBuffer(object):
+
+    """
+    A RingBuffer is a fixed size queue of messages in shared memory, for one consumer
+    and one producer at a time. A message occupies as many consecutive fixed size slots
+    as its length requires. Messages are written to and read from the shared memory
+    directly, the producer and the consumer only signal a semaphore if the other side
+    is blocked waiting for data or space.
+
+    The ring buffer has to be created before the processes using it are started, which
+    inherit the shared memory. The indices are 8 byte aligned and written after the
+    slots they cover, which makes them safe to read from another process on x86.
+
+    :slots: number of slots
+    :slot_size: bytes per slot
+    """
+
+    def __init__(self, slots=1024, slot_size=256):
+
+        for value in [slots, slot_size]:
+            if not isinstance(value, int):
+                raise TypeError(expected_type=int, actual_type=type(value))
+
+        if slots < 1 or slot_size < _LENGTH.size:
+            raise ValueError(expected_value='positive number of slots of at least %s bytes'%
+                                            _LENGTH.size, actual_value=(slots, slot_size))
+
+        self._slots = slots
+        self._slot_size = slot_size
+        self._size = slots*slot_size
+
+        # Anonymous mappings are shared with child processes
+        self._mm = mmap.mmap(-1, _DATA + self._size)
+        _HEADER.pack_into(self._mm, 0, 0, 0, 0, 0)
+
+        self._data_ready = mp.Semaphore(0)
+        self._space_ready = mp.Semaphore(0)
+
+        # Producers of different threads or processes take turns
+        self._put_lock = mp.Lock()
+
+    def _index(self, offset):
+
+        return _INDEX.unpack_from(self._mm, offset)[0]
+
+    def _set_index(self, offset, value):
+
+        _INDEX.pack_into(self._mm, offset, value)
+
+    def _wait(self, flag, semaphore, ready, end):
+
+        # Block till ready() or till end, announcing the wait through the flag
+        while True:
+
+            if ready():
+                return True
+
+            remaining = end - time.time() if end is not None else WAIT_SLICE
+            if remaining <= 0:
+                return False
+
+            self._set_index(flag, 1)
+            if not ready():
+                semaphore.acquire(True, min(remaining, WAIT_SLICE))
+            self._set_index(flag, 0)
+
+    def _write(self, offset, data):
+
+        first = min(len(data), self._size - offset)
+        self._mm[_DATA + offset:_DATA + offset + first] = data[:first]
+
+        if first < len(data):
+            self._mm[_DATA:_DATA + len(data) - first] = data[first:]
+
+    def _read(self, offset, length):
+
+        first = min(length, self._size - offset)
+        data = self._mm[_DATA + offset:_DATA + offset + first]
+
+        if first < length:
+            data += self._mm[_DATA:_DATA + length - first]
+
+        return data
+
+    def put(self, body, timeout=None):
+
+        """
+        Append a message, waiting for space if the ring buffer is full
+
+        :arguments: message string, seconds to wait at most, None to wait till there
+                    is space
+        :return: whether the message was appended
+        """
+
+        record = _LENGTH.pack(len(body)) + body
+        slots = (len(record) + self._slot_size - 1)/self._slot_size
+
+        if slots > self._slots:
+            raise ValueError(expected_value='message of at most %s bytes'%
+                                            max_message_size(self._slots, self._slot_size),
+                            actual_value=len(body))
+
+        end = time.time() + timeout if timeout is not None else None
+
+        with self._put_lock:
+
+            head = self._index(_HEAD)
+
+            if not self._wait(  _SPACE_WAIT, self._space_ready,
+                                lambda: head + slots - self._index(_TAIL) <= self._slots, end):
+                return False
+
+            self._write((head % self._slots)*self._slot_size, record)
+            self._set_index(_HEAD, head + slots)
+
+        if self._index(_DATA_WAIT):
+            self._data_ready.release()
+
+        return True
+
+    def get(self, timeout=0):
+
+        """
+        Remove the oldest message
+
+        :arguments: seconds to wait at most for a message, None to wait till there is
+                    one
+        :return: message string, None if there is none
+        """
+
+        tail = self._index(_TAIL)
+
+        if timeout != 0:
+            end = time.time() + timeout if timeout is not None else None
+            if not self._wait(_DATA_WAIT, self._data_ready,
+                                lambda: self._index(_HEAD) != tail, end):
+                return None
+
+        elif self._index(_HEAD) == tail:
+            return None
+
+        offset = (tail % self._slots)*self._slot_size
+        length = _LENGTH.unpack(self._read(offset, _LENGTH.size))[0]
+        body = self._read((offset + _LENGTH.size) % self._size, length)
+
+        self._set_index(_TAIL, tail + (_LENGTH.size + length + self._slot_size - 1)/self._slot_size)
+
+        if self._index(_SPACE_WAIT):
+            self._space_ready.release()
+
+        return body
+
+    def empty(self):
+
+        return self._index(_HEAD) == self._index(_TAIL)
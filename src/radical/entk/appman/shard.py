@@ -0,0 +1,19 @@
+__copyright__   = "Copyright 2017-2018, http://radical.rutgers.edu"
+__author__      = "Vivek Balasubramanian <vivek.balasubramaniana@rutgers.edu>"
+__license__     = "MIT"
+
+import zlib
+
+
+def get_shard(uid, num_shards):
+
+    """
+    Map a uid to one of num_shards shards. The mapping is stable across processes,
+    so that all messages of a pipeline are handled by the same queues and workers.
+
+    :arguments: uid (string), number of shards
+    :return: integer in [0, num_shards)
+    """
+
+    return (zlib.crc32(uid) & 0xffffffff) % num_shards
+
@@ -0,0 +1,127 @@
+__copyright__   = "Copyright 2017-2018, http://radical.rutgers.edu"
+__author__      = "Vivek Balasubramanian <vivek.balasubramaniana@rutgers.edu>"
+__license__     = "MIT"
+
+from radical.entk.exceptions import *
+import time
+
+# Maximum number of restarts per worker
+MAX_RESTARTS = 10
+
+# Seconds to wait before the first restart of a worker, doubled for every further
+# restart up to MAX_BACKOFF
+BACKOFF = 0.1
+MAX_BACKOFF = 10
+
+# Maximum number of seconds between two checks of the workers
+INTERVAL = 1
+
+
+class Supervisor(object):
+
+    """
+    A Supervisor starts a set of workers (threads or processes) and restarts those that
+    died, waiting with exponential backoff before each restart. A worker that died more
+    than max_restarts times is not restarted, check() raises a RestartsExhaustedError
+    instead.
+
+    The owner of the supervisor calls check() and then blocks, e.g. on its termination
+    event, for at most the number of seconds check() returned.
+
+    :name: name of the supervising component, used in logs
+    :logger: logger of the supervising component
+    :max_restarts: maximum number of restarts per worker
+    """
+
+    def __init__(self, name, logger, max_restarts=MAX_RESTARTS):
+
+        if not isinstance(max_restarts, int):
+            raise TypeError(expected_type=int, actual_type=type(max_restarts))
+
+        self._name = name
+        self._logger = logger
+        self._max_restarts = max_restarts
+
+        # Per worker: function starting it, function returning whether it is running,
+        # number of restarts and time its pending restart is due
+        self._workers = list()
+        self._start = dict()
+        self._alive = dict()
+        self._restarts = dict()
+        self._restart_time = dict()
+
+    @property
+    def restarts(self):
+
+        """
+        Number of times each worker was restarted
+
+        :getter: Returns a dictionary of worker name to number of restarts
+        """
+
+        return dict(self._restarts)
+
+    def add(self, name, start, alive):
+
+        """
+        Add a worker, started on the next check()
+
+        :arguments: name of the worker, function starting the worker, function
+                    returning whether the worker is running
+        """
+
+        if name in self._start:
+            raise ExistsError(item=name, parent=self._name)
+
+        self._workers.append(name)
+        self._start[name] = start
+        self._alive[name] = alive
+        self._restarts[name] = None
+
+    def check(self):
+
+        """
+        Start the workers that were not started yet, restart the workers that died and
+        whose backoff expired
+
+        :return: seconds until the next check is due
+        """
+
+        timeout = INTERVAL
+
+        for name in self._workers:
+
+            if self._restarts[name] is None:
+                self._logger.info('%s: starting %s'%(self._name, name))
+                self._start[name]()
+                self._restarts[name] = 0
+                continue
+
+            if self._alive[name]():
+                continue
+
+            now = time.time()
+
+            if name not in self._restart_time:
+
+                if self._restarts[name] >= self._max_restarts:
+                    self._logger.error('%s: %s died, restarted %s times already'%(
+                                            self._name, name, self._restarts[name]))
+                    raise RestartsExhaustedError(worker=name, restarts=self._restarts[name])
+
+                backoff = min(BACKOFF*2**self._restarts[name], MAX_BACKOFF)
+                self._restart_time[name] = now + backoff
+                self._logger.error('%s: %s died, restarting in %.1f secs'%(
+                                        self._name, name, backoff))
+
+            if now >= self._restart_time[name]:
+                del self._restart_time[name]
+                self._restarts[name] += 1
+                self._logger.info('%s: restarting %s (restart %s of %s)'%(
+                                        self._name, name, self._restarts[name], self._max_restarts))
+                self._start[name]()
+
+            else:
+                timeout = min(timeout, self._restart_time[name] - now)
+
+        return timeout
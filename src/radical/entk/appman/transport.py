@@ -0,0 +1,1150 @@
+__copyright__   = "Copyright 2017-2018, http://radical.rutgers.edu"
+__author__      = "Vivek Balasubramanian <vivek.balasubramaniana@rutgers.edu>"
+__license__     = "MIT"
+
+import radical.utils as ru
+from radical.entk.exceptions import *
+from collections import deque, OrderedDict
+from ring import RingBuffer, max_message_size
+import multiprocessing as mp
+import pika
+import threading
+import Queue
+import tempfile
+import hashlib
+import shutil
+import time
+import os
+
+try:
+    import zmq
+except ImportError:
+    zmq = None
+
+# Transport names
+RABBITMQ = 'rabbitmq'
+LOCAL = 'local'
+ZMQ = 'zmq'
+SHM = 'shm'
+
+TRANSPORTS = [RABBITMQ, LOCAL, ZMQ, SHM]
+
+# Milliseconds after which the RabbitMQ server deletes a queue without consumers that
+# is not used, e.g. a queue of a session that ended without deleting its queues
+QUEUE_EXPIRES = 3600*1000
+
+# Errors after which a RabbitMQ connection is reopened
+RECONNECT_ERRORS = (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError)
+
+# Milliseconds a closed ZeroMQ channel may take to send the messages it still holds
+ZMQ_LINGER = 10000
+
+# Maximum length of the path of an ipc endpoint
+ZMQ_MAX_PATH = 100
+
+# Bytes a task is assumed to take in the messages of a queue of the shm transport,
+# sizes the default window of tasks in flight so that the queues do not fill up
+SHM_TASK_BYTES = 512
+
+# Highest message priority of RabbitMQ priority queues, higher priorities are capped.
+# The server keeps a sub-queue per priority, RabbitMQ advises against more than 10.
+MAX_PRIORITY = 10
+
+
+def _remove_acked(unacked, delivery_tag, multiple):
+
+    """
+    Remove the messages acknowledged by a delivery tag from the ordered dictionary of
+    delivery tag to (queue, body) of the messages a channel did not acknowledge yet
+    """
+
+    if not multiple:
+        unacked.pop(delivery_tag, None)
+        return
+
+    while unacked and next(iter(unacked)) <= delivery_tag:
+        unacked.popitem(last=False)
+
+
+class Channel(object):
+
+    """
+    A Channel is the connection of one thread to the queues of a transport. Messages are
+    strings, they are either fetched one at a time with get() or, after consume(),
+    delivered up to prefetch_count at a time and returned by next_delivery(). Each
+    message is acknowledged with ack() once processed. Messages not acknowledged when
+    the channel is cancelled or closed, e.g. by a worker that failed, are requeued and
+    delivered to the worker restarted in its place, except on the zmq transport.
+    """
+
+    def declare_queue(self, queue, priorities=False):
+
+        """
+        Create a queue, if it does not exist. A queue with priorities delivers messages
+        of higher priority first, on transports that support priority queues.
+        """
+
+        raise NotImplementedError(method_name='declare_queue', class_name=type(self).__name__)
+
+    def delete_queue(self, queue):
+
+        """
+        Delete a queue and the messages it holds
+        """
+
+        raise NotImplementedError(method_name='delete_queue', class_name=type(self).__name__)
+
+    def declare_queues(self, queues, priorities=False):
+
+        """
+        Create a list of queues
+        """
+
+        for queue in queues:
+            self.declare_queue(queue, priorities)
+
+    def delete_queues(self, queues):
+
+        """
+        Delete a list of queues
+        """
+
+        for queue in queues:
+            self.delete_queue(queue)
+
+    def declare_fanout(self, exchange, queues):
+
+        """
+        Create an exchange that publishes each message to all the given queues
+        """
+
+        raise NotImplementedError(method_name='declare_fanout', class_name=type(self).__name__)
+
+    def publish(self, routing_key, body, exchange='', priority=0, on_nack=None,
+                timeout=None):
+
+        """
+        Publish a message to the queue named routing_key, or to the queues of a fanout
+        exchange. The priority only applies to queues declared with priorities, on
+        transports that support them, other transports deliver messages in the order
+        they were published. In confirm mode, on_nack is invoked without arguments if
+        the message is not confirmed. On transports whose queues hold a bounded number
+        of messages, publishing to a queue waits at most timeout seconds for space, till
+        there is space if None, and raises a QueueFullError if there is none.
+        """
+
+        raise NotImplementedError(method_name='publish', class_name=type(self).__name__)
+
+    @property
+    def max_message_size(self):
+
+        """
+        Bytes of the largest message the queues take, None if there is no limit
+
+        :getter: Returns an integer or None
+        """
+
+        return None
+
+    def confirm_delivery(self, window):
+
+        """
+        Have the broker confirm the messages published on this channel, with at most 
+        window messages published and not confirmed yet. Transports without a broker
+        hold a message once it is published, they do not need confirmations.
+        """
+
+        pass
+
+    def wait_for_confirms(self, timeout=None):
+
+        """
+        Process the confirmations received, waiting at most timeout seconds for all
+        published messages to be confirmed, or till they are if None
+
+        :return: whether no published message is waiting for its confirmation
+        """
+
+        return True
+
+    def get(self, queue):
+
+        """
+        Fetch a message of a queue
+
+        :return: (delivery tag, body) tuple, (None, None) if the queue is empty
+        """
+
+        raise NotImplementedError(method_name='get', class_name=type(self).__name__)
+
+    def consume(self, queue, prefetch_count):
+
+        """
+        Start delivery of the messages of a queue, with at most prefetch_count messages
+        delivered and not acknowledged
+        """
+
+        raise NotImplementedError(method_name='consume', class_name=type(self).__name__)
+
+    def next_delivery(self, timeout):
+
+        """
+        Next message delivered from the consumed queues, waiting at most timeout seconds
+
+        :return: (delivery tag, body) tuple, (None, None) if no message arrived
+        """
+
+        raise NotImplementedError(method_name='next_delivery', class_name=type(self).__name__)
+
+    def ack(self, delivery_tag, multiple=False):
+
+        """
+        Acknowledge a message, and all messages delivered before it if multiple
+        """
+
+        raise NotImplementedError(method_name='ack', class_name=type(self).__name__)
+
+    def cancel(self):
+
+        """
+        Stop delivery of the consumed queues, messages delivered and not acknowledged are
+        requeued
+        """
+
+        raise NotImplementedError(method_name='cancel', class_name=type(self).__name__)
+
+    def close(self):
+
+        raise NotImplementedError(method_name='close', class_name=type(self).__name__)
+
+
+class ConnectionPool(object):
+
+    """
+    A ConnectionPool holds the connections of one process to a RabbitMQ server. A
+    channel that is closed returns its connection to the pool, where the next channel
+    of the process, e.g. of a restarted thread, picks it up instead of opening a new
+    connection. Connections are used by one thread at a time, as pika connections are
+    not thread safe. A child process does not use the connections of its parent, it
+    starts with an empty pool.
+
+    :hostname: host the RabbitMQ server is running on
+    :logger: logger connections are reported to
+    """
+
+    def __init__(self, hostname, logger):
+
+        self._hostname = hostname
+        self._logger = logger
+
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._idle = list()
+        self._stats = {'opened': 0, 'reused': 0, 'reconnects': 0}
+
+    def _check_process(self):
+
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = list()
+            self._stats = dict.fromkeys(self._stats, 0)
+
+    def _open(self):
+
+        connection = pika.BlockingConnection(pika.ConnectionParameters(host=self._hostname))
+        return connection, connection.channel()
+
+    @property
+    def stats(self):
+
+        """
+        Connections of this process opened, reused from the pool and reopened after
+        they failed
+
+        :getter: Returns a dictionary
+        """
+
+        with self._lock:
+            self._check_process()
+            return dict(self._stats)
+
+    def acquire(self):
+
+        """
+        :return: (connection, channel) tuple, from the pool if there is an open one
+        """
+
+        with self._lock:
+
+            self._check_process()
+
+            while self._idle:
+                connection, channel = self._idle.pop()
+                if connection.is_open and channel.is_open:
+                    self._stats['reused'] += 1
+                    return connection, channel
+
+            self._stats['opened'] += 1
+            self._logger.info('Opening connection %s of process %s to %s'%(
+                                    self._stats['opened'], self._pid, self._hostname))
+
+        return self._open()
+
+    def release(self, connection, channel):
+
+        """
+        Return a connection to the pool
+        """
+
+        with self._lock:
+            if self._pid == os.getpid() and connection.is_open and channel.is_open:
+                self._idle.append((connection, channel))
+
+    def reconnect(self, connection, error):
+
+        """
+        Replace a connection that failed
+
+        :arguments: connection, error it failed with
+        :return: (connection, channel) tuple
+        """
+
+        with self._lock:
+            self._check_process()
+            self._stats['reconnects'] += 1
+            self._logger.warning('Connection of process %s to %s failed (%s), reconnecting'%(
+                                    self._pid, self._hostname, error))
+
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+        return self._open()
+
+
+class RabbitMQChannel(Channel):
+
+    """
+    Channel to the queues of a RabbitMQ server, over a blocking pika connection of a
+    pool. Operations failing because the connection or channel broke are retried once
+    on a new connection, on which consumption of the consumed queues is resumed.
+    Messages delivered on the failed connection are requeued by the server and can not
+    be acknowledged anymore, their acks are ignored.
+
+    In confirm mode, publishing waits for the confirmation of the message, one round
+    trip per message, i.e. per batch of tasks (see batch.Batcher), so that a window of
+    unconfirmed messages is never full. Messages the server rejects are reported to
+    their on_nack function, messages that could not be published on a failed
+    connection are published again on the new one.
+
+    :pool: ConnectionPool of the process
+    """
+
+    def __init__(self, pool):
+
+        self._pool = pool
+        self._mq_connection, self._mq_channel = pool.acquire()
+
+        # Incremented on reconnects, delivery tags are (generation, tag) tuples
+        self._generation = 0
+
+        self._deliveries = deque()
+        self._consumed = list()
+        self._consumer_tags = list()
+
+        # Confirm mode: maximum number of unconfirmed messages
+        self._confirm_window = None
+
+    def _reconnect(self, error):
+
+        self._mq_connection, self._mq_channel = self._pool.reconnect(self._mq_connection, error)
+
+        self._generation += 1
+        self._deliveries.clear()
+        self._consumer_tags = list()
+
+        for queue, prefetch_count in self._consumed:
+            self._consume(queue, prefetch_count)
+
+        if self._confirm_window:
+            self._mq_channel.confirm_delivery()
+
+    def _call(self, method, **kwargs):
+
+        try:
+            return getattr(self._mq_channel, method)(**kwargs)
+
+        except RECONNECT_ERRORS, ex:
+            self._reconnect(ex)
+            return getattr(self._mq_channel, method)(**kwargs)
+
+    def declare_queue(self, queue, priorities=False):
+
+        arguments = {'x-expires': QUEUE_EXPIRES}
+        if priorities:
+            arguments['x-max-priority'] = MAX_PRIORITY
+
+        self._call('queue_declare', queue=queue, arguments=arguments)
+
+    def delete_queue(self, queue):
+
+        self._call('queue_delete', queue=queue)
+
+    def declare_fanout(self, exchange, queues):
+
+        self._call('exchange_declare', exchange=exchange, type='fanout')
+        for queue in queues:
+            self._call('queue_bind', exchange=exchange, queue=queue)
+
+    def publish(self, routing_key, body, exchange='', priority=0, on_nack=None,
+                timeout=None):
+
+        properties = None
+        if priority > 0:
+            properties = pika.BasicProperties(priority=min(priority, MAX_PRIORITY))
+
+        # In confirm mode, returns once the server confirmed the message, False if it
+        # rejected it
+        confirmed = self._call('basic_publish', exchange=exchange, routing_key=routing_key,
+                                body=body, properties=properties)
+
+        if not confirmed and on_nack:
+            on_nack()
+
+    def confirm_delivery(self, window):
+
+        if not isinstance(window, int):
+            raise TypeError(expected_type=int, actual_type=type(window))
+
+        if window < 1:
+            raise ValueError(expected_value='positive integer', actual_value=window)
+
+        if not self._confirm_window:
+            self._call('confirm_delivery')
+
+        self._confirm_window = window
+
+    def wait_for_confirms(self, timeout=None):
+
+        # Messages are confirmed as they are published
+        return True
+
+    def get(self, queue):
+
+        method_frame, header_frame, body = self._call('basic_get', queue=queue)
+
+        if method_frame:
+            return (self._generation, method_frame.delivery_tag), body
+
+        return None, None
+
+    def _consume(self, queue, prefetch_count):
+
+        self._mq_channel.basic_qos(prefetch_count=prefetch_count)
+        self._consumer_tags.append(self._mq_channel.basic_consume(self._on_message, queue=queue))
+
+    def consume(self, queue, prefetch_count):
+
+        self._consumed.append((queue, prefetch_count))
+
+        try:
+            self._consume(queue, prefetch_count)
+
+        except RECONNECT_ERRORS, ex:
+            self._reconnect(ex)
+
+    def _on_message(self, channel, method_frame, header_frame, body):
+
+        self._deliveries.append(((self._generation, method_frame.delivery_tag), body))
+
+    def next_delivery(self, timeout):
+
+        if not self._deliveries:
+
+            try:
+                self._mq_connection.process_data_events(time_limit=timeout)
+
+            except RECONNECT_ERRORS, ex:
+                self._reconnect(ex)
+
+        if not self._deliveries:
+            return None, None
+
+        return self._deliveries.popleft()
+
+    def ack(self, delivery_tag, multiple=False):
+
+        generation, delivery_tag = delivery_tag
+
+        if generation != self._generation:
+            return
+
+        try:
+            self._mq_channel.basic_ack(delivery_tag=delivery_tag, multiple=multiple)
+
+        except RECONNECT_ERRORS, ex:
+            self._reconnect(ex)
+
+    def cancel(self):
+
+        for consumer_tag in self._consumer_tags:
+            self._mq_channel.basic_cancel(consumer_tag)
+
+        # Requeue the messages delivered and not acknowledged, so that they are not held
+        # by the channel while it is in the pool. Those include messages taken from the
+        # channel by a thread that failed while processing them, which a thread reusing
+        # the connection would otherwise acknowledge with its own.
+        self._mq_channel.basic_nack(delivery_tag=0, multiple=True, requeue=True)
+
+        self._consumed = list()
+        self._consumer_tags = list()
+        self._deliveries.clear()
+
+    def close(self):
+
+        """
+        Return the connection to the pool, closing it if it is broken or if the channel
+        is in confirm mode, which can not be turned off
+        """
+
+        try:
+            self.cancel()
+
+        except Exception:
+            try:
+                self._mq_connection.close()
+            except Exception:
+                pass
+            return
+
+        if self._confirm_window:
+            try:
+                self._mq_connection.close()
+            except Exception:
+                pass
+            return
+
+        self._pool.release(self._mq_connection, self._mq_channel)
+
+
+class LocalChannel(Channel):
+
+    """
+    Channel to the queues of a LocalTransport. Messages are removed from their queue
+    when they are delivered, and appended to it again if they are not acknowledged
+    when the channel is cancelled or closed. A published message may take a moment to
+    become visible to get(), which does not block. Message priorities are ignored.
+    """
+
+    # Seconds to block on one queue when waiting for messages of multiple queues
+    SLICE = 0.01
+
+    def __init__(self, transport):
+
+        self._transport = transport
+        self._consumed = list()
+        self._cur_queue = 0
+        self._delivery_tag = 0
+
+        # Delivery tag -> (queue, body) of the messages not acknowledged yet
+        self._unacked = OrderedDict()
+
+    def declare_queue(self, queue, priorities=False):
+
+        if queue not in self._transport._queues:
+            self._transport._queues[queue] = mp.Queue()
+
+    def delete_queue(self, queue):
+
+        self._transport._queues.pop(queue, None)
+
+    def declare_fanout(self, exchange, queues):
+
+        self._transport._exchanges[exchange] = list(queues)
+
+    def publish(self, routing_key, body, exchange='', priority=0, on_nack=None,
+                timeout=None):
+
+        if exchange:
+            for queue in self._transport._exchanges[exchange]:
+                self._transport._queues[queue].put(body)
+        else:
+            self._transport._queues[routing_key].put(body)
+
+    def _get(self, queue, timeout=None):
+
+        try:
+            if timeout:
+                body = self._transport._queues[queue].get(timeout=timeout)
+            else:
+                body = self._transport._queues[queue].get_nowait()
+
+        except Queue.Empty:
+            return None, None
+
+        self._delivery_tag += 1
+        self._unacked[self._delivery_tag] = (queue, body)
+        return self._delivery_tag, body
+
+    def get(self, queue):
+
+        return self._get(queue)
+
+    def consume(self, queue, prefetch_count):
+
+        self._consumed.append(queue)
+
+    def next_delivery(self, timeout):
+
+        if len(self._consumed) == 1:
+            return self._get(self._consumed[0], timeout)
+
+        # Check all consumed queues, then block on them in turn
+        end = time.time() + timeout
+
+        while True:
+
+            for i in range(len(self._consumed)):
+
+                queue = self._consumed[self._cur_queue]
+                self._cur_queue = (self._cur_queue + 1) % len(self._consumed)
+
+                delivery_tag, body = self._get(queue)
+                if body is not None:
+                    return delivery_tag, body
+
+            if time.time() >= end:
+                return None, None
+
+            delivery_tag, body = self._get(self._consumed[self._cur_queue], self.SLICE)
+            if body is not None:
+                return delivery_tag, body
+
+    def ack(self, delivery_tag, multiple=False):
+
+        _remove_acked(self._unacked, delivery_tag, multiple)
+
+    def cancel(self):
+
+        for queue, body in self._unacked.itervalues():
+            if queue in self._transport._queues:
+                self._transport._queues[queue].put(body)
+
+        self._consumed = list()
+        self._unacked = OrderedDict()
+
+    def close(self):
+
+        self.cancel()
+
+
+class ZMQChannel(Channel):
+
+    """
+    Channel to the queues of a ZMQTransport. A queue is an ipc endpoint, bound by the
+    PULL socket of its consumer and connected to by the PUSH sockets of its producers,
+    so each queue has a single consumer. Messages published before the consumer bound
+    the endpoint are held by the producer. Fanout exchanges push each message to all
+    their queues.
+
+    Messages are removed from their queue when they are delivered, acknowledgements
+    have no effect. Messages held by a consumer socket are lost when it is closed, and
+    so are the messages it delivered and that were not acknowledged: a worker restarted
+    in place of one that failed does not receive the messages the failed worker did
+    not process. Message priorities are ignored.
+
+    The context and the sockets are created when the channel is first used by a
+    process. A channel used by a child process drops those of its parent without
+    closing them, and creates its own.
+    """
+
+    def __init__(self, transport):
+
+        self._transport = transport
+        self._pid = None
+        self._reset()
+
+        self._delivery_tag = 0
+
+    def _reset(self):
+
+        # Terminating its own context on close() ensures the messages published on
+        # the channel are sent, even if the process exits right after
+        self._context = None
+
+        # PUSH socket per queue published to
+        self._push = dict()
+
+        # PULL socket per queue read from, and those consumed
+        self._pull = dict()
+        self._consumed = list()
+        self._poller = zmq.Poller()
+
+    def _check_process(self):
+
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._reset()
+            self._context = zmq.Context()
+
+    def declare_queue(self, queue, priorities=False):
+
+        pass
+
+    def delete_queue(self, queue):
+
+        pass
+
+    def declare_fanout(self, exchange, queues):
+
+        self._transport._exchanges[exchange] = list(queues)
+
+    def _socket(self, socket_type):
+
+        socket = self._context.socket(socket_type)
+        socket.setsockopt(zmq.LINGER, ZMQ_LINGER)
+        return socket
+
+    def publish(self, routing_key, body, exchange='', priority=0, on_nack=None,
+                timeout=None):
+
+        if exchange:
+            for queue in self._transport._exchanges[exchange]:
+                self.publish(queue, body, priority=priority)
+            return
+
+        self._check_process()
+
+        if routing_key not in self._push:
+            self._push[routing_key] = self._socket(zmq.PUSH)
+            self._push[routing_key].connect(self._transport._endpoint(routing_key))
+
+        self._push[routing_key].send(body)
+
+    def _bind(self, queue, hwm=None):
+
+        self._check_process()
+
+        if queue not in self._pull:
+
+            self._pull[queue] = self._socket(zmq.PULL)
+            if hwm:
+                self._pull[queue].setsockopt(zmq.RCVHWM, hwm)
+            self._pull[queue].bind(self._transport._endpoint(queue))
+
+        return self._pull[queue]
+
+    def _recv(self, socket):
+
+        try:
+            body = socket.recv(zmq.NOBLOCK)
+        except zmq.Again:
+            return None, None
+
+        self._delivery_tag += 1
+        return self._delivery_tag, body
+
+    def get(self, queue):
+
+        return self._recv(self._bind(queue))
+
+    def consume(self, queue, prefetch_count):
+
+        socket = self._bind(queue, prefetch_count)
+        self._consumed.append(socket)
+        self._poller.register(socket, zmq.POLLIN)
+
+    def next_delivery(self, timeout):
+
+        if self._pid != os.getpid() or not self._consumed:
+            time.sleep(timeout)
+            return None, None
+
+        ready = dict(self._poller.poll(timeout*1000))
+
+        for socket in self._consumed:
+            if socket in ready:
+                delivery_tag, body = self._recv(socket)
+                if body is not None:
+                    # Serve the other queues first next time
+                    self._consumed.remove(socket)
+                    self._consumed.append(socket)
+                    return delivery_tag, body
+
+        return None, None
+
+    def ack(self, delivery_tag, multiple=False):
+
+        pass
+
+    def cancel(self):
+
+        if self._pid != os.getpid():
+            return
+
+        for socket in self._consumed:
+            self._poller.unregister(socket)
+
+        self._consumed = list()
+
+    def close(self):
+
+        if self._pid != os.getpid():
+            return
+
+        self.cancel()
+
+        # The endpoints are removed first, so that producers do not connect to the
+        # listening socket a child process inherited and does not serve (see 
+        # ZMQTransport)
+        for queue in self._pull:
+            try:
+                os.unlink(self._transport._ipc_path(queue))
+            except OSError:
+                pass
+
+        for socket in self._push.values() + self._pull.values():
+            socket.close()
+
+        self._context.term()
+        self._pid = None
+        self._reset()
+
+
+class ShmChannel(Channel):
+
+    """
+    Channel to the queues of a ShmTransport. Messages are removed from their queue
+    when they are delivered, and appended to it again if they are not acknowledged
+    when the channel is cancelled or closed and the queue has space for them. Message
+    priorities are ignored.
+    """
+
+    # Seconds to block on one queue when waiting for messages of multiple queues
+    SLICE = 0.001
+
+    def __init__(self, transport):
+
+        self._transport = transport
+        self._consumed = list()
+        self._cur_queue = 0
+        self._delivery_tag = 0
+
+        # Delivery tag -> (queue, body) of the messages not acknowledged yet
+        self._unacked = OrderedDict()
+
+    def declare_queue(self, queue, priorities=False):
+
+        if queue not in self._transport._queues:
+            self._transport._queues[queue] = RingBuffer(self._transport._slots,
+                                                        self._transport._slot_size)
+
+    def delete_queue(self, queue):
+
+        self._transport._queues.pop(queue, None)
+
+    def declare_fanout(self, exchange, queues):
+
+        self._transport._exchanges[exchange] = list(queues)
+
+    def publish(self, routing_key, body, exchange='', priority=0, on_nack=None,
+                timeout=None):
+
+        # Fanout exchanges wait till all their queues have space
+        if exchange:
+            for queue in self._transport._exchanges[exchange]:
+                self._transport._queues[queue].put(body)
+
+        elif not self._transport._queues[routing_key].put(body, timeout):
+            raise QueueFullError(queue=routing_key)
+
+    @property
+    def max_message_size(self):
+
+        return max_message_size(self._transport._slots, self._transport._slot_size)
+
+    def _get(self, queue, timeout=0):
+
+        body = self._transport._queues[queue].get(timeout)
+
+        if body is None:
+            return None, None
+
+        self._delivery_tag += 1
+        self._unacked[self._delivery_tag] = (queue, body)
+        return self._delivery_tag, body
+
+    def get(self, queue):
+
+        return self._get(queue)
+
+    def consume(self, queue, prefetch_count):
+
+        self._consumed.append(queue)
+
+    def next_delivery(self, timeout):
+
+        if len(self._consumed) == 1:
+            return self._get(self._consumed[0], timeout)
+
+        # Check all consumed queues, then block on them in turn
+        end = time.time() + timeout
+
+        while True:
+
+            for i in range(len(self._consumed)):
+
+                queue = self._consumed[self._cur_queue]
+                self._cur_queue = (self._cur_queue + 1) % len(self._consumed)
+
+                delivery_tag, body = self._get(queue)
+                if body is not None:
+                    return delivery_tag, body
+
+            if time.time() >= end:
+                return None, None
+
+            delivery_tag, body = self._get(self._consumed[self._cur_queue], self.SLICE)
+            if body is not None:
+                return delivery_tag, body
+
+    def ack(self, delivery_tag, multiple=False):
+
+        _remove_acked(self._unacked, delivery_tag, multiple)
+
+    def cancel(self):
+
+        # Without waiting for space, the consumer that would make space may be the
+        # worker that failed
+        for queue, body in self._unacked.itervalues():
+            if queue in self._transport._queues:
+                self._transport._queues[queue].put(body, 0)
+
+        self._consumed = list()
+        self._unacked = OrderedDict()
+
+    def close(self):
+
+        self.cancel()
+
+
+class Transport(object):
+
+    """
+    A Transport creates the channels of the components of an application manager
+    """
+
+    name = None
+
+    def channel(self):
+
+        raise NotImplementedError(method_name='channel', class_name=type(self).__name__)
+
+    @property
+    def max_in_flight(self):
+
+        """
+        Default maximum number of tasks in flight per WFprocessor process, for transports
+        whose queues hold a bounded number of messages
+
+        :getter: Returns an integer, None for no limit
+        """
+
+        return None
+
+    @property
+    def stats(self):
+
+        """
+        Connections of this process opened, reused and reopened after they failed, for
+        transports with connections
+
+        :getter: Returns a dictionary
+        """
+
+        return dict()
+
+    def close(self):
+
+        pass
+
+
+class RabbitMQTransport(Transport):
+
+    """
+    Transport over the queues of a RabbitMQ server. The channels of a process share a
+    pool of connections (see ConnectionPool).
+
+    :hostname: host the RabbitMQ server is running on
+    """
+
+    name = RABBITMQ
+
+    def __init__(self, hostname='localhost'):
+
+        if not isinstance(hostname, str):
+            raise TypeError(expected_type=str, actual_type=type(hostname))
+
+        self._pool = ConnectionPool(hostname, ru.get_logger('radical.entk.transport'))
+
+    @property
+    def stats(self):
+
+        return self._pool.stats
+
+    def channel(self):
+
+        return RabbitMQChannel(self._pool)
+
+
+class LocalTransport(Transport):
+
+    """
+    Transport over multiprocessing queues, for the processes of one application
+    manager on one host, without a broker. Queues and exchanges have to be declared
+    before the processes using them are started, which inherit them.
+    """
+
+    name = LOCAL
+
+    def __init__(self):
+
+        self._queues = dict()
+        self._exchanges = dict()
+
+    def channel(self):
+
+        return LocalChannel(self)
+
+
+class ZMQTransport(Transport):
+
+    """
+    Transport over ZeroMQ sockets on ipc endpoints, for the processes of one application
+    manager on one host, without a broker. Requires pyzmq. Exchanges have to be declared
+    before the processes using them are started, which inherit them.
+
+    A child process does not use the sockets of its parent: each channel creates its
+    context and sockets in the process it is used in (see ZMQChannel). A child still
+    holds the file descriptors of the sockets its parent had when it was forked. So 
+    that producers do not connect to an inherited listening socket nobody serves, and
+    hold their messages till their linger expires when they are closed, a consumer
+    removes the endpoint of its queue before it closes its socket.
+
+    :path: directory holding the ipc endpoints, a new temporary directory if None
+    """
+
+    name = ZMQ
+
+    def __init__(self, path=None):
+
+        if zmq is None:
+            raise ImportError('The zmq transport requires pyzmq')
+
+        if path is None:
+            path = tempfile.mkdtemp(prefix='radical.entk.zmq.')
+            self._tmp_path = True
+        else:
+            self._tmp_path = False
+
+        if not isinstance(path, str):
+            raise TypeError(expected_type=str, actual_type=type(path))
+
+        self._path = path
+        self._exchanges = dict()
+
+    def _ipc_path(self, queue):
+
+        path = os.path.join(self._path, queue)
+
+        # Paths of unix sockets are limited to about 100 characters
+        if len(path) > ZMQ_MAX_PATH:
+            path = os.path.join(self._path, hashlib.md5(queue).hexdigest())
+
+        return path
+
+    def _endpoint(self, queue):
+
+        return 'ipc://%s'%self._ipc_path(queue)
+
+    def channel(self):
+
+        return ZMQChannel(self)
+
+    def close(self):
+
+        """
+        Remove the temporary directory of the ipc endpoints
+        """
+
+        if self._tmp_path:
+            shutil.rmtree(self._path, ignore_errors=True)
+
+
+class ShmTransport(Transport):
+
+    """
+    Transport over ring buffers in shared memory (see ring.RingBuffer), for the
+    processes of one application manager on one host, without a broker. Queues and
+    exchanges have to be declared before the processes using them are started, which
+    inherit them. Each queue has a single consumer. Queues hold a bounded number of
+    messages, the tasks in flight of an application manager using the transport are
+    bounded by default (see max_in_flight).
+
+    :slots: number of slots of each queue
+    :slot_size: bytes per slot
+    """
+
+    name = SHM
+
+    def __init__(self, slots=4096, slot_size=256):
+
+        for value in [slots, slot_size]:
+            if not isinstance(value, int):
+                raise TypeError(expected_type=int, actual_type=type(value))
+
+        self._slots = slots
+        self._slot_size = slot_size
+        self._queues = dict()
+        self._exchanges = dict()
+
+    @property
+    def max_in_flight(self):
+
+        """
+        Number of tasks whose messages fit a queue, at SHM_TASK_BYTES per task
+        """
+
+        return max(1, self._slots*self._slot_size/SHM_TASK_BYTES)
+
+    def channel(self):
+
+        return ShmChannel(self)
+
+
+def get_transport(transport, hostname='localhost'):
+
+    """
+    Resolve a transport
+
+    :arguments: transport name or transport object, host of the RabbitMQ server
+    :return: transport object
+    """
+
+    if isinstance(transport, Transport):
+        return transport
+
+    if transport == RABBITMQ:
+        return RabbitMQTransport(hostname)
+
+    if transport == LOCAL:
+        return LocalTransport()
+
+    if transport == ZMQ:
+        return ZMQTransport()
+
+    if transport == SHM:
+        return ShmTransport()
+
+    raise ValueError(expected_value=TRANSPORTS, actual_value=transport)
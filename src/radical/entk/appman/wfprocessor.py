@@ -6,19 +6,37 @@ import radical.utils as ru
 from radical.entk.exceptions import *
 from multiprocessing import Process, Event
 from radical.entk import states, Pipeline, Task
+from consumer import Consumer, PUSH, INACTIVITY_TIMEOUT
+from batch import Batcher, pack, unpack, state_notification, submit_notification
+from codec import JSON
+from supervisor import Supervisor, MAX_RESTARTS
+from engine import THREADS, LOOP, ENGINES
+from flow import Credits
+from collections import deque
+from functools import partial
+from shard import get_shard
 import time
 from time import sleep
 import json
 import threading
-import pika
+import Queue
+from transport import get_transport, RABBITMQ
 import traceback
 import os
 
 slow_run = os.environ.get('RADICAL_ENTK_SLOW',False)
 
+# Codes of the task states holding a credit
+IN_FLIGHT_CODES = frozenset([states.QUEUED_CODE, states.EXECUTING_CODE])
+
 class WFprocessor(object):
 
-    def __init__(self, workflow, pending_queue, completed_queue, mq_hostname):
+    def __init__(self, workflow, pending_queue, completed_queue, mq_hostname, sync_queue=None,
+                push_threads=1, pull_threads=1, consumer_mode=PUSH, prefetch_count=64, 
+                batch_size=None, batch_linger=0, codec=JSON, max_restarts=MAX_RESTARTS,
+                transport=RABBITMQ, engine=THREADS, max_in_flight=None, 
+                pipeline_in_flight=None, compress_threshold=None, confirm_window=None,
+                resubmit_failed=False):
 
         self._uid           = ru.generate_id('radical.entk.wfprocessor')        
         self._logger        = ru.get_logger('radical.entk.wfprocessor')
@@ -33,13 +51,72 @@ class WFprocessor(object):
         if not isinstance(mq_hostname,str):
             raise TypeError(expected_type=str, actual_type=type(mq_hostname))
 
+        for count in [push_threads, pull_threads]:
+            if not isinstance(count, int):
+                raise TypeError(expected_type=int, actual_type=type(count))
+            if count < 1:
+                raise ValueError(expected_value='positive integer', actual_value=count)
+
         # Mqs queue names and channel
         self._pending_queue = pending_queue
         self._completed_queue = completed_queue
         self._mq_hostname = mq_hostname
 
+        # Transport the queues are declared on
+        self._transport = get_transport(transport, mq_hostname)
+
+        # Queues the AppManager's synchronizer threads receive the state transitions
+        # applied by this WFprocessor from, none to not publish them
+        if sync_queue is None:
+            sync_queue = list()
+        if not isinstance(sync_queue,list):
+            raise TypeError(expected_type=list, actual_type=type(sync_queue))
+        self._sync_queue = sync_queue
+
+        if engine not in ENGINES:
+            raise ValueError(expected_value=ENGINES, actual_value=engine)
+        self._engine = engine
+
+        # Each enqueue thread owns the pipelines of a shard, each dequeue thread
+        # owns a shard of the completed queues. The event loop handles all shards.
+        if self._engine == LOOP:
+            push_threads = pull_threads = 1
+
+        self._num_push_threads = push_threads
+        self._num_pull_threads = min(pull_threads, len(self._completed_queue))
+
+        # Consumption of the completed queue
+        self._consumer_mode = consumer_mode
+        self._prefetch_count = prefetch_count
+
+        # Publication of tasks to the pending queue
+        self._batch_size = batch_size
+        self._batch_linger = batch_linger
+        self._codec = codec
+        self._compress_threshold = compress_threshold
+        self._confirm_window = confirm_window
+
+        # Bytes of the task messages published, summed over the enqueue threads when
+        # they terminate
+        self._message_stats = dict()
+        self._message_stats_lock = threading.Lock()
+
+        # Maximum number of restarts of each enqueue and dequeue thread
+        self._max_restarts = max_restarts
+
         self._wfp_process = None       
-        self._resubmit_failed = False       
+
+        # Whether failed tasks are resubmitted as replicas to their stage
+        self._resubmit_failed = resubmit_failed
+
+        # Workflow-wide task index: task uid -> (task, stage, pipeline), and pipelines
+        # by uid
+        self._task_index = dict()
+        self._pipes = dict()
+
+        # Bound of the tasks in flight, and per stage the tasks not submitted yet
+        self._credits = Credits(max_in_flight, pipeline_in_flight)
+        self._backlog = dict()
 
         self._logger.info('Created WFProcessor object: %s'%self._uid)
     
@@ -52,11 +129,16 @@ class WFprocessor(object):
             try:
                 self._wfp_process = Process(target=self.wfp_process, name='wfprocessor')
 
-                self._enqueue_thread = None
-                self._dequeue_thread = None
+                self._enqueue_threads = [None]*self._num_push_threads
+                self._dequeue_threads = [None]*self._num_pull_threads
                 self._enqueue_thread_terminate = threading.Event()
                 self._dequeue_thread_terminate = threading.Event()
 
+                # Per enqueue thread: pipelines whose current stage is ready to be
+                # submitted, as (priority, time made ready, pipeline) tuples, highest 
+                # priority first (see Pipeline._notify_ready())
+                self._ready_queues = [Queue.PriorityQueue() for i in range(self._num_push_threads)]
+
                 self._wfp_terminate = Event()
                 self._logger.info('Starting WFprocessor process')
                 self._wfp_process.start()                
@@ -114,6 +196,107 @@ class WFprocessor(object):
             raise
 
 
+    def _index_workflow(self):
+
+        """
+        Build the task index over this process' copy of the workflow, so that
+        completed tasks can be mapped to their task, stage and pipeline in O(1). The
+        tasks a previous process of the shard submitted and that did not complete yet
+        hold credits, as if this process had submitted them.
+        """
+
+        self._task_index = dict()
+        for pipe in self._workflow:
+            pipe._assign_index(self._task_index)
+
+        self._pipes = dict((pipe.uid, pipe) for pipe in self._workflow)
+
+        # Their completions release credits, repeated completions are ignored
+        in_flight = dict()
+        for task, stage, pipe in self._task_index.itervalues():
+            if task._state_code in IN_FLIGHT_CODES:
+                in_flight[pipe.uid] = in_flight.get(pipe.uid, 0) + 1
+
+        for uid, count in in_flight.iteritems():
+            self._credits.hold(uid, count)
+
+
+    def _setup_ready_queue(self):
+
+        """
+        Let the pipelines of this process' copy of the workflow push themselves onto
+        the ready queue of the enqueue thread owning them when a new stage becomes
+        executable, and push all pipelines that have not completed yet
+        """
+
+        for pipe in self._workflow:
+            pipe._assign_ready_queue(self._ready_queues[get_shard(pipe.uid, self._num_push_threads)])
+            if not pipe._completed:
+                pipe._notify_ready()
+
+
+    def _start_enqueue_thread(self, shard):
+
+        self._enqueue_threads[shard] = threading.Thread(target=self.enqueue, args=(shard,),
+                                                        name='enqueue-thread-%s'%shard)
+        self._enqueue_threads[shard].start()
+
+
+    def _start_dequeue_thread(self, shard):
+
+        self._dequeue_threads[shard] = threading.Thread(target=self.dequeue, args=(shard,),
+                                                        name='dequeue-thread-%s'%shard)
+        self._dequeue_threads[shard].start()
+
+
+    def _thread_alive(self, threads, shard):
+
+        return threads[shard] is not None and threads[shard].is_alive()
+
+
+    def _create_supervisor(self):
+
+        """
+        Supervisor of the enqueue and dequeue threads
+        """
+
+        supervisor = Supervisor('WFprocessor', self._logger, self._max_restarts)
+
+        for i in range(self._num_pull_threads):
+            supervisor.add( 'dequeue-thread-%s'%i, 
+                            partial(self._start_dequeue_thread, i),
+                            partial(self._thread_alive, self._dequeue_threads, i))
+
+        for i in range(self._num_push_threads):
+            supervisor.add( 'enqueue-thread-%s'%i, 
+                            partial(self._start_enqueue_thread, i),
+                            partial(self._thread_alive, self._enqueue_threads, i))
+
+        return supervisor
+
+
+    def _terminate_enqueue_threads(self):
+
+        self._enqueue_thread_terminate.set()
+
+        # Wake up the enqueue threads blocked on the ready queues
+        for ready_queue in self._ready_queues:
+            ready_queue.put(None)
+
+        for thread in self._enqueue_threads:
+            if thread:
+                thread.join()
+
+
+    def _terminate_dequeue_threads(self):
+
+        self._dequeue_thread_terminate.set()
+
+        for thread in self._dequeue_threads:
+            if thread:
+                thread.join()
+
+
     def wfp_process(self):
 
         try:
@@ -121,23 +304,27 @@ class WFprocessor(object):
             # Process should run till terminate condtion is encountered
             self._logger.info('WFprocessor started')
 
-            while (not self._wfp_terminate.is_set()):
+            self._index_workflow()
+            self._setup_ready_queue()
 
-                try:
+            if self._engine == LOOP:
+                # Failures end the process, which is restarted by the AppManager
+                self.event_loop()
+                self._logger.info('Tasks in flight: %s'%self._credits.stats)
+                self._logger.info('Task messages: %s'%self._message_stats)
+                self._logger.info('Transport connections: %s'%self._transport.stats)
+                return
 
-                    # Start dequeue thread
-                    if (not self._dequeue_thread) or (not self._dequeue_thread.is_alive()):
-                        self._dequeue_thread = threading.Thread(target=self.dequeue, name='dequeue-thread')
+            supervisor = self._create_supervisor()
 
-                        self._logger.info('Starting dequeue thread')
-                        self._dequeue_thread.start()
+            while (not self._wfp_terminate.is_set()):
 
-                    # Start enqueue thread
-                    if (not self._enqueue_thread) or (not self._enqueue_thread.is_alive()):
-                        self._enqueue_thread = threading.Thread(target=self.enqueue, name='enqueue-thread')
+                try:
 
-                        self._logger.info('Starting enqueue thread')
-                        self._enqueue_thread.start()
+                    # (Re)start threads, then block till termination or till the next
+                    # check of the threads is due
+                    timeout = supervisor.check()
+                    self._wfp_terminate.wait(timeout)
 
                 except KeyboardInterrupt:
                     raise KeyboardInterrupt
@@ -146,12 +333,16 @@ class WFprocessor(object):
                     self._logger.error('WFProcessor interrupted')
                     raise
 
-            self._logger.info('Terminating enqueue thread')
-            self._enqueue_thread_terminate.set()
-            self._enqueue_thread.join()
-            self._logger.info('Terminating dequeue thread')
-            self._dequeue_thread_terminate.set()
-            self._dequeue_thread.join()              
+            self._logger.info('Thread restarts: %s'%supervisor.restarts)
+
+            self._logger.info('Terminating enqueue threads')
+            self._terminate_enqueue_threads()
+            self._logger.info('Terminating dequeue threads')
+            self._terminate_dequeue_threads()
+
+            self._logger.info('Tasks in flight: %s'%self._credits.stats)
+            self._logger.info('Task messages: %s'%self._message_stats)
+            self._logger.info('Transport connections: %s'%self._transport.stats)
 
         except KeyboardInterrupt:
 
@@ -159,14 +350,12 @@ class WFprocessor(object):
                                 'trying to cancel wfprocessor process gracefully...')
 
             if not self._enqueue_thread_terminate.is_set():
-                self._logger.info('Terminating enqueue thread')
-                self._enqueue_thread_terminate.set()
-                self._enqueue_thread.join()
+                self._logger.info('Terminating enqueue threads')
+                self._terminate_enqueue_threads()
 
             if not self._dequeue_thread_terminate.is_set():
-                self._logger.info('Terminating dequeue thread')
-                self._dequeue_thread_terminate.set()
-                self._dequeue_thread.join()
+                self._logger.info('Terminating dequeue threads')
+                self._terminate_dequeue_threads()
 
             self._logger.info('WFprocessor process terminated')
 
@@ -178,291 +367,501 @@ class WFprocessor(object):
             print traceback.format_exc()
 
             if not self._enqueue_thread_terminate.is_set():
-                self._logger.info('Terminating enqueue thread')
-                self._enqueue_thread_terminate.set()
-                self._enqueue_thread.join()
+                self._logger.info('Terminating enqueue threads')
+                self._terminate_enqueue_threads()
 
             if not self._dequeue_thread_terminate.is_set():
-                self._logger.info('Terminating dequeue thread')
-                self._dequeue_thread_terminate.set()
-                self._dequeue_thread.join()
+                self._logger.info('Terminating dequeue threads')
+                self._terminate_dequeue_threads()
 
             self._logger.info('WFprocessor process terminated')
 
             raise UnknownError(text=ex)           
 
 
-    def enqueue(self):
+    def enqueue(self, shard=0):
+
+        """
+        Thread submitting the ready stages of the pipelines of a shard
+
+        :arguments: shard owned by this thread
+        """
 
         try:
 
-            self._logger.info('Enqueue thread started')
+            self._logger.info('Enqueue thread %s started'%shard)
 
-            mq_connection = pika.BlockingConnection(pika.ConnectionParameters(host=self._mq_hostname))
-            mq_channel = mq_connection.channel()
+            ready_queue = self._ready_queues[shard]
 
-            while not self._enqueue_thread_terminate.is_set():
+            mq_channel = self._transport.channel()
 
-                for pipe in self._workflow:
+            batcher = Batcher(  mq_channel, '', self._batch_size, self._batch_linger, 
+                                partial(self._roll_back_tasks, mq_channel), self._codec, 
+                                self._compress_threshold, self._confirm_window,
+                                partial(self._notify_tasks, mq_channel), self._task_lock)
 
-                    with pipe._stage_lock:
+            while not self._enqueue_thread_terminate.is_set():
 
-                        if not pipe._completed:
-    
-                            self._logger.debug('Pipe %s lock acquired'%(pipe.uid))
-    
-                            # Update corresponding pipeline's state
-                            if not pipe.state == states.SCHEDULED:
-                                pipe.state = states.SCHEDULED
-    
-                            if pipe.stages[pipe._current_stage].state in [states.NEW]:
-    
-                                executable_stage = pipe.stages[pipe._current_stage]
-                                executable_tasks = executable_stage.tasks
-    
-                                try:
+                # Block till a pipeline has a stage ready for execution, or till 
+                # the current batch of tasks has to be published
+                try:
+                    item = ready_queue.get(timeout=batcher.linger_timeout())
 
-                                    tasks_submitted=False
-    
-                                    for executable_task in executable_tasks:
-    
-                                        if executable_task.state == states.NEW:
-                                            
-                                            self._logger.debug('Task: %s,%s ; Stage: %s; Pipeline: %s'%(
-                                                                executable_task.uid,
-                                                                executable_task.state,
-                                                                executable_task._parent_stage,
-                                                                executable_task._parent_pipeline))
-    
-                                            # Try-exception block for tasks
-                                            try:
-    
-                                                # Update specific task's state if put to pending_queue
-                                                executable_task.state = states.QUEUED
-    
-                                                task_as_dict = json.dumps(executable_task.to_dict())
-    
-                                                self._logger.debug('Publishing task %s to %s'
-                                                                            %(executable_task.uid,
-                                                                                self._pending_queue[0])
-                                                                        )
-
-                                                mq_channel.basic_publish( exchange='',
-                                                                                routing_key=self._pending_queue[0],
-                                                                                body=task_as_dict
-                                                                                #properties=pika.BasicProperties(
-                                                                                # make message persistent
-                                                                                #delivery_mode = 2, 
-                                                                                #)
-                                                                            )
-
-                                                tasks_submitted = True
-                                                self._logger.debug('Task %s published to queue'% executable_task.uid)
-                                                
-                                                # Update corresponding stage's state
-                                                if not pipe.stages[pipe._current_stage].state == states.SCHEDULED:
-                                                    pipe.stages[pipe._current_stage].state = states.SCHEDULED
-    
-                                            except Exception, ex:
-    
-                                                # Rolling back queue status
-                                                self._logger.error('Error while updating task '+
-                                                                    'state, rolling back. Error: %s'%ex)
-                                               
-                                                # Revert task status
-                                                executable_task.state = states.NEW
-                                                raise # should go to the next exception
-                                    
-                                    if tasks_submitted:
-                                        self._logger.info('Stage %s of Pipeline %s: %s'%(
-                                                            pipe.stages[pipe._current_stage].uid,
-                                                            pipe.uid,
-                                                            pipe.stages[pipe._current_stage].state))
+                except Queue.Empty:
+                    batcher.flush()
+                    continue
 
-                                        tasks_submitted = False
+                if item is None:
+                    # Sentinel pushed on termination
+                    continue
 
-                                    if slow_run:
-                                        sleep(1)
-    
-                                                                                
-                                except Exception, ex:
-    
-                                    # Rolling back queue status
-                                    self._logger.error('Error while updating stage '+
-                                                        'state, rolling back. Error: %s'%ex)
-    
-                                    # Revert stage state
-                                    pipe.stages[pipe._current_stage].state = states.NEW   
-                                    raise   
+                priority, ready_time, pipe = item
 
-                            if slow_run:
-                                sleep(1)
+                self._submit_stage(pipe, ready_time, batcher, ready_queue)
+
+            batcher.close()
+            self._add_message_stats(batcher.stats)
 
             self._logger.info('Enqueue thread terminated')                                  
-            mq_connection.close()
+            mq_channel.close()
                                     
         except KeyboardInterrupt:
 
             self._logger.error('Execution interrupted by user (you probably hit Ctrl+C), '+
                                 'trying to cancel enqueuer thread gracefully...')
 
-            mq_connection.close()
+            mq_channel.close()
 
         except Exception, ex:
 
             self._logger.error('Unknown error in wfp process: %s. \n Closing all threads'%ex)
             print traceback.format_exc()
-            mq_connection.close()
+            mq_channel.close()
 
             raise UnknownError(text=ex) 
 
 
 
-    def dequeue(self):
+    def _add_message_stats(self, stats):
 
-        try:
+        """
+        Add the statistics of a Batcher (see Batcher.stats) to the ones of the process
+        """
 
-            self._logger.info('Dequeue thread started')
+        with self._message_stats_lock:
+            for key, value in stats.iteritems():
+                self._message_stats[key] = self._message_stats.get(key, 0) + value
 
-            mq_connection = pika.BlockingConnection(pika.ConnectionParameters(host=self._mq_hostname))
-            mq_channel = mq_connection.channel()
 
-            while not self._dequeue_thread_terminate.is_set():
+    def _submit_stage(self, pipe, ready_time, batcher, ready_queue):
 
-                try:
+        """
+        Submit the tasks of the current stage of a pipeline that was made ready
 
-                    method_frame, header_frame, body = mq_channel.basic_get(queue=self._completed_queue[0])
+        :arguments: Pipeline object, time it was made ready, Batcher the tasks are 
+                    added to, ready queue to put the pipeline back on if submission
+                    failed
+        """
 
-                    if body:
+        with pipe._stage_lock:
+
+            if not pipe._completed:
+
+                self._logger.debug('Pipe %s lock acquired'%(pipe.uid))
+
+                # Update corresponding pipeline's state
+                if not pipe.state == states.SCHEDULED:
+                    pipe.state = states.SCHEDULED
+
+                # Current stage is NEW when unblocked, SCHEDULED when failed tasks were
+                # resubmitted to it
+                if pipe.stages[pipe._current_stage].state in [states.NEW, states.SCHEDULED]:
+
+                    executable_stage = pipe.stages[pipe._current_stage]
+                    executable_tasks = executable_stage.tasks
+
+                    # All tasks of a pipeline go to the same pending queue
+                    pending_queue = self._pending_queue[get_shard(pipe.uid, len(self._pending_queue))]
+
+                    # Tasks of the stage not submitted yet, highest priority first, of which
+                    # as many are submitted as there are credits. The stage is scanned 
+                    # again for new tasks, e.g. resubmitted or rolled back ones, once they
+                    # have all been submitted.
+                    backlog = self._backlog.pop(executable_stage.uid, None)
+                    if not backlog:
+                        backlog = deque(sorted((task for task in executable_tasks 
+                                                    if task.state == states.NEW),
+                                                key=lambda task: -task.priority))
 
-                        # Get task from the message
-                        completed_task = Task()
-                        completed_task.load_from_dict(json.loads(body))
+                    granted = self._credits.acquire(pipe.uid, len(backlog))
+                    popped = 0
 
-                        self._logger.debug('Got finished task %s from queue'%(completed_task.uid))
+                    try:
 
-                        for pipe in self._workflow:
+                        tasks_submitted=False
 
-                            with pipe._stage_lock:
+                        while popped < granted:
 
-                                if not pipe._completed:
+                            executable_task = backlog.popleft()
+                            popped += 1
 
-                                    if completed_task._parent_pipeline == pipe.uid:
+                            if executable_task.state != states.NEW:
+                                self._release_credits(pipe, 1)
 
-                                        self._logger.debug('Found parent pipeline: %s'%pipe.uid)
+                            else:
+
+                                self._logger.debug('Task: %s,%s ; Stage: %s; Pipeline: %s'%(
+                                                    executable_task.uid,
+                                                    executable_task.state,
+                                                    executable_task._parent_stage,
+                                                    executable_task._parent_pipeline))
+
+                                # Try-exception block for tasks
+                                try:
+
+                                    # Update specific task's state if put to pending_queue
+                                    executable_task.state = states.QUEUED
+
+                                    self._logger.debug('Publishing task %s to %s'
+                                                                %(executable_task.uid,
+                                                                    pending_queue)
+                                                            )
+
+                                    # Published with the batch it is added to
+                                    batcher.add(executable_task, pending_queue, len(executable_tasks),
+                                                pipe.priority)
+
+                                    tasks_submitted = True
+
+                                    # Update corresponding stage's state
+                                    if not pipe.stages[pipe._current_stage].state == states.SCHEDULED:
+                                        pipe.stages[pipe._current_stage].state = states.SCHEDULED
+
+                                except Exception, ex:
+
+                                    # Rolling back queue status
+                                    self._logger.error('Error while updating task '+
+                                                        'state, rolling back. Error: %s'%ex)
+
+                                    # Revert task status
+                                    executable_task.state = states.NEW
+                                    raise # should go to the next exception
+
+                        if tasks_submitted:
+                            self._logger.info('Stage %s of Pipeline %s: %s'%(
+                                                pipe.stages[pipe._current_stage].uid,
+                                                pipe.uid,
+                                                pipe.stages[pipe._current_stage].state))
+
+                            self._logger.info('Stage %s of Pipeline %s submitted %.6f secs after ready'%(
+                                                pipe.stages[pipe._current_stage].uid,
+                                                pipe.uid,
+                                                time.time() - ready_time))
+
+                            tasks_submitted = False
+
+                        if backlog:
+                            self._backlog[executable_stage.uid] = backlog
+
+                        if slow_run:
+                            sleep(1)
+
+
+                    except Exception, ex:
+
+                        # Rolling back queue status
+                        self._logger.error('Error while updating stage '+
+                                            'state, rolling back. Error: %s'%ex)
+
+                        # Release the credits of the tasks not submitted, the credits of
+                        # the tasks of the batch that failed are released by its rollback
+                        self._release_credits(pipe, granted - popped)
+
+                        # Revert stage state and make the pipeline available to the
+                        # restarted enqueue thread
+                        pipe.stages[pipe._current_stage].state = states.NEW   
+                        ready_queue.put((pipe._ready_priority(), ready_time, pipe))
+                        raise   
+
+                if slow_run:
+                    sleep(1)
+
+
+    def _requeue_tasks(self, tasks):
+
+        """
+        Make the pipelines of tasks whose batch could not be published ready again, so
+        that the tasks are submitted once more
+        """
+
+        pipes = dict()
+        for task in tasks:
+            if task.uid in self._task_index:
+                pipe = self._task_index[task.uid][2]
+                pipes[pipe] = pipes.get(pipe, 0) + 1
+
+        for pipe, count in pipes.iteritems():
+            self._release_credits(pipe, count)
+            pipe._notify_ready()
+
+
+    def _task_lock(self, task):
+
+        """
+        Lock guarding the state of a task, the stage lock of its pipeline
+        """
+
+        return self._task_index[task.uid][2]._stage_lock
+
+
+    def _roll_back_tasks(self, mq_channel, tasks):
+
+        """
+        Notify and requeue the tasks of a batch that could not be published
+        """
+
+        self._notify_tasks(mq_channel, tasks)
+        self._requeue_tasks(tasks)
+
+
+    def _notify_tasks(self, mq_channel, tasks):
+
+        """
+        Publish the states of tasks whose batch was published or rolled back to the 
+        synchronizer queues, so that the AppManager's copy of the workflow, from which
+        a restarted WFprocessor is created, does not hold submitted tasks as NEW
+
+        :arguments: transport channel to publish on, list of Task objects
+        """
+
+        if not self._sync_queue:
+            return
+
+        notifications = dict()
+
+        for task in tasks:
+            pipe = self._task_index[task.uid][2]
+            sync_queue = self._sync_queue[get_shard(pipe.uid, len(self._sync_queue))]
+            notifications.setdefault(sync_queue, list()).append(submit_notification(task, pipe))
+
+        for sync_queue, queue_notifications in notifications.iteritems():
+            mq_channel.publish(sync_queue, pack(queue_notifications, self._codec))
+
+
+    def _release_credits(self, pipe, count):
+
+        """
+        Release the credits of tasks of a pipeline and make the pipelines waiting for
+        credits ready again
+        """
+
+        if count <= 0:
+            return
+
+        for uid in self._credits.release(pipe.uid, count):
+            self._pipes[uid]._notify_ready()
+
+
+    def _update_task(self, update):
+
+        """
+        Apply a state update of a task (see batch.state_update()) to the task of the 
+        workflow and progress its stage and pipeline
+
+        :return: notification of the resulting state transitions (see 
+                 batch.state_notification()), None if the update was not applied
+        """
+
+        uid = update['uid']
+
+        self._logger.debug('Got finished task %s from queue'%(uid))
+
+        if uid not in self._task_index:
+            self._logger.error('Task %s not found in workflow'%uid)
+
+        elif update.get('state') not in states.CODES:
+            self._logger.error('Task %s reported unknown state %s'%(uid, update.get('state')))
+
+        else:
+
+            task, stage, pipe = self._task_index[uid]
+
+            with pipe._stage_lock:
+
+                if not pipe._completed:
+
+                    self._logger.debug('Task: %s,%s ; Stage: %s; Pipeline: %s'%(
+                                            uid,
+                                            update['state'],
+                                            stage.uid,
+                                            pipe.uid)
+                                        )
+
+                    old_code = task._state_code
+                    new_code = states.CODES[update['state']]
+
+                    # Repeated or late updates, e.g. EXECUTING or DONE after DONE
+                    if old_code in states.FINAL_CODES or \
+                       not states.TASK_TRANSITIONS[old_code][new_code]:
+                        self._logger.warning('Ignoring transition of task %s from %s to %s'%(
+                                                uid, task.state, update['state']))
+                        return None
+
+                    task.state = states.STATES[new_code]
+                    if 'exit_code' in update:
+                        task._exit_code = update['exit_code']
+
+                    if old_code in IN_FLIGHT_CODES and new_code in states.FINAL_CODES:
+                        self._release_credits(pipe, 1)
+
+                    # Uid of the task resubmitted in place of this one
+                    replica = None
+
+                    if new_code == states.DONE_CODE:
+
+                        if stage._check_tasks_status():
+
+                            try:
+
+                                stage.state = states.DONE
+
+                                self._logger.info('Stage %s of Pipeline %s: %s'%(
+                                            stage.uid,
+                                            pipe.uid,
+                                            stage.state))
+
+                                pipe._increment_stage()
+
+                            except Exception, ex:
+                                # Rolling back stage status
+                                self._logger.error('Error while updating stage '+
+                                        'state, rolling back. Error: %s'%ex)
+                                stage.state = states.SCHEDULED
+                                pipe._decrement_stage()
+
+                                raise
+
+                            if pipe._completed:
+                                pipe.state = states.DONE
+                                self._logger.info('Pipeline %s: %s'%(
+                                                        pipe.uid, 
+                                                        pipe.state)
+                                                    )
+
+                    elif new_code == states.FAILED_CODE:
+
+                        if self._resubmit_failed:
+
+                            try:
+                                new_task = Task()
+                                new_task._replicate(task)
+
+                                pipe.stages[pipe._current_stage].add_tasks(new_task)
+                                pipe._notify_ready()
+                                replica = new_task.uid
+
+                            except Exception, ex:
+                                self._logger.error("Resubmission of task %s failed, error: %s"%
+                                                                (uid,ex))
+                                raise
+
+                        else:
+
+                            if stage._check_tasks_status():
+
+                                try:
                                 
-                                        for stage in pipe.stages:
+                                    stage.state = states.DONE
 
-                                            if completed_task._parent_stage == stage.uid:
-                                                self._logger.debug('Found parent stage: %s'%(stage.uid))
+                                    self._logger.info('Stage %s of Pipeline %s: %s'%(
+                                            stage.uid,
+                                            pipe.uid,
+                                            stage.state))
 
-                                                #task.state = states.DONE
-                                                self._logger.debug('Task: %s,%s ; Stage: %s; Pipeline: %s'%(
-                                                                        completed_task.uid,
-                                                                        completed_task.state,
-                                                                        pipe.stages[pipe._current_stage].uid,
-                                                                        pipe.uid)
-                                                                    )
+                                    pipe._increment_stage()
 
-                                                for task in stage.tasks:
+                                except Exception, ex:
+                                    # Rolling back stage status
+                                    self._logger.error('Error while updating stage '+
+                                                    'state, rolling back. Error: %s'%ex)
+                                    stage.state = states.SCHEDULED
+                                    pipe._decrement_stage()
 
-                                                    if task.uid == completed_task.uid:
-                                                        task.state = str(completed_task.state)
+                                    raise                                        
 
-                                                        if task.state == states.DONE:
+                                if pipe._completed:
+                                    pipe.state = states.DONE
+                                    self._logger.info('Pipeline %s: %s'%(
+                                                        pipe.uid, 
+                                                        pipe.state)
+                                                    )
 
-                                                            if stage._check_tasks_status():
+                    else:
 
-                                                                try:
+                        # Task is canceled
+                        pass
 
-                                                                    stage.state = states.DONE
+                    return state_notification(update, task, stage, pipe, replica)
 
-                                                                    self._logger.info('Stage %s of Pipeline %s: %s'%(
-                                                                                stage.uid,
-                                                                                pipe.uid,
-                                                                                stage.state))
 
-                                                                    pipe._increment_stage()
+    def _apply_updates(self, body, mq_channel):
 
-                                                                except Exception, ex:
-                                                                    # Rolling back stage status
-                                                                    self._logger.error('Error while updating stage '+
-                                                                            'state, rolling back. Error: %s'%ex)
-                                                                    stage.state = states.SCHEDULED
-                                                                    pipe._decrement_stage()
+        """
+        Apply the state updates of a message of the completed queues and publish the
+        resulting state transitions to the synchronizer queues
 
-                                                                    raise
+        :arguments: message body, transport channel to publish on
+        """
 
-                                                                if pipe._completed:
-                                                                    #self._workload.remove(pipe)                                                                    
-                                                                    pipe.state = states.DONE
-                                                                    self._logger.info('Pipeline %s: %s'%(
-                                                                                            pipe.uid, 
-                                                                                            pipe.state)
-                                                                                        )
+        # Notifications per synchronizer queue
+        notifications = dict()
 
-                                                        elif completed_task.state == states.FAILED:
+        for update in unpack(body):
 
-                                                            if self._resubmit_failed:
+            notification = self._update_task(update)
 
-                                                                try:
-                                                                    new_task = Task()
-                                                                    new_task._replicate(completed_task)
+            if notification and self._sync_queue:
+                sync_queue = self._sync_queue[get_shard(notification['pipeline'], 
+                                                        len(self._sync_queue))]
+                notifications.setdefault(sync_queue, list()).append(notification)
 
-                                                                    pipe.stages[pipe._current_stage].add_tasks(new_task)
+        for sync_queue, queue_notifications in notifications.iteritems():
+            mq_channel.publish(sync_queue, pack(queue_notifications, self._codec))
 
-                                                                except Exception, ex:
-                                                                    self._logger.error("Resubmission of task %s failed, error: %s"%
-                                                                                                    (completed_task.uid,ex))
-                                                                    raise
 
-                                                            else:
+    def dequeue(self, shard=0):
 
-                                                                if stage.check_tasks_status():
+        """
+        Thread applying the states of the tasks received on a shard of the completed
+        queues
 
-                                                                    try:
-                                                                    
-                                                                        stage.state = states.DONE
+        :arguments: shard owned by this thread
+        """
 
-                                                                        self._logger.info('Stage %s of Pipeline %s: %s'%(
-                                                                                stage.uid,
-                                                                                pipe.uid,
-                                                                                stage.state))
+        mq_channel = None
+        consumer = None
 
-                                                                        pipe._increment_stage()
+        try:
 
-                                                                    except Exception, ex:
-                                                                        # Rolling back stage status
-                                                                        self._logger.error('Error while updating stage '+
-                                                                                        'state, rolling back. Error: %s'%ex)
-                                                                        stage.state = states.SCHEDULED
-                                                                        pipe._decrement_stage()
+            self._logger.info('Dequeue thread %s started'%shard)
 
-                                                                        raise                                        
+            mq_channel = self._transport.channel()
 
-                                                                    if pipe.completed:
-                                                                        #self._workload.remove(pipe)
-                                                                        pipe.state = states.DONE
-                                                                        self._logger.info('Pipeline %s: %s'%(
-                                                                                            pipe.uid, 
-                                                                                            pipe.state)
-                                                                                        )
+            consumer = Consumer(mq_channel, self._completed_queue[shard::self._num_pull_threads], 
+                                self._consumer_mode, self._prefetch_count)
 
-                                                        else:
+            while not self._dequeue_thread_terminate.is_set():
 
-                                                            # Task is canceled
-                                                            pass
+                try:
 
-                                                        # Found the task and processed it -- no more iterations needed
-                                                        break
+                    delivery_tag, body = consumer.get()
 
-                                                # Found the stage and processed it -- no more iterations neeeded
-                                                break
+                    if body:
 
-                                        # Found the pipeline and processed it -- no more iterations neeeded
-                                        break
+                        self._apply_updates(body, mq_channel)
 
-                        mq_channel.basic_ack(delivery_tag=method_frame.delivery_tag)
+                        # State transitions are published before the updates are acked
+                        consumer.ack(delivery_tag)
 
                         if slow_run:
                             sleep(1)
@@ -473,24 +872,102 @@ class WFprocessor(object):
 
 
             self._logger.info('Terminated dequeue thread')
-            mq_connection.close()
+            consumer.close()
+            mq_channel.close()
 
         except KeyboardInterrupt:
 
             self._logger.error('Execution interrupted by user (you probably hit Ctrl+C), '+
                             'trying to exit gracefully...')
 
-            mq_connection.close()
+            # Acks deferred by the consumer are sent before the channel is closed
+            if consumer:
+                consumer.abort()
+            if mq_channel:
+                mq_channel.close()
 
         except Exception, ex:
             self._logger.error('Unknown error in thread: %s'%ex)
             print traceback.format_exc()
 
-            mq_connection.close()
+            # Updates not acknowledged are requeued for the restarted thread
+            if consumer:
+                consumer.abort()
+            if mq_channel:
+                mq_channel.close()
 
             raise UnknownError(text=ex)
 
 
+    def event_loop(self):
+
+        """
+        Submit the ready stages and apply the state updates of all pipelines in the
+        calling thread (engine 'loop'). Stages made ready by the updates are submitted
+        right after the updates are applied, the loop only blocks on the completed 
+        queues, till a message arrives or till the current batch of tasks has to be
+        published.
+        """
+
+        self._logger.info('Event loop started')
+
+        ready_queue = self._ready_queues[0]
+
+        mq_channel = self._transport.channel()
+
+        batcher = Batcher(  mq_channel, '', self._batch_size, self._batch_linger, 
+                            partial(self._roll_back_tasks, mq_channel), self._codec, 
+                            self._compress_threshold, self._confirm_window,
+                            partial(self._notify_tasks, mq_channel), self._task_lock)
+
+        consumer = Consumer(mq_channel, self._completed_queue, self._consumer_mode, 
+                            self._prefetch_count)
+
+        body = None
+
+        try:
+
+            while not self._wfp_terminate.is_set():
+
+                while True:
+
+                    try:
+                        priority, ready_time, pipe = ready_queue.get_nowait()
+                    except Queue.Empty:
+                        break
+
+                    self._submit_stage(pipe, ready_time, batcher, ready_queue)
+
+                # Batches held back by a full queue are retried once the updates that
+                # make space were applied, without blocking on the completed queues
+                timeout = batcher.linger_timeout()
+                if timeout == 0 and not (body and batcher.held):
+                    batcher.flush()
+                    timeout = batcher.linger_timeout()
+                elif timeout is not None:
+                    timeout = min(timeout, INACTIVITY_TIMEOUT)
+
+                delivery_tag, body = consumer.get(timeout)
+
+                if body:
+                    self._apply_updates(body, mq_channel)
+                    consumer.ack(delivery_tag)
+
+        except Exception:
+
+            # Updates not acknowledged are requeued for the restarted process
+            consumer.abort()
+            mq_channel.close()
+            raise
+
+        batcher.close()
+        self._add_message_stats(batcher.stats)
+        consumer.close()
+        mq_channel.close()
+
+        self._logger.info('Event loop terminated')
+
+
     def check_alive(self):
 
         return self._wfp_process.is_alive()
\ No newline at end of file
@@ -93,6 +93,29 @@ class NoKernelConfigurationError(EnTKError):
         super(NoKernelConfigurationError, self).__init__ (msg)
 
 
+class RestartsExhaustedError(EnTKError):
+    """RestartsExhaustedError is thrown if a supervised worker died after it was restarted
+    the maximum number of times."""
+
+    def __init__ (self, worker, restarts):
+        msg = "Worker %s died after %s restarts."%(
+            str(worker),
+            str(restarts)
+            )
+        super(RestartsExhaustedError, self).__init__ (msg)
+
+
+class QueueFullError(EnTKError):
+    """QueueFullError is thrown if a message could not be published because its queue,
+    of bounded size, had no space for it in time."""
+
+    def __init__ (self, queue):
+        msg = "Queue %s is full."%(
+            str(queue)
+            )
+        super(QueueFullError, self).__init__ (msg)
+
+
 class UnknownError(EnTKError):
 
     def __init__(self, text):
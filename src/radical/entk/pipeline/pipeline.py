@@ -1,8 +1,9 @@
-import radical.utils as ru
 from radical.entk.exceptions import *
 from radical.entk.stage.stage import Stage
 import threading
+import time
 from radical.entk import states
+from radical.entk.uids import PIPELINE_UIDS
 
 
 class Pipeline(object):
@@ -14,13 +15,18 @@ class Pipeline(object):
 
     """
 
+    __slots__ = (   '_uid', '_stages', '_name', '_priority', '_state', '_stage_count',
+                    '_cur_stage', '_lock', '_completed_flag', '_index', '_ready_queue')
+
     def __init__(self):
 
-        self._uid       = ru.generate_id('radical.entk.pipeline')
+        self._uid       = PIPELINE_UIDS.new()
         self._stages    = list()
         self._name      = str()
+        self._priority  = 0
 
-        self._state     = states.NEW
+        # Code of the current state, see states.STATES
+        self._state     = states.NEW_CODE
 
         # To keep track of current state
         self._stage_count = len(self._stages)
@@ -32,6 +38,13 @@ class Pipeline(object):
         # To keep track of termination of pipeline
         self._completed_flag = threading.Event()
 
+        # Workflow-wide task index, assigned by the AppManager
+        self._index = None
+
+        # Queue of pipelines with a stage ready for execution, assigned by the
+        # WFprocessor
+        self._ready_queue = None
+
 
     def _validate_stages(self, stages):
 
@@ -57,6 +70,19 @@ class Pipeline(object):
         :type: String
         """
         return self._name
+
+    @property
+    def priority(self):
+        """
+        Priority of the pipeline. Stages of pipelines with a higher priority are
+        submitted first when multiple pipelines are ready, and their tasks overtake the
+        tasks of other pipelines at the broker if it supports priority queues.
+
+        :getter: Returns the priority of the pipeline
+        :setter: Assigns the priority of the pipeline
+        :type: Integer
+        """
+        return self._priority
     
     @property
     def stages(self):
@@ -81,8 +107,25 @@ class Pipeline(object):
         :type: String
         """
 
-        return self._state
+        return states.STATES[self._state]
     
+    @property
+    def progress(self):
+
+        """
+        Number of tasks of the pipeline in each state, summed over all its stages
+
+        :getter: Returns a dictionary with the task count per state
+        :type: Dictionary
+        """
+
+        progress = dict()
+        for stage in self._stages:
+            for state, count in stage.progress.iteritems():
+                progress[state] = progress.get(state, 0) + count
+
+        return progress
+
     @property
     def _stage_lock(self):
 
@@ -119,11 +162,18 @@ class Pipeline(object):
     def uid(self):
 
         """
-        Unique ID of the current pipeline
+        Unique ID of the current pipeline, radical.entk.pipeline.<session>.<counter>, where
+        the session is a random token shared by the objects created in one run (see 
+        uids.UidAllocator)
 
         :getter: Returns the unique id of the current pipeline
         :type: String
         """
+
+        # Lazy uids are kept as their counter value
+        if isinstance(self._uid, int):
+            return PIPELINE_UIDS.format(self._uid)
+
         return self._uid
     
     # -----------------------------------------------
@@ -140,20 +190,31 @@ class Pipeline(object):
         else:
             raise TypeError(expected_type=str, actual_type=type(value))
 
+    @priority.setter
+    def priority(self, value):
+        if isinstance(value,int):
+            self._priority = value
+        else:
+            raise TypeError(expected_type=int, actual_type=type(value))
+
     @stages.setter
     def stages(self, stages):
 
-        self._stages = self._validate_stages(stages)
+        stages = self._validate_stages(stages)
+        for stage in self._stages:
+            stage._unassign_index()
+        self._stages = stages
         self._pass_uid()
         self._stage_count = len(self._stages)
+        self._index_stages(self._stages)
 
 
     @state.setter
     def state(self, value):
-        if isinstance(value,str):
-            self._state = value
-        else:
-            raise TypeError(expected_type=str, actual_type=type(value)) 
+        code = states.code(value)
+        if not states.PIPELINE_TRANSITIONS[self._state][code]:
+            raise states.transition_error(states.PIPELINE_TRANSITIONS, self._state, code)
+        self._state = code
 
     # -----------------------------------------------
 
@@ -170,6 +231,7 @@ class Pipeline(object):
         stages = self._pass_uid(stages)
         self._stages.extend(stages)
         self._stage_count = len(self._stages)
+        self._index_stages(stages)
 
 
     def remove_stages(self, stage_names):
@@ -189,21 +251,12 @@ class Pipeline(object):
             if not isinstance(val, str):
                 raise TypeError(expected_type=str, actual_type=type(val))
 
-        copy_of_existing_stages = self._stages
-        copy_stage_names = stage_names
-
-        for stage in self._stages:
+        removed_stages = [stage for stage in self._stages if stage.name in stage_names]
 
-            for stage_name in stage_names:
-                
-                if stage.name ==  stage_name:
+        for stage in removed_stages:
+            self._stages.remove(stage)
+            stage._unassign_index()
 
-                    copy_of_existing_stages.remove(stage)
-                    copy_stage_names.remove(stage)
-
-            stage_names = copy_stage_names
-
-        self._stages = copy_of_existing_stages
         self._stage_count = len(self._stages)
 
     def _pass_uid(self, stages=None):
@@ -216,18 +269,83 @@ class Pipeline(object):
         :return: List of updated Stage objects
         """
 
+        # Formatted once, the stages share the string of a lazy uid
+        uid = self.uid
+
         if stages is None:
             for stage in self._stages:
-                stage._parent_pipeline = self._uid
+                stage._parent_pipeline = uid
                 stage._pass_uid()
         else:
             for stage in stages:
-                stage._parent_pipeline = self._uid
+                stage._parent_pipeline = uid
                 stage._pass_uid()
 
             return stages
 
 
+    def _assign_index(self, index):
+
+        """
+        Register all tasks of the current Pipeline in the workflow-wide task index, which
+        maps each task uid to its (task, stage, pipeline) objects. Stages and tasks added
+        or removed later on are reflected in the same index.
+
+        :argument: index (dict)
+        """
+
+        self._index = index
+        self._index_stages(self._stages)
+
+    def _index_stages(self, stages):
+
+        if self._index is not None:
+            for stage in stages:
+                stage._assign_index(self._index, self)
+
+
+    def _assign_ready_queue(self, ready_queue):
+
+        """
+        Assign the queue the current Pipeline is pushed onto whenever its current
+        stage becomes ready for execution
+
+        :argument: Queue object
+        """
+
+        self._ready_queue = ready_queue
+
+    def _ready_priority(self):
+
+        """
+        Sort key of the current Pipeline on a ready queue: pipelines of higher
+        priority first, then pipelines whose current stage has a higher priority
+
+        :return: tuple
+        """
+
+        stage_priority = 0
+        if self._cur_stage < len(self._stages):
+            stage_priority = self._stages[self._cur_stage].priority
+
+        return (-self._priority, -stage_priority)
+
+    def _notify_ready(self, ready_time=None):
+
+        """
+        Push the current Pipeline onto the ready queue, if one is assigned. Entries are
+        (priority, time made ready, pipeline) tuples, ordered by priority and then by
+        time on a priority queue.
+
+        :argument: time the pipeline was made ready, now if None
+        """
+
+        if self._ready_queue is not None:
+            if ready_time is None:
+                ready_time = time.time()
+            self._ready_queue.put((self._ready_priority(), ready_time, self))
+
+
     def _increment_stage(self):
 
         """
@@ -236,6 +354,7 @@ class Pipeline(object):
 
         if self._cur_stage < self._stage_count-1:
             self._cur_stage+=1
+            self._notify_ready()
         else:
             self._completed_flag.set()
 
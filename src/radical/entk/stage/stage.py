@@ -2,6 +2,7 @@ import radical.utils as ru
 from radical.entk.exceptions import *
 from radical.entk.task.task import Task
 from radical.entk import states
+from radical.entk.uids import STAGE_UIDS
 
 
 class Stage(object):
@@ -11,20 +12,36 @@ class Stage(object):
     stage consists of a set of 'Task' objects. All tasks of the same stage may execute concurrently.
     """
 
+    __slots__ = (   '_uid', '_tasks', '_name', '_priority', '_state', '_task_count',
+                    '_task_state_count', '_p_pipeline', '_index', '_p_pipeline_obj')
+
+    # Shared by all stages, a logger per stage would take memory and not pickle
+    _logger = ru.get_logger('radical.entk.stage')
+
     def __init__(self):
 
-        self._uid       = ru.generate_id('radical.entk.stage')
+        self._uid       = STAGE_UIDS.new()
         self._tasks     = set()
         self._name      = str()
+        self._priority  = 0
 
-        self._state     = states.NEW
+        # Code of the current state, see states.STATES
+        self._state     = states.NEW_CODE
 
         # To change states
         self._task_count = len(self._tasks)
 
+        # Number of tasks per state code, updated on each task state transition
+        self._task_state_count = [0]*len(states.STATES)
+
         # Pipeline this stage belongs to
         self._p_pipeline = None
 
+        # Workflow-wide task index (task uid -> (task, stage, pipeline)),
+        # assigned when the parent pipeline is registered with an AppManager
+        self._index = None
+        self._p_pipeline_obj = None
+
 
     def _validate_tasks(self, tasks):
 
@@ -46,6 +63,17 @@ class Stage(object):
 
         return tasks
 
+    def __getstate__(self):
+
+        # Pickle protocols 0 and 1 need the slots as a dictionary
+        return dict((name, getattr(self, name)) for name in self.__slots__
+                    if hasattr(self, name))
+
+    def __setstate__(self, state):
+
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+
     # -----------------------------------------------
     # Getter functions
     # -----------------------------------------------
@@ -61,6 +89,19 @@ class Stage(object):
         :type: String
         """
         return self._name
+
+    @property
+    def priority(self):
+
+        """
+        Priority of the stage, orders the pipelines of the same priority whose current
+        stages are ready
+
+        :getter: Returns the priority of the current stage
+        :setter: Assigns the priority of the current stage
+        :type: Integer
+        """
+        return self._priority
     
     @property
     def tasks(self):
@@ -84,7 +125,20 @@ class Stage(object):
         :type: String
         """
 
-        return self._state
+        return states.STATES[self._state]
+
+    @property
+    def progress(self):
+
+        """
+        Number of tasks of the stage in each state
+
+        :getter: Returns a dictionary with the task count per state
+        :type: Dictionary
+        """
+
+        return {state: count
+                    for state, count in zip(states.STATES, self._task_state_count) if count}
 
     @property
     def _parent_pipeline(self):
@@ -99,13 +153,19 @@ class Stage(object):
     def uid(self):
 
         """
-        Unique ID of the current stage
+        Unique ID of the current stage, radical.entk.stage.<session>.<counter>, where
+        the session is a random token shared by the objects created in one run (see 
+        uids.UidAllocator)
 
         :getter: Returns the unique id of the current stage
         :type: String
         """
 
-        return self._uid   
+        # Lazy uids are kept as their counter value
+        if isinstance(self._uid, int):
+            return STAGE_UIDS.format(self._uid)
+
+        return self._uid
     # -----------------------------------------------
 
 
@@ -119,11 +179,23 @@ class Stage(object):
             self._name = value
         else:
             raise TypeError(expected_type=str, actual_type=type(value))
+
+    @priority.setter
+    def priority(self, value):
+        if isinstance(value,int):
+            self._priority = value
+        else:
+            raise TypeError(expected_type=int, actual_type=type(value))
         
 
     @tasks.setter
     def tasks(self, tasks):        
-        self._tasks = self._validate_tasks(tasks)
+        tasks = self._validate_tasks(tasks)
+        self._unindex_tasks(self._tasks)
+        self._detach_tasks(self._tasks)
+        self._tasks = tasks
+        self._attach_tasks(self._tasks)
+        self._index_tasks(self._tasks)
 
     @_parent_pipeline.setter
     def _parent_pipeline(self, value):
@@ -134,10 +206,10 @@ class Stage(object):
 
     @state.setter
     def state(self, value):
-        if isinstance(value,str):
-            self._state = value
-        else:
-            raise TypeError(expected_type=str, actual_type=type(value))        
+        code = states.code(value)
+        if not states.STAGE_TRANSITIONS[self._state][code]:
+            raise states.transition_error(states.STAGE_TRANSITIONS, self._state, code)
+        self._state = code
     # -----------------------------------------------
 
 
@@ -149,9 +221,10 @@ class Stage(object):
         :argument: set of tasks
         """
 
-        tasks = self._validate_tasks(tasks)
+        tasks = self._validate_tasks(tasks).difference(self._tasks)
         self._tasks.update(tasks)
-        
+        self._attach_tasks(tasks)
+        self._index_tasks(tasks)
 
 
     def remove_tasks(self, task_names):
@@ -171,21 +244,11 @@ class Stage(object):
                 raise TypeError(expected_type=str, actual_type=type(val))
 
 
-        copy_of_existing_tasks = self._tasks
-        copy_task_names = task_names
-
-        for task in self._tasks:
-
-            for task_name in task_names:
-                
-                if task.name ==  task_name:
-
-                    copy_of_existing_tasks.remove(task)
-                    copy_task_names.remove(task)
+        removed_tasks = set([task for task in self._tasks if task.name in task_names])
 
-            task_names = copy_task_names
-
-        self._tasks = copy_of_existing_tasks
+        self._tasks.difference_update(removed_tasks)
+        self._detach_tasks(removed_tasks)
+        self._unindex_tasks(removed_tasks)
 
 
     def _pass_uid(self, tasks=None):
@@ -198,18 +261,83 @@ class Stage(object):
         :return: list of updated Tasks
         """
 
+        # Formatted once, the tasks share the string of a lazy uid
+        uid = self.uid
+
         if tasks is None:
             for task in self._tasks:
-                task._parent_stage = self._uid
+                task._parent_stage = uid
                 task._parent_pipeline = self._p_pipeline
         else:
             for task in tasks:
-                task._parent_stage = self._uid
+                task._parent_stage = uid
                 task._parent_pipeline = self._p_pipeline
 
 
             return tasks
 
+    def _attach_tasks(self, tasks):
+
+        """
+        Make the current stage track the state transitions of the given tasks
+        """
+
+        for task in tasks:
+            task._p_stage_obj = self
+            self._task_state_count[task._state_code] += 1
+
+    def _detach_tasks(self, tasks):
+
+        for task in tasks:
+            if task._p_stage_obj is self:
+                task._p_stage_obj = None
+                self._task_state_count[task._state_code] -= 1
+
+    def _update_task_state_count(self, old_code, new_code):
+
+        """
+        Move one task from the count of old_code to the count of new_code. Invoked by
+        the task on every state transition.
+        """
+
+        self._task_state_count[old_code] -= 1
+        self._task_state_count[new_code] += 1
+
+    def _assign_index(self, index, pipeline):
+
+        """
+        Register all tasks of the current stage in the workflow-wide task index. Tasks
+        added or removed later on are reflected in the same index.
+
+        :arguments: index (dict), parent Pipeline object
+        """
+
+        self._index = index
+        self._p_pipeline_obj = pipeline
+        self._index_tasks(self._tasks)
+
+    def _unassign_index(self):
+
+        """
+        Remove all tasks of the current stage from the workflow-wide task index
+        """
+
+        self._unindex_tasks(self._tasks)
+        self._index = None
+        self._p_pipeline_obj = None
+
+    def _index_tasks(self, tasks):
+
+        if self._index is not None:
+            for task in tasks:
+                self._index[task.uid] = (task, self, self._p_pipeline_obj)
+
+    def _unindex_tasks(self, tasks):
+
+        if self._index is not None:
+            for task in tasks:
+                self._index.pop(task.uid, None)
+
     def _set_task_state(self, value):
 
         """
@@ -218,12 +346,14 @@ class Stage(object):
         :arguments: String
         """
 
-        if isinstance(value, str):
-            for task in self._tasks:
-                task.state = state
+        code = states.code(value)
 
-        else:
-            raise TypeError(expected_type=str, actual_type=type(value))
+        # The transitions of all tasks are checked before any task changes state
+        for task in self._tasks:
+            if not states.TASK_TRANSITIONS[task._state][code]:
+                raise states.transition_error(states.TASK_TRANSITIONS, task._state, code)
+        for task in self._tasks:
+            task.state = value
 
     def _check_tasks_status(self):
 
@@ -232,16 +362,14 @@ class Stage(object):
         are in either DONE or FAILED state.
         """
 
-
         try:
 
-            for task in self._tasks:
-                if task.state not in [states.DONE, states.FAILED]:
-                    return False
-                    
-            return True
+            completed = self._task_state_count[states.DONE_CODE] + \
+                        self._task_state_count[states.FAILED_CODE]
+
+            return completed == len(self._tasks)
 
         except Exception, ex:
 
-            print 'Task state evaluation failed'
-            raise UnknownError(text=ex)
\ No newline at end of file
+            self._logger.exception('Task state evaluation of stage %s failed'%self.uid)
+            raise UnknownError(text=ex)
@@ -2,6 +2,9 @@ __copyright__   = "Copyright 2017-2018, http://radical.rutgers.edu"
 __author__      = "Vivek Balasubramanian <vivek.balasubramaniana@rutgers.edu>"
 __license__     = "MIT"
 
+from radical.entk.exceptions import TypeError as EnTKTypeError
+from radical.entk.exceptions import ValueError as EnTKValueError
+
 
 # -----------------------------------------------------------------------------
 # common states
@@ -17,4 +20,88 @@ FINAL = [DONE, FAILED, CANCELED]
 
 # Task only states
 QUEUED = 'QUEUED'
-EXECUTING = 'EXECUTING'
\ No newline at end of file
+EXECUTING = 'EXECUTING'
+# -----------------------------------------------------------------------------
+# Integer codes. Tasks, stages and pipelines hold the code of their state, the names
+# are used in the public API, in messages and in logs.
+STATES = [NEW, SCHEDULED, QUEUED, EXECUTING, DONE, FAILED, CANCELED]
+CODES = dict((state, code) for code, state in enumerate(STATES))
+
+NEW_CODE, SCHEDULED_CODE, QUEUED_CODE, EXECUTING_CODE, \
+DONE_CODE, FAILED_CODE, CANCELED_CODE = range(len(STATES))
+
+INITIAL_CODES = frozenset(CODES[state] for state in INITIAL)
+FINAL_CODES = frozenset(CODES[state] for state in FINAL)
+
+# Legal transitions, <KIND>_TRANSITIONS[old code][new code]. Setting the current state
+# again is legal. Tasks are queued and rolled back to NEW if they cannot be submitted,
+# tasks in a final state do not change state. Stages are reverted when their
+# submission or completion fails.
+_task_transitions = {
+    NEW:        [NEW, SCHEDULED, QUEUED, EXECUTING, DONE, FAILED, CANCELED],
+    SCHEDULED:  [NEW, SCHEDULED, QUEUED, EXECUTING, DONE, FAILED, CANCELED],
+    QUEUED:     [NEW, QUEUED, EXECUTING, DONE, FAILED, CANCELED],
+    EXECUTING:  [EXECUTING, DONE, FAILED, CANCELED],
+    DONE:       [DONE],
+    FAILED:     [FAILED],
+    CANCELED:   [CANCELED]
+}
+
+_stage_transitions = {
+    NEW:        [NEW, SCHEDULED, DONE, FAILED, CANCELED],
+    SCHEDULED:  [NEW, SCHEDULED, DONE, FAILED, CANCELED],
+    DONE:       [SCHEDULED, DONE],
+    FAILED:     [FAILED],
+    CANCELED:   [CANCELED]
+}
+
+_pipeline_transitions = {
+    NEW:        [NEW, SCHEDULED, DONE, FAILED, CANCELED],
+    SCHEDULED:  [SCHEDULED, DONE, FAILED, CANCELED],
+    DONE:       [DONE],
+    FAILED:     [FAILED],
+    CANCELED:   [CANCELED]
+}
+
+
+def _table(transitions):
+
+    return [[new in transitions.get(old, []) for new in STATES] for old in STATES]
+
+TASK_TRANSITIONS = _table(_task_transitions)
+STAGE_TRANSITIONS = _table(_stage_transitions)
+PIPELINE_TRANSITIONS = _table(_pipeline_transitions)
+
+
+def transition_error(transitions, old, new):
+
+    """
+    Error for an illegal transition
+
+    :arguments: transition table, code of the current state, code of the new state
+    :return: ValueError naming the states the current state can change to
+    """
+
+    legal = [state for state, allowed in zip(STATES, transitions[old]) if allowed]
+
+    return EnTKValueError(expected_value='a state %s can change to (%s)'%(
+                                STATES[old], ', '.join(legal)),
+                          actual_value=STATES[new])
+
+
+def code(state):
+
+    """
+    Code of a state
+
+    :arguments: state name
+    :return: integer code
+    """
+
+    try:
+        return CODES[state]
+
+    except (KeyError, TypeError):
+        if isinstance(state, basestring):
+            raise EnTKValueError(expected_value=STATES, actual_value=state)
+        raise EnTKTypeError(expected_type=str, actual_type=type(state))
@@ -1,6 +1,61 @@
-import radical.utils as ru
 from radical.entk.exceptions import *
 from radical.entk import states
+from radical.entk.uids import TASK_UIDS
+from radical.entk.task.template import TaskTemplate, LIST_FIELDS
+
+
+class _EmptyList(list):
+
+    """
+    An empty list that cannot be modified. One instance is shared by all tasks as the
+    value of their list attributes that were not assigned, the getters replace it by a
+    list of the task's own before returning it, a copy of the template's list for tasks
+    created from a template.
+    """
+
+    __slots__ = ()
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError(expected_type=list, actual_type=_EmptyList)
+
+    append = extend = insert = remove = pop = sort = reverse = _immutable
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = _immutable
+    __iadd__ = __imul__ = _immutable
+
+    def __reduce__(self):
+        # Unpickled as the shared instance
+        return 'EMPTY_LIST'
+
+EMPTY_LIST = _EmptyList()
+
+
+def _inherit(template, field):
+
+    # List of a task's own for an unassigned list attribute
+    if template is None:
+        return list()
+
+    return template._list(field)
+
+
+def _plain(value, template, field):
+
+    # marshal only serializes plain lists
+    if value is EMPTY_LIST:
+        return _inherit(template, field)
+
+    return value
+
+
+def _shared(value, template):
+
+    # Empty lists received in task descriptions are replaced by the shared one, unless
+    # they override the list of a template
+    if template is None and isinstance(value, list) and not value:
+        return EMPTY_LIST
+
+    return value
+
 
 class Task(object):
 
@@ -9,28 +64,53 @@ class Task(object):
     A Task is an abstraction of a computational unit. In this case, a Task consists of its
     executable along with its required software environment, files to be staged as input 
     and output.
+
+    :template: TaskTemplate the task inherits the attributes not assigned to it from
+               (optional)
     """
 
-    def __init__(self):
+    # Workflows hold up to millions of tasks: the attributes are kept in slots instead
+    # of a dictionary per task, and the lists a task does not use are not allocated.
+    # environment is kept for the scripts that still assign it, see pre_exec.
+    __slots__ = (   '_uid', '_name', '_priority', '_state',
+                    '_pre_exec', '_executable', '_arguments', '_post_exec', '_cores',
+                    '_exit_code',
+                    '_upload_input_data', '_copy_input_data', '_link_input_data',
+                    '_copy_output_data', '_download_output_data',
+                    '_p_stage', '_p_pipeline', '_p_stage_obj',
+                    '_template', 'environment')
 
-        self._uid       = ru.generate_id('radical.entk.task')
+    def __init__(self, template=None):
+
+        if template is not None and not isinstance(template, TaskTemplate):
+            raise TypeError(expected_type=TaskTemplate, actual_type=type(template))
+
+        # Template providing the list attributes left to EMPTY_LIST, and the cores
+        self._template = template
+
+        self._uid       = TASK_UIDS.new()
         self._name      = str()
+        self._priority  = 0
 
-        self._state     = states.NEW
+        # Code of the current state, see states.STATES
+        self._state     = states.NEW_CODE
 
         # Attributes necessary for execution
-        self._pre_exec      = list()
-        self._executable    = list()
-        self._arguments     = list()
-        self._post_exec     = list()
-        self._cores  = 1
+        self._pre_exec      = EMPTY_LIST
+        self._executable    = EMPTY_LIST
+        self._arguments     = EMPTY_LIST
+        self._post_exec     = EMPTY_LIST
+        self._cores  = template.cores if template is not None else 1
+
+        # Exit code reported by the execution of this task, if any
+        self._exit_code = None
 
         # Data staging attributes
-        self._upload_input_data     = list()
-        self._copy_input_data       = list()
-        self._link_input_data       = list()
-        self._copy_output_data      = list()
-        self._download_output_data  = list()
+        self._upload_input_data     = EMPTY_LIST
+        self._copy_input_data       = EMPTY_LIST
+        self._link_input_data       = EMPTY_LIST
+        self._copy_output_data      = EMPTY_LIST
+        self._download_output_data  = EMPTY_LIST
 
 
         ## The following help in updation
@@ -39,6 +119,21 @@ class Task(object):
         # Pipeline this task belongs to
         self._p_pipeline = None
 
+        # Stage object holding this task, notified of state transitions
+        self._p_stage_obj = None
+
+
+    def __getstate__(self):
+
+        # Objects with slots and no dictionary are only pickled with protocol 2 and
+        # higher otherwise
+        return dict((name, getattr(self, name)) for name in self.__slots__
+                    if hasattr(self, name))
+
+    def __setstate__(self, state):
+
+        for name, value in state.iteritems():
+            setattr(self, name, value)
 
     # -----------------------------------------------
     # Getter functions
@@ -48,12 +143,18 @@ class Task(object):
     def uid(self):
 
         """
-        Unique ID of the current task
+        Unique ID of the current task, radical.entk.task.<session>.<counter>, where
+        the session is a random token shared by the objects created in one run (see 
+        uids.UidAllocator)
 
         :getter: Returns the unique id of the current task
         :type: String
         """
 
+        # Lazy uids are kept as their counter value
+        if isinstance(self._uid, int):
+            return TASK_UIDS.format(self._uid)
+
         return self._uid
 
     @property
@@ -68,6 +169,20 @@ class Task(object):
         """
 
         return self._name
+
+    @property
+    def priority(self):
+
+        """
+        Priority of the task, tasks of a stage with a higher priority are submitted
+        first
+
+        :getter: Returns the priority of the current task
+        :setter: Assigns the priority of the current task
+        :type: Integer
+        """
+
+        return self._priority
     
     @property
     def state(self):
@@ -79,6 +194,12 @@ class Task(object):
         :type: String
         """
 
+        return states.STATES[self._state_code]
+
+    @property
+    def _state_code(self):
+
+        # Code of the current state
         return self._state
     
     @property
@@ -91,6 +212,10 @@ class Task(object):
         :setter: assign the list of commands
         :arguments: list of strings
         """
+
+        if self._pre_exec is EMPTY_LIST:
+            self._pre_exec = _inherit(self._template, 'pre_exec')
+
         return self._pre_exec
     
     @property
@@ -103,6 +228,10 @@ class Task(object):
         :setter: assigns the executable for the current task    
         :arguments: string
         """
+
+        if self._executable is EMPTY_LIST:
+            self._executable = _inherit(self._template, 'executable')
+
         return self._executable
     
     @property
@@ -115,6 +244,10 @@ class Task(object):
         :setter: assigns a list of arguments to the current task
         :arguments: list of strings
         """
+
+        if self._arguments is EMPTY_LIST:
+            self._arguments = _inherit(self._template, 'arguments')
+
         return self._arguments
     
     @property
@@ -128,6 +261,9 @@ class Task(object):
         :arguments: list of strings
         """
 
+        if self._post_exec is EMPTY_LIST:
+            self._post_exec = _inherit(self._template, 'post_exec')
+
         return self._post_exec
 
     @property
@@ -155,6 +291,9 @@ class Task(object):
         :arguments: list of strings
         """
 
+        if self._upload_input_data is EMPTY_LIST:
+            self._upload_input_data = _inherit(self._template, 'upload_input_data')
+
         return self._upload_input_data
     
     @property
@@ -169,6 +308,9 @@ class Task(object):
         :arguments: list of strings
         """
 
+        if self._copy_input_data is EMPTY_LIST:
+            self._copy_input_data = _inherit(self._template, 'copy_input_data')
+
         return self._copy_input_data
     
     @property
@@ -183,6 +325,9 @@ class Task(object):
         :arguments: list of strings
         """
 
+        if self._link_input_data is EMPTY_LIST:
+            self._link_input_data = _inherit(self._template, 'link_input_data')
+
         return self._link_input_data
     
     @property
@@ -197,6 +342,9 @@ class Task(object):
         :arguments: list of strings
         """
 
+        if self._copy_output_data is EMPTY_LIST:
+            self._copy_output_data = _inherit(self._template, 'copy_output_data')
+
         return self._copy_output_data
     
     @property
@@ -210,8 +358,35 @@ class Task(object):
         :setter: assign the list of files
         :arguments: list of strings
         """
+
+        if self._download_output_data is EMPTY_LIST:
+            self._download_output_data = _inherit(self._template, 'download_output_data')
+
         return self._download_output_data
 
+    @property
+    def template(self):
+
+        """
+        Template the current task inherits the attributes not assigned to it from
+
+        :getter: return the TaskTemplate, None if the task has no template
+        :setter: assign a TaskTemplate
+        """
+
+        return self._template
+
+    @property
+    def exit_code(self):
+
+        """
+        Exit code of the executable of the current task, None if it was not reported
+
+        :getter: return the exit code
+        """
+
+        return self._exit_code
+
     @property
     def _parent_stage(self):
 
@@ -244,12 +419,22 @@ class Task(object):
         else:
             raise TypeError(expected_type=str, actual_type=type(value))
 
+    @priority.setter
+    def priority(self, value):
+        if isinstance(value, int):
+            self._priority = value
+        else:
+            raise TypeError(expected_type=int, actual_type=type(value))
+
     @state.setter
     def state(self, value):
-        if isinstance(value,str):
-            self._state = value
-        else:
-            raise TypeError(expected_type=str, actual_type=type(value))
+        code = states.code(value)
+        old = self._state_code
+        if not states.TASK_TRANSITIONS[old][code]:
+            raise states.transition_error(states.TASK_TRANSITIONS, old, code)
+        if self._p_stage_obj is not None:
+            self._p_stage_obj._update_task_state_count(old, code)
+        self._state = code
 
     @pre_exec.setter
     def pre_exec(self, value):
@@ -324,6 +509,13 @@ class Task(object):
         else:
             raise TypeError(expected_type=list, actual_type=type(value))
 
+    @template.setter
+    def template(self, value):
+        if isinstance(value, TaskTemplate):
+            self._template = value
+        else:
+            raise TypeError(expected_type=TaskTemplate, actual_type=type(value))
+
     @_parent_stage.setter
     def _parent_stage(self, value):
         if isinstance(value,str):
@@ -345,23 +537,26 @@ class Task(object):
         Replicate an existing task with a new uid and NEW state
         """
 
-        self._uid       = ru.generate_id('radical.entk.task')
+        self._uid       = TASK_UIDS.new()
         self._name      = original_task.name
+        self._priority  = original_task.priority
 
-        self._state     = states.NEW
+        self._state     = states.NEW_CODE
 
         # Attributes necessary for execution
-        self._pre_exec      = original_task.pre_exec
-        self._executable    = original_task.executable
-        self._arguments     = original_task.arguments
-        self._post_exec     = original_task.post_exec
+        self._template      = original_task._template
+        self._pre_exec      = original_task._pre_exec
+        self._executable    = original_task._executable
+        self._arguments     = original_task._arguments
+        self._post_exec     = original_task._post_exec
+        self._cores         = original_task.cores
 
         # Data staging attributes
-        self._upload_input_data     = original_task.upload_input_data
-        self._copy_input_data       = original_task.copy_input_data
-        self._link_input_data       = original_task.link_input_data
-        self._copy_output_data      = original_task.copy_output_data
-        self._download_output_data  = original_task.download_output_data
+        self._upload_input_data     = original_task._upload_input_data
+        self._copy_input_data       = original_task._copy_input_data
+        self._link_input_data       = original_task._link_input_data
+        self._copy_output_data      = original_task._copy_output_data
+        self._download_output_data  = original_task._download_output_data
 
 
         ## The following help in updation
@@ -381,27 +576,62 @@ class Task(object):
         """
 
         task_desc_as_dict = {
-                        'uid': self._uid,
+                        'uid': self.uid,
                         'name': self._name,
-                        'state': self._state,
+                        'state': self.state,
+                        'priority': self._priority,
 
-                        'pre_exec': self._pre_exec,
-                        'executable': self._executable,
-                        'arguments': self._arguments,
-                        'post_exec': self._post_exec,
+                        'pre_exec': _plain(self._pre_exec, self._template, 'pre_exec'),
+                        'executable': _plain(self._executable, self._template, 'executable'),
+                        'arguments': _plain(self._arguments, self._template, 'arguments'),
+                        'post_exec': _plain(self._post_exec, self._template, 'post_exec'),
                         'cores': self._cores,
 
-                        'upload_input_data': self._upload_input_data,
-                        'copy_input_data': self._copy_input_data,
-                        'link_input_data': self._link_input_data,
-                        'copy_output_data': self._copy_output_data,
-                        'download_output_data': self._download_output_data,
+                        'upload_input_data': _plain(self._upload_input_data, self._template, 'upload_input_data'),
+                        'copy_input_data': _plain(self._copy_input_data, self._template, 'copy_input_data'),
+                        'link_input_data': _plain(self._link_input_data, self._template, 'link_input_data'),
+                        'copy_output_data': _plain(self._copy_output_data, self._template, 'copy_output_data'),
+                        'download_output_data': _plain(self._download_output_data, self._template, 'download_output_data'),
 
                         'parent_stage': self._p_stage,
                         'parent_pipeline': self._p_pipeline,
                     }
 
         return task_desc_as_dict
+
+    def _to_delta(self):
+
+        """
+        Convert current Task into a dictionary holding the uid of its template and only
+        the attributes the task does not inherit from it
+
+        :return: python dictionary
+        """
+
+        template = self._template
+
+        task_delta_as_dict = {
+                        'uid': self.uid,
+                        'name': self._name,
+                        'state': self.state,
+                        'priority': self._priority,
+                        'parent_stage': self._p_stage,
+                        'parent_pipeline': self._p_pipeline,
+                        'template': template.uid
+                    }
+
+        # Attributes read through their getter hold a copy of the template's, only
+        # those that differ from it are sent
+        for field in LIST_FIELDS:
+            value = getattr(self, '_' + field)
+            if value is not EMPTY_LIST and tuple(value) != template._fields.get(field, ()):
+                task_delta_as_dict[field] = value
+
+        cores = self._cores
+        if cores != template.cores:
+            task_delta_as_dict['cores'] = cores
+
+        return task_delta_as_dict
         
 
     def load_from_dict(self, d):
@@ -419,37 +649,40 @@ class Task(object):
             self._name = d['name']
 
         if 'state' in d:
-            self._state = d['state']
+            self._state = states.code(d['state'])
+
+        if 'priority' in d:
+            self._priority = d['priority']
 
         if 'pre_exec' in d:
-            self._pre_exec = d['pre_exec']
+            self._pre_exec = _shared(d['pre_exec'], self._template)
 
         if 'executable' in d:
-            self._executable = d['executable']
+            self._executable = _shared(d['executable'], self._template)
 
         if 'arguments' in d:
-            self._arguments = d['arguments']
+            self._arguments = _shared(d['arguments'], self._template)
 
         if 'post_exec' in d:
-            self._post_exec = d['post_exec']
+            self._post_exec = _shared(d['post_exec'], self._template)
 
         if 'cores' in d:
             self._cores = d['cores']
             
         if 'upload_input_data' in d:                                    
-            self._upload_input_data = d['upload_input_data']
+            self._upload_input_data = _shared(d['upload_input_data'], self._template)
 
         if 'copy_input_data' in d:
-            self._copy_input_data = d['copy_input_data']
+            self._copy_input_data = _shared(d['copy_input_data'], self._template)
 
         if 'link_input_data' in d:
-            self._link_input_data = d['link_input_data']
+            self._link_input_data = _shared(d['link_input_data'], self._template)
 
         if 'copy_output_data' in d:
-            self._copy_output_data = d['copy_output_data']
+            self._copy_output_data = _shared(d['copy_output_data'], self._template)
 
         if 'download_output_data' in d:
-            self._download_output_data = d['download_output_data']                                                
+            self._download_output_data = _shared(d['download_output_data'], self._template)                                                
 
         if 'parent_stage' in d:
             self._p_stage = d['parent_stage']
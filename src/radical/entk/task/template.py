@@ -0,0 +1,185 @@
+import radical.utils as ru
+from radical.entk.exceptions import *
+
+# List attributes of a task a template provides, next to the number of cores
+LIST_FIELDS = [ 'pre_exec', 'executable', 'arguments', 'post_exec',
+                'upload_input_data', 'copy_input_data', 'link_input_data',
+                'copy_output_data', 'download_output_data']
+
+
+class TaskTemplate(object):
+
+    """
+    A TaskTemplate holds the attributes shared by many tasks, e.g. the tasks of an
+    ensemble that differ only in their seed or input files. A task created from a
+    template stores only the attributes assigned to it and inherits the others from the
+    template. Task messages carry each template once, followed by the attributes of
+    each task.
+
+    A template cannot be modified once created.
+
+    :arguments: keyword arguments named after the Task attributes pre_exec, executable,
+                arguments, post_exec, cores, upload_input_data, copy_input_data,
+                link_input_data, copy_output_data and download_output_data
+    """
+
+    def __init__(self, **kwargs):
+
+        # Interned, so that the binary codec sends it once per message
+        self._uid = intern(ru.generate_id('radical.entk.task_template'))
+        self._cores = 1
+
+        # Non-empty list attributes, as tuples
+        self._fields = dict()
+
+        for field, value in kwargs.iteritems():
+
+            if field == 'cores':
+                if not isinstance(value, int):
+                    raise TypeError(expected_type=int, actual_type=type(value))
+                self._cores = value
+
+            elif field in LIST_FIELDS:
+                if not isinstance(value, list):
+                    raise TypeError(expected_type=list, actual_type=type(value))
+                if value:
+                    self._fields[field] = tuple(value)
+
+            else:
+                raise ValueError(expected_value=LIST_FIELDS + ['cores'], actual_value=field)
+
+    def _list(self, field):
+
+        return list(self._fields.get(field, ()))
+
+    # -----------------------------------------------
+    # Getter functions
+    # -----------------------------------------------
+
+    @property
+    def uid(self):
+
+        """
+        Unique ID of the current template
+
+        :getter: Returns the unique id of the current template
+        :type: String
+        """
+
+        return self._uid
+
+    @property
+    def pre_exec(self):
+
+        """
+        :getter: Returns a copy of the commands to be executed prior to the executable
+        :type: list of strings
+        """
+
+        return self._list('pre_exec')
+
+    @property
+    def executable(self):
+
+        """
+        :getter: Returns a copy of the executable
+        :type: list of strings
+        """
+
+        return self._list('executable')
+
+    @property
+    def arguments(self):
+
+        """
+        :getter: Returns a copy of the arguments of the executable
+        :type: list of strings
+        """
+
+        return self._list('arguments')
+
+    @property
+    def post_exec(self):
+
+        """
+        :getter: Returns a copy of the commands to be executed post executable
+        :type: list of strings
+        """
+
+        return self._list('post_exec')
+
+    @property
+    def cores(self):
+
+        """
+        :getter: Returns the number of cores
+        :type: Integer
+        """
+
+        return self._cores
+
+    @property
+    def upload_input_data(self):
+
+        """
+        :getter: Returns a copy of the files to be uploaded
+        :type: list of strings
+        """
+
+        return self._list('upload_input_data')
+
+    @property
+    def copy_input_data(self):
+
+        """
+        :getter: Returns a copy of the files to be copied to the task's location
+        :type: list of strings
+        """
+
+        return self._list('copy_input_data')
+
+    @property
+    def link_input_data(self):
+
+        """
+        :getter: Returns a copy of the files to be linked to the task's location
+        :type: list of strings
+        """
+
+        return self._list('link_input_data')
+
+    @property
+    def copy_output_data(self):
+
+        """
+        :getter: Returns a copy of the files to be copied from the task's location
+        :type: list of strings
+        """
+
+        return self._list('copy_output_data')
+
+    @property
+    def download_output_data(self):
+
+        """
+        :getter: Returns a copy of the files to be downloaded
+        :type: list of strings
+        """
+
+        return self._list('download_output_data')
+    # -----------------------------------------------
+
+    def to_dict(self):
+
+        """
+        Convert current template into a dictionary, holding its uid as 'template' and
+        its non-empty list attributes
+
+        :return: python dictionary
+        """
+
+        template_as_dict = dict((field, list(value)) for field, value in self._fields.iteritems())
+        template_as_dict['template'] = self._uid
+        template_as_dict['cores'] = self._cores
+
+        return template_as_dict
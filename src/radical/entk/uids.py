@@ -0,0 +1,129 @@
+__copyright__   = "Copyright 2017-2018, http://radical.rutgers.edu"
+__author__      = "Vivek Balasubramanian <vivek.balasubramaniana@rutgers.edu>"
+__license__     = "MIT"
+
+from radical.entk.exceptions import *
+from multiprocessing.util import register_after_fork
+import multiprocessing as mp
+import threading
+import os
+
+# Number of uids a thread reserves at once
+BLOCK_SIZE = 4096
+
+# Session the uids of this process and of the processes it forks belong to. Random, so
+# that uids of different sessions differ when they meet, e.g. in the same profile or
+# sandbox. Read from os.urandom() since forked processes share the state of random.
+SESSION = os.urandom(8).encode('hex')
+
+# Whether new tasks, stages and pipelines keep their uid as an integer, formatted
+# into its string each time it is read (see set_lazy())
+_lazy = False
+
+
+def set_lazy(lazy):
+
+    """
+    Make the tasks, stages and pipelines created from now on keep their uid as an
+    integer, which takes less memory and no formatting when the object is created, and
+    format it each time the uid is read. Uids read from the objects are the same in
+    both cases.
+
+    :arguments: Boolean
+    """
+
+    global _lazy
+
+    if not isinstance(lazy, bool):
+        raise TypeError(expected_type=bool, actual_type=type(lazy))
+
+    _lazy = lazy
+
+
+class UidAllocator(object):
+
+    """
+    Allocates the uids of one kind of objects, as a prefix and the session followed by
+    a counter, e.g. radical.entk.task.<session>.0001. Each thread reserves a block of
+    counter values at a time, so that the shared counter and its lock are only used
+    once per block instead of once per uid. The counter is in shared memory: processes
+    started with multiprocessing after the allocator was created reserve their blocks
+    from it too, and drop the block they inherited. Uids are unique within a session,
+    and increase per thread.
+
+    :prefix: prefix of the uids
+    :block_size: number of uids a thread reserves at once
+    """
+
+    def __init__(self, prefix, block_size=BLOCK_SIZE):
+
+        if not isinstance(prefix, str):
+            raise TypeError(expected_type=str, actual_type=type(prefix))
+
+        if not isinstance(block_size, int):
+            raise TypeError(expected_type=int, actual_type=type(block_size))
+
+        if block_size < 1:
+            raise ValueError(expected_value='positive integer', actual_value=block_size)
+
+        self._template = '%s.%s.%%04d'%(prefix, SESSION)
+        self._block_size = block_size
+
+        # Start of the next block, with a lock shared by threads and processes
+        self._next_block = mp.Value('l', 0)
+
+        # Remaining counter values of the block of each thread
+        self._local = threading.local()
+
+        register_after_fork(self, UidAllocator._after_fork)
+
+    def _after_fork(self):
+
+        # The thread that forked keeps its block in the parent
+        self._local = threading.local()
+
+    def _reserve(self):
+
+        with self._next_block.get_lock():
+            start = self._next_block.value
+            self._next_block.value += self._block_size
+
+        self._local.block = iter(xrange(start, start + self._block_size))
+
+    def number(self):
+
+        """
+        :return: next counter value of the current thread
+        """
+
+        try:
+            return next(self._local.block)
+
+        except (AttributeError, StopIteration):
+            self._reserve()
+            return next(self._local.block)
+
+    def format(self, number):
+
+        """
+        :arguments: counter value
+        :return: uid of the counter value
+        """
+
+        return self._template%number
+
+    def new(self):
+
+        """
+        :return: new uid, as its counter value if lazy uids are enabled (see set_lazy())
+        """
+
+        if _lazy:
+            return self.number()
+
+        return self._template%self.number()
+
+
+TASK_UIDS = UidAllocator('radical.entk.task')
+STAGE_UIDS = UidAllocator('radical.entk.stage')
+PIPELINE_UIDS = UidAllocator('radical.entk.pipeline')
@@ -1,5 +1,6 @@
-from radical.entk import AppManager
+from radical.entk import AppManager, states
 import pytest
+import time
 from radical.entk.exceptions import *
 
 def test_attribute_types():
@@ -16,3 +17,600 @@ def test_assign_workload_exception():
 
         with pytest.raises(TypeError):
             appman.assign_workflow(data)
+
+def test_assign_workflow_task_index():
+
+    from radical.entk import Pipeline, Stage, Task
+
+    appman = AppManager()
+
+    p = Pipeline()
+    s = Stage()
+    t = Task()
+    s.tasks = t
+    p.stages = s
+
+    appman.assign_workflow(p)
+    assert appman._task_index[t.uid] == (t, s, p)
+
+    # Tasks added after assignment (e.g. resubmissions) are indexed as well
+    t2 = Task()
+    s.add_tasks(t2)
+    assert appman._task_index[t2.uid] == (t2, s, p)
+
+def test_consumer_mode():
+
+    appman = AppManager(consumer_mode={'helper': 'poll'})
+    assert appman._consumer_mode == {'wfprocessor': 'push', 'synchronizer': 'push', 'helper': 'poll'}
+
+    with pytest.raises(ValueError):
+        AppManager(consumer_mode='pull')
+
+    with pytest.raises(TypeError):
+        AppManager(prefetch_count='1')
+
+def test_batch_types():
+
+    with pytest.raises(TypeError):
+        AppManager(batch_size='1')
+
+    with pytest.raises(TypeError):
+        AppManager(batch_linger='1')
+
+def test_thread_queue_counts():
+
+    for count in ['1', 1.0]:
+        with pytest.raises(TypeError):
+            AppManager(push_threads=count)
+
+    with pytest.raises(ValueError):
+        AppManager(sync_threads=0)
+
+    with pytest.raises(ValueError):
+        AppManager(completed_qs=0)
+
+    with pytest.raises(ValueError):
+        AppManager(processes=0)
+
+def test_process_shards():
+
+    from radical.entk import Pipeline
+
+    pipes = set([Pipeline() for i in range(5)])
+
+    appman = AppManager(transport='local', pending_qs=2, completed_qs=3, processes=2)
+    appman.assign_workflow(pipes)
+    appman._setup_mqs()
+
+    # Pipelines and queues are split over the processes
+    shards = [appman._shard_pipes(i) for i in range(2)]
+    assert shards[0] | shards[1] == pipes
+    assert not shards[0] & shards[1]
+    assert sorted(len(shard) for shard in shards) == [2, 3]
+
+    pending = [appman._shard_queues(appman._pending_queue, i) for i in range(2)]
+    completed = [appman._shard_queues(appman._completed_queue, i) for i in range(2)]
+    assert [len(queues) for queues in pending + completed] == [2, 2, 3, 3]
+    assert pending[0] + pending[1] == appman._pending_queue
+    assert completed[0] + completed[1] == appman._completed_queue
+
+    assert [appman._shard_limit(5, i) for i in range(2)] == [3, 2]
+    assert [appman._shard_limit(1, i) for i in range(2)] == [1, 1]
+    assert appman._shard_limit(None, 0) is None
+
+    appman._cleanup_mqs()
+
+def test_codec():
+
+    assert AppManager(codec='binary')._codec == 'binary'
+
+    with pytest.raises(ValueError):
+        AppManager(codec='pickle')
+
+def test_apply_notification():
+
+    from radical.entk import Pipeline, Stage, Task, states
+
+    appman = AppManager()
+
+    p = Pipeline()
+    s1 = Stage()
+    t1 = Task()
+    s1.add_tasks(t1)
+    s2 = Stage()
+    t2 = Task()
+    s2.add_tasks(t2)
+    p.add_stages([s1, s2])
+    appman.assign_workflow(p)
+
+    # Submissions are applied to the task only, late ones are ignored
+    appman._apply_notification({'uid': t1.uid, 'state': states.QUEUED, 'timestamp': 0, 
+                                'pipeline': p.uid})
+    assert (t1.state, s1.state, p.state) == (states.QUEUED, states.NEW, states.NEW)
+
+    # States are applied as notified by the WFprocessor
+    appman._apply_notification({'uid': t1.uid, 'state': states.DONE, 'timestamp': 0, 'exit_code': 0,
+                                'stage_state': states.DONE, 'pipeline': p.uid, 
+                                'pipeline_state': states.SCHEDULED, 'current_stage': 1, 
+                                'completed': False})
+    assert (t1.state, t1.exit_code, s1.state) == (states.DONE, 0, states.DONE)
+    assert (p.state, p._current_stage, p._completed) == (states.SCHEDULED, 1, False)
+
+    appman._apply_notification({'uid': t1.uid, 'state': states.QUEUED, 'timestamp': 0, 
+                                'pipeline': p.uid})
+    assert t1.state == states.DONE
+
+    # Resubmitted tasks are added with the uid of the WFprocessor's replica
+    appman._apply_notification({'uid': t2.uid, 'state': states.FAILED, 'timestamp': 0,
+                                'stage_state': states.SCHEDULED, 'pipeline': p.uid, 
+                                'pipeline_state': states.SCHEDULED, 'current_stage': 1, 
+                                'completed': False, 'replica': 'radical.entk.task.replica'})
+    task, stage, pipe = appman._task_index['radical.entk.task.replica']
+    assert (task.state, stage, pipe) == (states.NEW, s2, p)
+    assert task.executable == t2.executable
+
+    appman._apply_notification({'uid': 'radical.entk.task.replica', 'state': states.DONE, 
+                                'timestamp': 0, 'stage_state': states.DONE, 'pipeline': p.uid,
+                                'pipeline_state': states.DONE, 'current_stage': 1, 
+                                'completed': True})
+    assert (s2.state, p.state, p._completed) == (states.DONE, states.DONE, True)
+
+def test_restarts():
+
+    appman = AppManager(max_restarts=3)
+    assert appman.restarts == dict()
+
+    with pytest.raises(TypeError):
+        AppManager(max_restarts='3')
+
+def _run_workflow(transport, engine='threads', priorities=False, templates=False, **kwargs):
+
+    from radical.entk import Pipeline, Stage, Task, TaskTemplate, states
+
+    template = TaskTemplate(executable=['/bin/date']) if templates else None
+
+    pipes = set()
+    for i in range(2):
+        p = Pipeline()
+        if priorities:
+            p.priority = i
+        for j in range(2):
+            s = Stage()
+            if priorities:
+                s.priority = j
+            for k in range(3):
+                if templates:
+                    t = Task(template=template)
+                    t.arguments = ['-u']
+                else:
+                    t = Task()
+                    t.executable = ['/bin/date']
+                if priorities:
+                    t.priority = k
+                s.add_tasks(t)
+            p.add_stages(s)
+        pipes.add(p)
+
+    appman = AppManager(transport=transport, push_threads=2, pull_threads=2, sync_threads=2,
+                        pending_qs=2, completed_qs=2, codec='binary', engine=engine, **kwargs)
+    appman.assign_workflow(pipes)
+    appman.run()
+
+    for p in pipes:
+        assert p.state == states.DONE
+        for s in p.stages:
+            assert s.state == states.DONE
+            for t in s.tasks:
+                assert t.state == states.DONE
+
+    return appman
+
+
+def test_run_local_transport():
+
+    _run_workflow('local')
+
+
+def test_run_zmq_transport():
+
+    pytest.importorskip('zmq')
+    _run_workflow('zmq')
+
+
+def test_run_shm_transport():
+
+    _run_workflow('shm')
+
+
+def test_run_shm_wide_stage():
+
+    from radical.entk import Pipeline, Stage, Task
+    from radical.entk.appman.transport import ShmTransport
+
+    # A stage of more tasks than the queues hold, with the default window of tasks in 
+    # flight and with a window wider than the queues
+    for engine in ['threads', 'loop']:
+        for max_in_flight in [None, 1000]:
+
+            p = Pipeline()
+            s = Stage()
+            for i in range(1000):
+                t = Task()
+                t.executable = ['/bin/date']
+                s.add_tasks(t)
+            p.add_stages(s)
+
+            appman = AppManager(transport=ShmTransport(slots=64, slot_size=256), engine=engine,
+                                batch_size=4, max_in_flight=max_in_flight)
+            appman.assign_workflow(set([p]))
+            appman.run()
+
+            assert p.state == states.DONE
+            assert [t.state for t in s.tasks] == [states.DONE]*1000
+
+
+def test_run_shm_large_batches():
+
+    from radical.entk import Pipeline, Stage, Task
+    from radical.entk.appman.transport import ShmTransport
+
+    # Batches larger than the queues, under a window of tasks in flight wider than the
+    # queues, are split instead of failing
+    for engine in ['threads', 'loop']:
+
+        p = Pipeline()
+        s = Stage()
+        for i in range(20):
+            t = Task()
+            t.executable = ['/bin/date']
+            t.arguments = ['--index=%s'%i]
+            s.add_tasks(t)
+        p.add_stages(s)
+
+        appman = AppManager(transport=ShmTransport(slots=4, slot_size=256), engine=engine,
+                            batch_size=8, max_in_flight=20)
+        appman.assign_workflow(set([p]))
+        appman.run()
+
+        assert p.state == states.DONE
+        assert [t.state for t in s.tasks] == [states.DONE]*20
+
+
+def test_run_event_loop():
+
+    with pytest.raises(ValueError):
+        AppManager(engine='asyncio')
+
+    _run_workflow('local', engine='loop')
+    _run_workflow('shm', engine='loop')
+
+
+def test_run_event_loop_zmq():
+
+    pytest.importorskip('zmq')
+    from radical.entk.appman.transport import ZMQ_LINGER
+
+    # The processes close their channels without waiting for the linger to expire
+    start = time.time()
+    _run_workflow('zmq', engine='loop')
+    assert time.time() - start < ZMQ_LINGER/2000.0
+
+
+def test_run_processes():
+
+    appman = _run_workflow('local', processes=2)
+    assert sorted(appman.restarts) == ['helper-0', 'helper-1', 'synchronizer-thread-0', 
+                                        'synchronizer-thread-1', 'wfprocessor-0', 'wfprocessor-1']
+
+    _run_workflow('shm', engine='loop', processes=2, max_in_flight=3)
+
+
+def test_run_restart(monkeypatch, tmpdir):
+
+    from multiprocessing import Value
+    from radical.entk.appman import helper
+    from radical.entk.appman.wfprocessor import WFprocessor
+
+    # The WFprocessor dies on the first state update, once
+    failed = Value('i', 0)
+    apply_updates = WFprocessor._apply_updates
+
+    def fail_once(self, body, mq_channel):
+        with failed.get_lock():
+            fail = not failed.value
+            failed.value = 1
+        if fail:
+            raise Exception('WFprocessor failure')
+        return apply_updates(self, body, mq_channel)
+
+    # Uids of the tasks the helper executed
+    executed = tmpdir.join('executed')
+    state_update = helper.state_update
+
+    def record(task):
+        with open(str(executed), 'a') as f:
+            f.write('%s\n'%task.uid)
+        return state_update(task)
+
+    monkeypatch.setattr(WFprocessor, '_apply_updates', fail_once)
+    monkeypatch.setattr(helper, 'state_update', record)
+
+    appman = _run_workflow('local', engine='loop')
+    assert appman.restarts['wfprocessor-0'] == 1
+
+    # The restarted WFprocessor does not submit the tasks submitted before again
+    uids = [t.uid for p in appman._workflow for s in p.stages for t in s.tasks]
+    assert sorted(executed.read().split()) == sorted(uids)
+
+
+def test_run_resubmit_failed(monkeypatch):
+
+    from radical.entk import Pipeline, Stage, Task
+    from radical.entk.appman import helper
+
+    with pytest.raises(TypeError):
+        AppManager().resubmit_failed = 1
+
+    # The first task of each stage fails, its replica does not
+    failing = set()
+    state_update = helper.state_update
+
+    def fail(task):
+        update = state_update(task)
+        if task.uid in failing:
+            update['state'] = states.FAILED
+        return update
+
+    monkeypatch.setattr(helper, 'state_update', fail)
+
+    for engine in ['threads', 'loop']:
+
+        pipes = set()
+        for i in range(2):
+            p = Pipeline()
+            for j in range(2):
+                s = Stage()
+                for k in range(3):
+                    t = Task()
+                    t.executable = ['/bin/date']
+                    s.add_tasks(t)
+                p.add_stages(s)
+            pipes.add(p)
+
+        failing.update(list(s.tasks)[0].uid for p in pipes for s in p.stages)
+
+        appman = AppManager(transport='local', engine=engine)
+        appman.resubmit_failed = True
+        appman.assign_workflow(pipes)
+        appman.run()
+
+        for p in pipes:
+            assert p.state == states.DONE
+            for s in p.stages:
+                assert s.state == states.DONE
+                assert len(s.tasks) == 4
+                assert sorted(t.state for t in s.tasks) == [states.DONE]*3 + [states.FAILED]
+                assert [t.uid for t in s.tasks if t.state == states.FAILED][0] in failing
+
+
+def test_run_in_flight():
+
+    with pytest.raises(ValueError):
+        AppManager(max_in_flight=0)
+
+    _run_workflow('local', max_in_flight=2, pipeline_in_flight=1)
+    _run_workflow('local', engine='loop', max_in_flight=2)
+
+
+def _record_calls(monkeypatch, cls, method, record):
+
+    # Puts record(*args) of each call of cls.method on a multiprocessing queue, so that
+    # calls in the forked WFprocessor and helper processes are seen by the test
+    import multiprocessing as mp
+
+    calls = mp.Queue()
+    original = getattr(cls, method)
+
+    def recorder(self, *args, **kwargs):
+        calls.put(record(*args, **kwargs))
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(cls, method, recorder)
+
+    return calls
+
+
+def _drain(calls):
+
+    import Queue
+
+    records = list()
+    while True:
+        try:
+            records.append(calls.get(timeout=1))
+        except Queue.Empty:
+            return records
+
+
+def test_run_priorities(monkeypatch):
+
+    from radical.entk import Pipeline, Stage, Task
+    from radical.entk.appman.batch import Batcher
+
+    _run_workflow('local', priorities=True)
+    _run_workflow('local', engine='loop', priorities=True, max_in_flight=2)
+
+    # With the tasks of one stage in flight at a time, the stage of the high priority
+    # pipeline is queued for submission before the low priority one, the tasks of each
+    # stage highest priority first
+    dispatched = _record_calls(monkeypatch, Batcher, 'add', lambda task, *args, **kwargs: task.uid)
+
+    for engine in ['threads', 'loop']:
+
+        pipes = list()
+        for i in range(2):
+            p = Pipeline()
+            p.priority = i
+            for j in range(2):
+                s = Stage()
+                for k in range(3):
+                    t = Task()
+                    t.executable = ['/bin/date']
+                    t.priority = k
+                    s.add_tasks(t)
+                p.add_stages(s)
+            pipes.append(p)
+
+        appman = AppManager(transport='local', engine=engine, max_in_flight=3)
+        appman.assign_workflow(set(pipes))
+        appman.run()
+
+        order = _drain(dispatched)
+        assert sorted(order) == sorted(t.uid for p in pipes for s in p.stages for t in s.tasks)
+
+        high = pipes[1]
+        assert set(order[:3]) == set(t.uid for t in high.stages[0].tasks)
+
+        for p in pipes:
+            for s in p.stages:
+                stage_order = [uid for uid in order if uid in set(t.uid for t in s.tasks)]
+                assert stage_order == [t.uid for t in sorted(s.tasks, key=lambda t: -t.priority)]
+
+
+def test_run_compression(monkeypatch):
+
+    from radical.entk import Pipeline, Stage, Task
+    from radical.entk.appman.batch import pack, task_descs
+    from radical.entk.appman.codec import decode, ZLIB_TAG
+    from radical.entk.appman.transport import LocalChannel
+    import zlib
+
+    with pytest.raises(ValueError):
+        AppManager(compress_threshold=-1)
+
+    _run_workflow('local', compress_threshold=0)
+
+    # Messages of 2 tasks are above the threshold and compressed, messages of a single
+    # task are below it and sent as they are
+    published = _record_calls(monkeypatch, LocalChannel, 'publish', 
+                              lambda routing_key, body, **kwargs: (routing_key, body))
+
+    s = Stage()
+    for i in range(2):
+        t = Task()
+        t.executable = ['/bin/date']
+        s.add_tasks(t)
+    Pipeline().add_stages(s)
+
+    tasks = list(s.tasks)
+    threshold = (len(pack(task_descs(tasks[:1]), 'binary')) + 
+                 len(pack(task_descs(tasks), 'binary')))/2
+
+    for batch_size in [2, 1]:
+
+        _run_workflow('local', compress_threshold=threshold, batch_size=batch_size)
+
+        bodies = [body for routing_key, body in _drain(published) if '.pendingq-' in routing_key]
+        compressed = [body for body in bodies if body[:1] == ZLIB_TAG]
+        uncompressed = [body for body in bodies if body[:1] != ZLIB_TAG]
+
+        assert sum(len(decode(body)) for body in bodies) == 12
+
+        assert all(len(decode(body)) == 2 for body in compressed)
+        assert all(len(zlib.decompress(body[1:])) >= threshold for body in compressed)
+
+        assert all(len(decode(body)) == 1 for body in uncompressed)
+        assert all(len(body) < threshold for body in uncompressed)
+
+        if batch_size == 2:
+            assert compressed
+        else:
+            assert not compressed
+
+
+def test_run_confirms():
+
+    with pytest.raises(ValueError):
+        AppManager(confirm_window=0)
+
+    _run_workflow('local', confirm_window=4)
+    _run_workflow('local', engine='loop', confirm_window=4)
+
+
+def test_run_templates(monkeypatch):
+
+    from radical.entk import Task
+    from radical.entk.appman.codec import get_codec
+    from radical.entk.appman.transport import LocalChannel
+
+    published = _record_calls(monkeypatch, LocalChannel, 'publish', 
+                              lambda routing_key, body, **kwargs: (routing_key, body))
+    received = _record_calls(monkeypatch, Task, 'load_from_dict', 
+                             lambda task_desc: dict(task_desc))
+
+    appman = _run_workflow('local', templates=True, batch_size=2)
+
+    # Batches of tasks of the template carry its description once and the tasks as
+    # deltas, without the executable they inherit, a single task is fully described
+    bodies = [body for routing_key, body in _drain(published) if '.pendingq-' in routing_key]
+    batches = [get_codec('binary').decode(body) for body in bodies]
+    assert any(len(descs) > 1 for descs in batches)
+
+    for descs in batches:
+
+        templates = [desc for desc in descs if 'uid' not in desc]
+        deltas = [desc for desc in descs if 'uid' in desc]
+
+        if len(deltas) > 1:
+            assert len(templates) == 1
+            assert templates[0]['executable'] == ['/bin/date']
+            for desc in deltas:
+                assert desc['template'] == templates[0]['template']
+                assert 'executable' not in desc
+                assert desc['arguments'] == ['-u']
+        else:
+            assert templates == []
+            assert 'template' not in deltas[0]
+
+    # The tasks the helper loads equal the original tasks, but for their state
+    descs = _drain(received)
+    monkeypatch.undo()
+
+    tasks = [task for task, stage, pipe in appman._task_index.values()]
+    assert sorted(desc['uid'] for desc in descs) == sorted(task.uid for task in tasks)
+
+    for desc in descs:
+
+        loaded = Task()
+        loaded.load_from_dict(desc)
+        loaded = loaded.to_dict()
+        original = appman._task_index[desc['uid']][0].to_dict()
+
+        assert (loaded.pop('state'), original.pop('state')) == (states.QUEUED, states.DONE)
+        assert loaded == original
+
+
+def test_run_progress():
+
+    appman = _run_workflow('local')
+    assert appman.progress == {states.DONE: 12}
+
+
+def test_session_queues():
+
+    appmans = [AppManager(transport='local') for i in range(2)]
+
+    queues = list()
+    for appman in appmans:
+        appman._setup_mqs()
+        queues.append(set(appman._pending_queue + appman._completed_queue + appman._sync_queue))
+
+    # Queues are namespaced by the application manager
+    assert appmans[0]._uid != appmans[1]._uid
+    assert not queues[0] & queues[1]
+    for queue in queues[0]:
+        assert queue.startswith(appmans[0]._uid)
+
+    assert set(appmans[0]._transport._queues) == queues[0]
+    appmans[0]._cleanup_mqs()
+    assert appmans[0]._transport._queues == dict()
@@ -0,0 +1,370 @@
+from radical.entk.appman.batch import Batcher, pack, unpack, adaptive_batch_size, state_update, state_notification
+from radical.entk import Task, states
+from radical.entk.exceptions import *
+import pytest
+import time
+
+
+class Channel(object):
+
+    """
+    Records the messages published by a Batcher
+    """
+
+    def __init__(self, fail=False, max_message_size=None):
+        self.bodies = list()
+        self.fail = fail
+        self.max_message_size = max_message_size
+
+        # Queues without space
+        self.full = set()
+
+        self.routing_keys = list()
+        self.priorities = list()
+        self.on_nacks = list()
+        self.confirm_window = None
+
+    def publish(self, routing_key, body, exchange='', priority=0, on_nack=None, 
+                timeout=None):
+        if self.fail:
+            raise Exception('connection lost')
+        if routing_key in self.full:
+            raise QueueFullError(queue=routing_key)
+        self.bodies.append(body)
+        self.routing_keys.append(routing_key)
+        self.priorities.append(priority)
+        self.on_nacks.append(on_nack)
+
+    def confirm_delivery(self, window):
+        self.confirm_window = window
+
+    def wait_for_confirms(self, timeout=None):
+        return True
+
+
+def test_pack_unpack():
+
+    t = Task()
+    assert unpack(pack([t.to_dict(), t.to_dict()])) == [t.to_dict(), t.to_dict()]
+
+    # Single task messages
+    import json
+    assert unpack(json.dumps(t.to_dict())) == [t.to_dict()]
+
+
+def test_adaptive_batch_size():
+
+    assert adaptive_batch_size(1) == 1
+    assert adaptive_batch_size(10) == 3
+    assert adaptive_batch_size(10000) == 100
+    assert adaptive_batch_size(10**8) == 1024
+
+
+def test_batch_size():
+
+    channel = Channel()
+    batcher = Batcher(channel, '', batch_size=2)
+
+    tasks = [Task() for i in range(5)]
+    for task in tasks:
+        batcher.add(task, 'pendingq')
+
+    assert [len(unpack(body)) for body in channel.bodies] == [2, 2]
+    assert batcher.linger_timeout() == 0
+
+    batcher.flush()
+    assert [len(unpack(body)) for body in channel.bodies] == [2, 2, 1]
+    assert [desc['uid'] for body in channel.bodies for desc in unpack(body)] == [t.uid for t in tasks]
+    assert batcher.linger_timeout() is None
+
+
+def test_adaptive_batching():
+
+    channel = Channel()
+    batcher = Batcher(channel, '', linger=10)
+
+    for i in range(100):
+        batcher.add(Task(), 'pendingq', stage_width=100)
+
+    assert len(channel.bodies) == 10
+
+    batcher.add(Task(), 'pendingq', stage_width=100)
+    assert 9 < batcher.linger_timeout() <= 10
+
+
+def test_routing_keys():
+
+    channel = Channel()
+    batcher = Batcher(channel, '', batch_size=2, linger=10)
+
+    batcher.add(Task(), 'pendingq-1')
+    batcher.add(Task(), 'pendingq-2')
+    assert channel.bodies == []
+
+    batcher.add(Task(), 'pendingq-1')
+    assert channel.routing_keys == ['pendingq-1']
+
+    batcher.flush()
+    assert channel.routing_keys == ['pendingq-1', 'pendingq-2']
+    assert [len(unpack(body)) for body in channel.bodies] == [2, 1]
+
+
+def test_priorities():
+
+    channel = Channel()
+    batcher = Batcher(channel, '', batch_size=2, linger=10)
+
+    # Tasks of different priorities are not batched together, batches of higher
+    # priority are flushed first
+    batcher.add(Task(), 'pendingq', priority=0)
+    batcher.add(Task(), 'pendingq', priority=2)
+    assert channel.bodies == []
+
+    batcher.add(Task(), 'pendingq', priority=0)
+    assert channel.priorities == [0]
+
+    batcher.add(Task(), 'pendingq', priority=1)
+    batcher.flush('pendingq')
+    assert channel.priorities == [0, 2, 1]
+    assert [len(unpack(body)) for body in channel.bodies] == [2, 1, 1]
+
+
+def test_compression():
+
+    channel = Channel()
+    batcher = Batcher(channel, '', batch_size=8, compress_threshold=0)
+
+    tasks = list()
+    for i in range(9):
+        t = Task()
+        t.arguments = ['--template=PLCpep7_template.mdp', '--lambda_state=%s'%i]
+        tasks.append(t)
+        batcher.add(t, 'pendingq')
+    batcher.flush()
+
+    assert [desc['uid'] for body in channel.bodies for desc in unpack(body)] == [t.uid for t in tasks]
+
+    stats = batcher.stats
+    assert (stats['messages'], stats['tasks'], stats['compressed']) == (2, 9, 2)
+    assert stats['wire_bytes'] == sum(len(body) for body in channel.bodies)
+    assert stats['wire_bytes'] < stats['packed_bytes']
+
+
+def test_rollback():
+
+    rolled_back = list()
+
+    channel = Channel(fail=True)
+    batcher = Batcher(channel, '', batch_size=2, rollback=rolled_back.extend)
+
+    tasks = [Task(), Task()]
+    for task in tasks:
+        task.state = states.QUEUED
+
+    batcher.add(tasks[0], 'pendingq')
+    with pytest.raises(Exception):
+        batcher.add(tasks[1], 'pendingq')
+
+    assert rolled_back == tasks
+    assert [task.state for task in tasks] == [states.NEW, states.NEW]
+
+
+def test_rollback_locks():
+
+    import threading
+
+    class Lock(object):
+        # Fails instead of blocking if the lock is held
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.acquired = 0
+        def __enter__(self):
+            assert self.lock.acquire(False)
+            self.acquired += 1
+        def __exit__(self, *args):
+            self.lock.release()
+
+    rolled_back = list()
+
+    # Tasks of two pipelines sharing a queue, in one batch
+    tasks = [Task() for i in range(3)]
+    locks = {tasks[0]: Lock(), tasks[1]: Lock()}
+    locks[tasks[2]] = locks[tasks[0]]
+    for task in tasks:
+        task.state = states.QUEUED
+
+    channel = Channel(fail=True)
+    batcher = Batcher(channel, '', batch_size=3, rollback=rolled_back.extend, lock=locks.get)
+
+    with locks[tasks[0]]:
+        batcher.add(tasks[0], 'pendingq')
+    with locks[tasks[1]]:
+        batcher.add(tasks[1], 'pendingq')
+
+    # The tasks of the other pipeline are reverted under its lock, a task that 
+    # progressed meanwhile is not reverted
+    tasks[1].state = states.EXECUTING
+    with locks[tasks[2]]:
+        with pytest.raises(Exception):
+            batcher.add(tasks[2], 'pendingq')
+
+    assert rolled_back == [tasks[0], tasks[2]]
+    assert [task.state for task in tasks] == [states.NEW, states.EXECUTING, states.NEW]
+    assert (locks[tasks[0]].acquired, locks[tasks[1]].acquired) == (2, 2)
+
+
+def test_split():
+
+    tasks = list()
+    for i in range(8):
+        t = Task()
+        t.executable = ['/bin/date']
+        tasks.append(t)
+
+    # A batch larger than the messages the channel takes is split till the parts fit
+    max_size = len(pack([tasks[0].to_dict()]*3))
+    channel = Channel(max_message_size=max_size)
+    batcher = Batcher(channel, '', batch_size=8)
+    for t in tasks:
+        batcher.add(t, 'pendingq')
+
+    assert [len(unpack(body)) for body in channel.bodies] == [2, 2, 2, 2]
+    assert [desc['uid'] for body in channel.bodies for desc in unpack(body)] == [t.uid for t in tasks]
+    assert all(len(body) <= max_size for body in channel.bodies)
+    assert (batcher.stats['messages'], batcher.stats['split']) == (4, 3)
+
+    # A task that does not fit on its own is left to the channel
+    channel = Channel(max_message_size=1)
+    batcher = Batcher(channel, '', batch_size=2)
+    batcher.add(tasks[0], 'pendingq')
+    batcher.add(tasks[1], 'pendingq')
+    assert [len(unpack(body)) for body in channel.bodies] == [1, 1]
+
+
+def test_full_queue():
+
+    rolled_back = list()
+    published = list()
+
+    channel = Channel()
+    channel.full.add('q1')
+    batcher = Batcher(channel, '', batch_size=1, rollback=rolled_back.extend, 
+                      published=published.extend)
+
+    tasks = [Task() for i in range(4)]
+    for task in tasks:
+        task.state = states.QUEUED
+
+    # Batches of a full queue are held back, in order, the other queues are published to
+    batcher.add(tasks[0], 'q1')
+    batcher.add(tasks[1], 'q2')
+    batcher.add(tasks[2], 'q1')
+    assert [unpack(body)[0]['uid'] for body in channel.bodies] == [tasks[1].uid]
+    assert batcher.held == 2
+    assert batcher.linger_timeout() == 0
+
+    batcher.flush()
+    assert batcher.held == 2
+
+    channel.full = set()
+    batcher.flush()
+    assert [unpack(body)[0]['uid'] for body in channel.bodies] == [tasks[1].uid, tasks[0].uid, 
+                                                                   tasks[2].uid]
+    assert batcher.held == 0
+    assert batcher.linger_timeout() is None
+    assert batcher.stats['held'] == 2
+    assert published == [tasks[1], tasks[0], tasks[2]]
+
+    # Batches still held back on close are rolled back
+    channel.full.add('q1')
+    batcher.add(tasks[3], 'q1')
+    batcher.close()
+    assert rolled_back == [tasks[3]]
+    assert tasks[3].state == states.NEW
+    assert published == [tasks[1], tasks[0], tasks[2]]
+
+
+def test_types():
+
+    with pytest.raises(TypeError):
+        Batcher(Channel(), '', batch_size='1')
+
+    with pytest.raises(TypeError):
+        Batcher(Channel(), '', linger='1')
+
+
+def test_codec():
+
+    channel = Channel()
+    batcher = Batcher(channel, '', batch_size=2, codec='binary')
+
+    tasks = [Task(), Task()]
+    for task in tasks:
+        batcher.add(task, 'pendingq')
+
+    assert [desc['uid'] for desc in unpack(channel.bodies[0])] == [t.uid for t in tasks]
+    assert unpack(pack([tasks[0].to_dict()], 'binary'))[0]['uid'] == tasks[0].uid
+
+
+def test_state_update():
+
+    t = Task()
+    t.state = states.DONE
+
+    update = state_update(t)
+    assert update['uid'] == t.uid
+    assert update['state'] == states.DONE
+    assert time.time() - update['timestamp'] < 10
+    assert 'exit_code' not in update
+
+    assert state_update(t, exit_code=1)['exit_code'] == 1
+
+    for codec in ['json', 'binary']:
+        assert unpack(pack([update], codec)) == [update]
+
+
+def test_state_notification():
+
+    from radical.entk import Pipeline, Stage
+
+    p = Pipeline()
+    s = Stage()
+    t = Task()
+    s.add_tasks(t)
+    p.add_stages(s)
+
+    t.state = states.FAILED
+    notification = state_notification(state_update(t, exit_code=1), t, s, p, 'radical.entk.task.replica')
+
+    assert notification['uid'] == t.uid
+    assert notification['exit_code'] == 1
+    assert (notification['state'], notification['stage_state']) == (states.FAILED, s.state)
+    assert (notification['pipeline'], notification['pipeline_state']) == (p.uid, p.state)
+    assert (notification['current_stage'], notification['completed']) == (0, False)
+    assert notification['replica'] == 'radical.entk.task.replica'
+
+    for codec in ['json', 'binary']:
+        assert unpack(pack([notification], codec)) == [notification]
+
+
+def test_confirms():
+
+    rolled_back = list()
+
+    channel = Channel()
+    batcher = Batcher(channel, '', batch_size=2, rollback=rolled_back.extend, confirm_window=8)
+    assert channel.confirm_window == 8
+
+    tasks = [Task() for i in range(4)]
+    for task in tasks:
+        task.state = states.QUEUED
+        batcher.add(task, 'pendingq')
+
+    # Tasks of rejected batches are rolled back, unless they progressed meanwhile
+    tasks[3].state = states.EXECUTING
+    for on_nack in channel.on_nacks:
+        on_nack()
+
+    assert rolled_back == tasks[:3]
+    assert [task.state for task in tasks] == [states.NEW]*3 + [states.EXECUTING]
+    assert batcher.stats['nacked'] == 2
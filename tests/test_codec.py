@@ -0,0 +1,134 @@
+from radical.entk.appman.codec import get_codec, decode, compress, JSON, BINARY, BINARY_TAG, ZLIB_TAG, BinaryCodec
+from radical.entk import Task, TaskTemplate, states
+from radical.entk.appman.batch import task_descs
+from radical.entk.exceptions import *
+import pytest
+
+
+def create_task():
+
+    t = Task()
+    t.name = 'simulation'
+    t.executable = ['/bin/echo']
+    t.arguments = ['--seed=1', '--steps=100']
+    t.cores = 4
+    t.copy_input_data = ['$SHARED/input.tpr']
+    t._parent_stage = 'radical.entk.stage.0000'
+    t._parent_pipeline = 'radical.entk.pipeline.0000'
+    return t
+
+
+def test_round_trip():
+
+    task_descs = [create_task().to_dict(), Task().to_dict()]
+
+    for codec in [get_codec(JSON), BinaryCodec(omit_empty=False)]:
+        assert codec.decode(codec.encode(task_descs)) == task_descs
+
+
+def test_binary_codec():
+
+    codec = get_codec(BINARY)
+
+    t = create_task()
+    desc = codec.decode(codec.encode([t.to_dict()]))[0]
+
+    # Omitted empty lists load as the defaults of a new Task
+    assert 'pre_exec' not in desc
+    t2 = Task()
+    t2.load_from_dict(desc)
+    assert t2.to_dict() == t.to_dict()
+
+    # States are interned, unknown states are sent as they are
+    for state in [states.NEW, states.DONE, 'CUSTOM']:
+        assert codec.decode(codec.encode([{'uid': 'a', 'state': state}])) == [{'uid': 'a', 'state': state}]
+
+    # Fields outside of the schema
+    assert codec.decode(codec.encode([{'uid': 'a', 'exit_code': 1}])) == [{'uid': 'a', 'exit_code': 1}]
+
+    # Smaller than JSON
+    assert len(codec.encode([t.to_dict()])) < len(get_codec(JSON).encode([t.to_dict()]))
+
+    with pytest.raises(ValueError):
+        codec.decode(get_codec(JSON).encode([t.to_dict()]))
+
+
+def test_decode():
+
+    t = create_task()
+
+    for name in [JSON, BINARY]:
+        body = get_codec(name).encode([t.to_dict()])
+        assert (body[:1] == BINARY_TAG) == (name == BINARY)
+        assert decode(body)[0]['uid'] == t.uid
+
+
+def test_templates():
+
+    template = TaskTemplate(executable=['/bin/echo'], arguments=['--steps=100'], cores=4)
+
+    tasks = list()
+    for i in range(3):
+        t = Task(template=template)
+        t.arguments = template.arguments + ['--seed=%s'%i]
+        tasks.append(t)
+
+    # Empty list overriding the template's
+    tasks[0].arguments = []
+    tasks.append(create_task())
+
+    # A single task of a template is fully described
+    assert task_descs(tasks[1:2]) == [tasks[1].to_dict()]
+
+    descs = task_descs(tasks)
+    assert len(descs) == len(tasks) + 1
+    assert [desc.get('uid') for desc in descs] == [None] + [t.uid for t in tasks]
+
+    for name in [JSON, BINARY]:
+        decoded = decode(get_codec(name).encode(descs))
+        assert len(decoded) == len(tasks)
+        for t, desc in zip(tasks, decoded):
+            t2 = Task()
+            t2.load_from_dict(desc)
+            assert t2.to_dict() == t.to_dict()
+
+    # Smaller than full descriptions
+    codec = get_codec(BINARY)
+    tasks = [Task(template=template) for i in range(10)]
+    assert len(codec.encode(task_descs(tasks))) < \
+            len(codec.encode([t.to_dict() for t in tasks]))
+
+    # Tasks need the description of their template
+    with pytest.raises(ValueError):
+        decode(codec.encode(task_descs(tasks)[1:]))
+
+
+def test_compress():
+
+    task_descs = [create_task().to_dict() for i in range(16)]
+
+    for name in [JSON, BINARY]:
+
+        body = get_codec(name).encode(task_descs)
+
+        # Compressed from the threshold on
+        assert compress(body, None) is body
+        assert compress(body, len(body) + 1) is body
+
+        compressed = compress(body, len(body))
+        assert compressed[:1] == ZLIB_TAG
+        assert len(compressed) < len(body)
+        assert decode(compressed) == decode(body)
+
+    # Messages that compression does not make smaller are sent as they are
+    body = get_codec(JSON).encode([{'uid': 'a'}])
+    assert compress(body, 0) is body
+
+
+def test_get_codec():
+
+    codec = BinaryCodec(omit_empty=False)
+    assert get_codec(codec) is codec
+
+    with pytest.raises(ValueError):
+        get_codec('pickle')
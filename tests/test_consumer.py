@@ -0,0 +1,149 @@
+from radical.entk.appman.consumer import Consumer, get_consumer_mode, PUSH, POLL
+from radical.entk.exceptions import *
+import pytest
+import time
+
+
+class Channel(object):
+
+    """
+    Records the calls a Consumer makes on a transport channel
+    """
+
+    def __init__(self, bodies):
+        # bodies: list of message bodies of queue 'q' or dictionary queue -> bodies
+        if not isinstance(bodies, dict):
+            bodies = {'q': bodies}
+        self.bodies = dict((queue, list(b)) for queue, b in bodies.items())
+        self.acks = list()
+        self.prefetch_count = None
+        self.consumers = list()
+        self.delivered = 0
+        self.polls = 0
+
+    def get(self, queue):
+        self.polls += 1
+        if self.bodies[queue]:
+            self.delivered += 1
+            return self.delivered, self.bodies[queue].pop(0)
+        return None, None
+
+    def consume(self, queue, prefetch_count):
+        self.prefetch_count = prefetch_count
+        self.consumers.append(queue)
+
+    def next_delivery(self, timeout):
+        for queue in self.consumers:
+            if self.bodies[queue]:
+                return self.get(queue)
+        return None, None
+
+    def cancel(self):
+        self.consumers = list()
+
+    def ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+
+def test_consumer_mode():
+
+    assert get_consumer_mode(POLL, 'helper') == POLL
+    assert get_consumer_mode({'helper': POLL}, 'helper') == POLL
+    assert get_consumer_mode({'helper': POLL}, 'wfprocessor') == PUSH
+
+    with pytest.raises(ValueError):
+        get_consumer_mode('pull', 'helper')
+
+    with pytest.raises(ValueError):
+        get_consumer_mode({'dequeue': POLL}, 'helper')
+
+
+def test_poll_consumer():
+
+    channel = Channel(['a', 'b'])
+    consumer = Consumer(channel, 'q', POLL)
+
+    for body in ['a', 'b']:
+        tag, msg = consumer.get()
+        assert msg == body
+        consumer.ack(tag)
+
+    assert consumer.get(0) == (None, None)
+    assert channel.acks == [(1, False), (2, False)]
+    assert channel.prefetch_count is None
+
+    # Empty queues are polled till the timeout expires, with growing sleeps in between
+    polls = channel.polls
+    start = time.time()
+    assert consumer.get(0.2) == (None, None)
+    assert time.time() - start >= 0.2
+    assert 3 < channel.polls - polls < 20
+
+
+def test_push_consumer():
+
+    channel = Channel(['a', 'b', 'c', 'd', 'e'])
+    consumer = Consumer(channel, 'q', PUSH, prefetch_count=4)
+    assert channel.prefetch_count == 4
+
+    for body in ['a', 'b', 'c', 'd', 'e']:
+        tag, msg = consumer.get()
+        assert msg == body
+        consumer.ack(tag)
+
+    # Acks are sent for half the prefetch window at once
+    assert channel.acks == [(2, True), (4, True)]
+
+    # Remaining ack is flushed when the queue is idle
+    assert consumer.get() == (None, None)
+    assert channel.acks == [(2, True), (4, True), (5, True)]
+
+    consumer.close()
+    assert channel.consumers == list()
+
+
+def test_abort_consumer():
+
+    channel = Channel(['a', 'b', 'c'])
+    consumer = Consumer(channel, 'q', PUSH, prefetch_count=8)
+
+    # Pending acks of processed messages are sent, the message in process is not acked
+    for i in range(2):
+        tag, msg = consumer.get()
+        consumer.ack(tag)
+    consumer.get()
+
+    consumer.abort()
+    assert channel.acks == [(2, True)]
+
+    # Errors of a failed channel are ignored
+    def ack(delivery_tag, multiple=False):
+        raise IOError('channel closed')
+
+    channel.ack = ack
+    consumer.ack(3)
+    consumer.abort()
+
+
+def test_multiple_queues():
+
+    channel = Channel({'q1': ['a', 'b'], 'q2': ['c']})
+    consumer = Consumer(channel, ['q1', 'q2'], POLL)
+
+    # Queues are polled round robin
+    assert [consumer.get(0)[1] for i in range(4)] == ['a', 'c', 'b', None]
+
+    channel = Channel({'q1': ['a', 'b'], 'q2': ['c']})
+    consumer = Consumer(channel, ['q1', 'q2'], PUSH)
+    assert channel.consumers == ['q1', 'q2']
+
+    assert sorted(consumer.get()[1] for i in range(3)) == ['a', 'b', 'c']
+
+    # Order within a queue is preserved
+    channel = Channel({'q1': ['a', 'b'], 'q2': ['c']})
+    consumer = Consumer(channel, ['q1', 'q2'], PUSH)
+    bodies = [consumer.get()[1] for i in range(3)]
+    assert bodies.index('a') < bodies.index('b')
+
+    consumer.close()
+    assert channel.consumers == list()
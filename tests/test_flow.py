@@ -0,0 +1,85 @@
+from radical.entk.appman.flow import Credits
+from radical.entk.exceptions import *
+import pytest
+
+
+def test_credits_types():
+
+    with pytest.raises(TypeError):
+        Credits(max_in_flight='1')
+
+    with pytest.raises(ValueError):
+        Credits(pipeline_in_flight=0)
+
+
+def test_credits_unbounded():
+
+    credits = Credits()
+
+    assert credits.acquire('p1', 100) == 100
+    assert credits.release('p1', 100) == []
+    assert credits.stats['high_water'] == 100
+
+
+def test_credits_max_in_flight():
+
+    credits = Credits(max_in_flight=4)
+
+    assert credits.acquire('p1', 3) == 3
+    assert credits.acquire('p2', 3) == 1
+    assert credits.acquire('p3', 1) == 0
+    assert credits.in_flight == 4
+
+    # Waiting pipelines are made ready in the order they started waiting
+    assert credits.release('p1', 1) == ['p2']
+    assert credits.acquire('p2', 2) == 1
+    assert credits.release('p1', 2) == ['p3']
+
+    stats = credits.stats
+    assert (stats['high_water'], stats['pipeline_high_water'], stats['waits']) == (4, 3, 3)
+
+
+def test_credits_wake_batch():
+
+    credits = Credits(max_in_flight=8)
+
+    assert credits.acquire('p1', 8) == 8
+    assert credits.acquire('p2', 4) == 0
+
+    # Waiting pipelines are made ready once a quarter of the limit is available
+    assert credits.release('p1', 1) == []
+    assert credits.release('p1', 1) == ['p2']
+    assert credits.acquire('p2', 4) == 2
+
+
+def test_credits_pipeline_in_flight():
+
+    credits = Credits(max_in_flight=4, pipeline_in_flight=2)
+
+    assert credits.acquire('p1', 3) == 2
+    assert credits.acquire('p2', 3) == 2
+    assert credits.acquire('p3', 1) == 0
+
+    # A pipeline at its own limit is only made ready by its own credits
+    assert credits.release('p2', 1) == ['p3']
+    assert credits.acquire('p3', 1) == 1
+    assert credits.release('p1', 2) == ['p2', 'p1']
+    assert credits.acquire('p2', 1) == 1
+    assert credits.acquire('p1', 1) == 1
+    assert credits.stats['high_water'] == 4
+
+
+def test_credits_hold():
+
+    credits = Credits(max_in_flight=4)
+
+    # Tasks held may exceed the limit, credits are granted again once they completed
+    credits.hold('p1', 6)
+    assert credits.in_flight == 6
+    assert credits.acquire('p2', 2) == 0
+    assert credits.release('p1', 2) == []
+    assert credits.release('p1', 2) == ['p2']
+    assert credits.acquire('p2', 2) == 2
+    assert credits.release('p1', 2) == []
+    assert credits.release('p2', 2) == []
+    assert credits.in_flight == 0
@@ -10,6 +10,7 @@ def test_attribute_types():
     assert type(p.name) == str
     assert type(p.state) == str
     assert type(p.stages) == list
+    assert type(p.priority) == int
     
 
 def test_assignment_exceptions():
@@ -28,6 +29,10 @@ def test_assignment_exceptions():
         with pytest.raises(TypeError):
             p.stages = data
 
+        if not isinstance(data,int):
+            with pytest.raises(TypeError):
+                p.priority = data
+
         with pytest.raises(TypeError):
             p.add_stages(data)
 
@@ -39,6 +44,18 @@ def test_init_state():
     p = Pipeline()
     assert p.state == states.NEW
 
+def test_state_transitions():
+
+    p = Pipeline()
+    p.state = states.SCHEDULED
+    p.state = states.DONE
+
+    for state in [states.NEW, states.SCHEDULED, states.FAILED]:
+        with pytest.raises(ValueError):
+            p.state = state
+    assert p.state == states.DONE
+
+
 def test_uid_assignment():
 
     p = Pipeline()
@@ -50,4 +67,87 @@ def test_uid_assignment():
 
     assert t._parent_pipeline == p.uid
     assert t._parent_stage == s.uid
-    assert s._parent_pipeline == p.uid
\ No newline at end of file
+    assert s._parent_pipeline == p.uid
+
+def test_task_index():
+
+    index = dict()
+
+    p = Pipeline()
+    s1 = Stage()
+    s1.name = 's1'
+    t1 = Task()
+    s1.tasks = t1
+    p.stages = s1
+
+    p._assign_index(index)
+    assert index[t1.uid] == (t1, s1, p)
+
+    s2 = Stage()
+    s2.name = 's2'
+    t2 = Task()
+    s2.add_tasks(t2)
+    p.add_stages(s2)
+    assert index[t2.uid] == (t2, s2, p)
+
+    p.remove_stages('s1')
+    assert t1.uid not in index
+    assert index.keys() == [t2.uid]
+
+
+def test_progress():
+
+    p = Pipeline()
+
+    for cnt in range(2):
+        s = Stage()
+        s.add_tasks([Task(), Task()])
+        p.add_stages(s)
+
+    assert p.progress == {states.NEW: 4}
+
+    list(p.stages[0].tasks)[0].state = states.DONE
+    assert p.progress == {states.NEW: 3, states.DONE: 1}
+
+
+def test_ready_queue():
+
+    from Queue import Queue
+
+    q = Queue()
+
+    p = Pipeline()
+    p.add_stages([Stage(), Stage()])
+
+    p._assign_ready_queue(q)
+    p._increment_stage()
+    priority, ready_time, pipe = q.get_nowait()
+    assert pipe is p
+    assert p._current_stage == 1
+
+    # Completing the pipeline does not make it ready
+    p._increment_stage()
+    assert p._completed
+    assert q.empty()
+
+
+def test_ready_priority():
+
+    from Queue import PriorityQueue
+
+    q = PriorityQueue()
+
+    pipes = [Pipeline() for i in range(3)]
+    for pipe in pipes:
+        pipe.add_stages(Stage())
+        pipe._assign_ready_queue(q)
+
+    pipes[1].priority = 1
+    pipes[2].priority = 1
+    pipes[2].stages[0].priority = 1
+
+    # Higher pipeline priority first, then higher stage priority, then earlier
+    pipes[0]._notify_ready(ready_time=0)
+    pipes[1]._notify_ready(ready_time=1)
+    pipes[2]._notify_ready(ready_time=2)
+    assert [q.get_nowait()[2] for i in range(3)] == [pipes[2], pipes[1], pipes[0]]
@@ -0,0 +1,59 @@
+from radical.entk.appman.ring import RingBuffer
+from radical.entk.exceptions import *
+from multiprocessing import Process
+import pytest
+import time
+
+
+def test_ring_types():
+
+    with pytest.raises(TypeError):
+        RingBuffer(slots='1')
+
+    with pytest.raises(ValueError):
+        RingBuffer(slots=0)
+
+
+def test_ring_put_get():
+
+    ring = RingBuffer(slots=4, slot_size=8)
+
+    assert ring.empty()
+    assert ring.get() is None
+
+    # Messages spanning multiple slots, wrapping around the end of the buffer
+    for i in range(10):
+        assert ring.put('a'*i)
+        assert ring.put('b')
+        assert ring.get() == 'a'*i
+        assert ring.get() == 'b'
+
+    assert ring.empty()
+
+    # Full ring buffer
+    assert ring.put('a'*28)
+    assert not ring.put('b', timeout=0.05)
+    assert ring.get() == 'a'*28
+
+    with pytest.raises(ValueError):
+        ring.put('a'*29)
+
+
+def test_ring_processes():
+
+    ring = RingBuffer(slots=8, slot_size=16)
+    messages = ['message %s'%i for i in range(1000)]
+
+    # The producer blocks while the ring buffer is full, the consumer while it is empty
+    def produce():
+        time.sleep(0.1)
+        for message in messages:
+            ring.put(message)
+
+    proc = Process(target=produce)
+    proc.start()
+
+    assert [ring.get(timeout=5) for message in messages] == messages
+
+    proc.join()
+    assert ring.get(timeout=0.05) is None
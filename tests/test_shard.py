@@ -0,0 +1,21 @@
+from radical.entk.appman.shard import get_shard
+from radical.entk import Pipeline
+import pytest
+
+
+def test_get_shard():
+
+    uids = [Pipeline().uid for i in range(100)]
+
+    for num_shards in [1, 2, 3, 8]:
+
+        shards = [get_shard(uid, num_shards) for uid in uids]
+        assert set(shards) <= set(range(num_shards))
+
+        # Stable for the same uid, also across str and unicode uids received in messages
+        assert shards == [get_shard(uid, num_shards) for uid in uids]
+        assert shards == [get_shard(unicode(uid), num_shards) for uid in uids]
+
+    # All shards are used
+    assert set(get_shard(uid, 4) for uid in uids) == set(range(4))
+
@@ -11,6 +11,7 @@ def test_attribute_types():
     assert type(s.name) == str
     assert type(s.state) == str
     assert type(s.tasks) == set
+    assert type(s.priority) == int
     
 
 
@@ -30,6 +31,10 @@ def test_assignment_exceptions():
         with pytest.raises(TypeError):
             s.tasks = data
 
+        if not isinstance(data,int):
+            with pytest.raises(TypeError):
+                s.priority = data
+
         with pytest.raises(TypeError):
             s.add_tasks(data)
 
@@ -44,3 +49,116 @@ def test_assignment_exceptions():
 def test_init_state():
     s = Stage()
     assert s.state == states.NEW
+
+
+def test_state_transitions():
+
+    s = Stage()
+    s.state = states.SCHEDULED
+    s.state = states.FAILED
+
+    with pytest.raises(ValueError):
+        s.state = states.SCHEDULED
+    assert s.state == states.FAILED
+
+    # Done stages are scheduled again when tasks are added after completion
+    s = Stage()
+    s.state = states.DONE
+    s.state = states.SCHEDULED
+
+
+def test_task_index():
+
+    index = dict()
+
+    s = Stage()
+    t1 = Task()
+    t1.name = 't1'
+    s.add_tasks(t1)
+
+    s._assign_index(index, None)
+    assert index[t1.uid] == (t1, s, None)
+
+    t2 = Task()
+    t2.name = 't2'
+    s.add_tasks(t2)
+    assert index[t2.uid] == (t2, s, None)
+
+    s.remove_tasks('t1')
+    assert t1 not in s.tasks
+    assert t1.uid not in index
+    assert index.keys() == [t2.uid]
+
+    t3 = Task()
+    s.tasks = t3
+    assert index.keys() == [t3.uid]
+
+
+def test_task_state_count(capsys):
+
+    s = Stage()
+    t1 = Task()
+    t2 = Task()
+    t2.name = 't2'
+    s.add_tasks([t1, t2])
+
+    assert s.progress == {states.NEW: 2}
+    assert not s._check_tasks_status()
+
+    t1.state = states.DONE
+    assert s.progress == {states.NEW: 1, states.DONE: 1}
+    assert not s._check_tasks_status()
+
+    t2.state = states.FAILED
+    assert s.progress == {states.DONE: 1, states.FAILED: 1}
+    assert s._check_tasks_status()
+
+    # Resubmitted task is added in NEW state
+    t3 = Task()
+    t3._replicate(t2)
+    s.add_tasks(t3)
+    assert s.progress == {states.NEW: 1, states.DONE: 1, states.FAILED: 1}
+    assert not s._check_tasks_status()
+
+    s.remove_tasks('t2')
+    assert s.progress == {states.DONE: 1}
+    assert s._check_tasks_status()
+
+    # Failures are logged, not printed, and raised
+    counts = s._task_state_count
+    s._task_state_count = None
+    with pytest.raises(UnknownError):
+        s._check_tasks_status()
+    assert capsys.readouterr()[0] == ''
+    s._task_state_count = counts
+
+    # Removed tasks are no longer tracked
+    t3.state = states.DONE
+    assert s.progress == {states.DONE: 1}
+
+
+def test_check_tasks_status_log(monkeypatch):
+
+    from radical.entk import uids
+
+    class Logger(object):
+        def __init__(self):
+            self.messages = list()
+        def exception(self, message):
+            self.messages.append(message)
+
+    logger = Logger()
+    monkeypatch.setattr(Stage, '_logger', logger)
+
+    # Lazy uids are logged as their uid string
+    uids.set_lazy(True)
+    try:
+        s = Stage()
+    finally:
+        uids.set_lazy(False)
+
+    s._task_state_count = None
+    with pytest.raises(UnknownError):
+        s._check_tasks_status()
+    assert logger.messages == ['Task state evaluation of stage %s failed'%s.uid]
+    assert isinstance(s._uid, int)
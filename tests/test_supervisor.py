@@ -0,0 +1,70 @@
+from radical.entk.appman import supervisor as sv
+from radical.entk.appman.supervisor import Supervisor
+from radical.entk.exceptions import *
+import radical.utils as ru
+import pytest
+import time
+
+
+class Worker(object):
+
+    def __init__(self):
+        self.starts = 0
+        self.running = False
+
+    def start(self):
+        self.starts += 1
+        self.running = True
+
+    def alive(self):
+        return self.running
+
+
+def test_start_and_restart(monkeypatch):
+
+    monkeypatch.setattr(sv, 'BACKOFF', 0.01)
+
+    worker = Worker()
+    supervisor = Supervisor('test', ru.get_logger('radical.entk.test'), max_restarts=2)
+    supervisor.add('worker', worker.start, worker.alive)
+
+    # Started on the first check
+    assert supervisor.check() == sv.INTERVAL
+    assert worker.starts == 1
+    assert supervisor.restarts == {'worker': 0}
+
+    # Restarted after the backoff
+    worker.running = False
+    assert 0 < supervisor.check() <= 0.01
+    assert worker.starts == 1
+
+    time.sleep(0.01)
+    supervisor.check()
+    assert worker.starts == 2
+    assert supervisor.restarts == {'worker': 1}
+
+    # Backoff doubles
+    worker.running = False
+    assert 0.01 < supervisor.check() <= 0.02
+    time.sleep(0.02)
+    supervisor.check()
+    assert supervisor.restarts == {'worker': 2}
+
+    # Budget exhausted
+    worker.running = False
+    with pytest.raises(RestartsExhaustedError):
+        supervisor.check()
+    assert worker.starts == 3
+
+
+def test_add():
+
+    worker = Worker()
+    supervisor = Supervisor('test', ru.get_logger('radical.entk.test'))
+    supervisor.add('worker', worker.start, worker.alive)
+
+    with pytest.raises(ExistsError):
+        supervisor.add('worker', worker.start, worker.alive)
+
+    with pytest.raises(TypeError):
+        Supervisor('test', ru.get_logger('radical.entk.test'), max_restarts='1')
@@ -1,4 +1,4 @@
-from radical.entk import Task
+from radical.entk import Task, TaskTemplate
 from radical.entk import states
 from radical.entk.exceptions import *
 import pytest
@@ -18,6 +18,7 @@ def test_attribute_types():
     assert type(t.link_input_data) == list
     assert type(t.copy_output_data) == list
     assert type(t.download_output_data) == list
+    assert type(t.priority) == int
 
 
 def test_assignment_exceptions():
@@ -33,6 +34,10 @@ def test_assignment_exceptions():
             with pytest.raises(TypeError):
                 t.name = data
 
+        if not isinstance(data,int):
+            with pytest.raises(TypeError):
+                t.priority = data
+
         if not isinstance(data,list):
 
             with pytest.raises(TypeError):
@@ -66,3 +71,148 @@ def test_assignment_exceptions():
 def test_init_state():
     t = Task()
     assert t.state == states.NEW
+
+
+def test_state_codes():
+
+    t = Task()
+
+    # States are kept as codes and read back as names
+    t.state = unicode(states.EXECUTING)
+    assert t._state == states.EXECUTING_CODE
+    assert type(t.state) == str
+    assert t.state == states.EXECUTING
+    assert t.to_dict()['state'] == states.EXECUTING
+
+    with pytest.raises(ValueError):
+        t.state = 'CHECKPOINTED'
+
+    for data in [1, True, list()]:
+        with pytest.raises(TypeError):
+            t.state = data
+
+    assert t.state == states.EXECUTING
+
+    assert states.TASK_TRANSITIONS[states.QUEUED_CODE][states.NEW_CODE]
+    assert states.TASK_TRANSITIONS[states.EXECUTING_CODE][states.DONE_CODE]
+    assert not states.TASK_TRANSITIONS[states.EXECUTING_CODE][states.QUEUED_CODE]
+    assert not states.TASK_TRANSITIONS[states.DONE_CODE][states.EXECUTING_CODE]
+
+    # Illegal transitions are refused, final states may be set again
+    t.state = states.DONE
+    with pytest.raises(ValueError):
+        t.state = states.EXECUTING
+    assert t.state == states.DONE
+    t.state = states.DONE
+
+
+def test_shared_empty_lists():
+
+    t1 = Task()
+    t2 = Task()
+
+    # Unassigned lists are shared until they are used
+    assert t1._copy_input_data is t2._copy_input_data
+
+    with pytest.raises(TypeError):
+        t1._copy_input_data.append('a.txt')
+
+    t1.copy_input_data.append('a.txt')
+    assert type(t1.copy_input_data) == list
+    assert t1.copy_input_data == ['a.txt']
+    assert t2.copy_input_data == []
+    assert t1.copy_input_data is not t2.copy_input_data
+
+    # Task descriptions carry plain lists
+    d = t2.to_dict()
+    assert type(d['link_input_data']) == list
+
+    t3 = Task()
+    t3.load_from_dict(d)
+    assert t3.link_input_data == []
+    t3.link_input_data.append('b.txt')
+    assert t2.link_input_data == []
+
+
+def test_pickle():
+
+    from radical.entk import Stage
+    from radical.entk.task.task import EMPTY_LIST
+    import pickle
+
+    # Tasks keep no dictionary of their own
+    t = Task()
+    assert not hasattr(t, '__dict__')
+    with pytest.raises(AttributeError):
+        t.undefined = 1
+
+    t.executable = ['/bin/date']
+    t.environment = ['module load gromacs']
+    s = Stage()
+    s.add_tasks(t)
+
+    for protocol in [0, 1, 2]:
+
+        s2 = pickle.loads(pickle.dumps(s, protocol))
+        t2 = list(s2.tasks)[0]
+
+        assert (t2.uid, t2.executable, t2.environment) == (t.uid, t.executable, t.environment)
+        assert t2._p_stage_obj is s2
+        assert t2._arguments is EMPTY_LIST
+        assert s2.progress == s.progress
+
+
+def test_template():
+
+    with pytest.raises(TypeError):
+        Task(template='gromacs')
+
+    with pytest.raises(TypeError):
+        TaskTemplate(executable='gmx')
+
+    with pytest.raises(ValueError):
+        TaskTemplate(environment=['module load gromacs'])
+
+    template = TaskTemplate(executable=['gmx'], arguments=['mdrun', '-deffnm', 'md'],
+                            cores=16)
+
+    t1 = Task(template=template)
+    t2 = Task(template=template)
+    t2.arguments = template.arguments + ['-seed', '2']
+    t2.copy_input_data = []
+
+    # Unassigned attributes are copies of the template's
+    assert (t1.executable, t1.cores) == (['gmx'], 16)
+    t1.executable.append('-v')
+    assert t1.executable == ['gmx', '-v']
+    assert template.executable == ['gmx']
+
+    assert t2.to_dict()['arguments'] == ['mdrun', '-deffnm', 'md', '-seed', '2']
+    assert t2.to_dict()['executable'] == ['gmx']
+
+    # Deltas hold the attributes assigned to the task only
+    delta = t2._to_delta()
+    assert delta['template'] == template.uid
+    assert delta['arguments'] == ['mdrun', '-deffnm', 'md', '-seed', '2']
+    assert 'executable' not in delta and 'cores' not in delta
+
+    # Attributes equal to the template's are not sent, empty lists override
+    assert 'copy_input_data' not in delta
+    t5 = Task(template=template)
+    t5.executable = []
+    assert t5._to_delta()['executable'] == []
+
+    # Reading inherited attributes does not turn them into overrides, changing them does
+    assert (t2.executable, t2.pre_exec) == (['gmx'], [])
+    assert 'executable' not in t2._to_delta() and 'pre_exec' not in t2._to_delta()
+    assert t1._to_delta()['executable'] == ['gmx', '-v']
+
+    # Replicas keep the template
+    t3 = Task()
+    t3._replicate(t2)
+    assert t3.template is template
+    assert t3.to_dict()['cores'] == 16
+
+    t4 = Task()
+    t4.template = template
+    assert t4.arguments == ['mdrun', '-deffnm', 'md']
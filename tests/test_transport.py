@@ -0,0 +1,504 @@
+from radical.entk.appman.transport import get_transport, LocalTransport, RabbitMQTransport, ShmTransport, LOCAL, RABBITMQ, ZMQ, SHM, MAX_PRIORITY, SHM_TASK_BYTES
+from radical.entk.exceptions import *
+import radical.entk.appman.transport as transport_module
+from multiprocessing import Process
+import pytest
+import pika
+import os
+import time
+
+
+def test_get_transport():
+
+    assert isinstance(get_transport(LOCAL), LocalTransport)
+    assert isinstance(get_transport(RABBITMQ, 'localhost'), RabbitMQTransport)
+
+    transport = LocalTransport()
+    assert get_transport(transport) is transport
+
+    with pytest.raises(ValueError):
+        get_transport('amqp')
+
+    with pytest.raises(TypeError):
+        RabbitMQTransport(1)
+
+
+def test_local_queues():
+
+    transport = get_transport(LOCAL)
+    channel = transport.channel()
+
+    channel.declare_queue('q1')
+    channel.declare_queue('q2')
+
+    channel.publish('q1', 'a')
+    channel.publish('q1', 'b')
+    time.sleep(0.1)
+
+    assert channel.get('q1')[1] == 'a'
+    assert channel.get('q2') == (None, None)
+
+    # Fanout
+    channel.declare_fanout('fork', ['q1', 'q2'])
+    channel.publish('', 'c', exchange='fork')
+
+    channel.consume('q1', 10)
+    assert [channel.next_delivery(1)[1] for i in range(3)] == ['b', 'c', None]
+
+    # Consuming multiple queues
+    channel.consume('q2', 10)
+    assert channel.next_delivery(1)[1] == 'c'
+    assert channel.next_delivery(0.05) == (None, None)
+
+    # Deleted queues lose their messages
+    channel.publish('q2', 'd')
+    time.sleep(0.1)
+    channel.delete_queue('q2')
+    channel.declare_queue('q2')
+    assert channel.get('q2') == (None, None)
+
+
+def test_local_processes():
+
+    transport = get_transport(LOCAL)
+    channel = transport.channel()
+    channel.declare_queue('q')
+
+    # Queues declared before a process is started are shared with it
+    def publish():
+        transport.channel().publish('q', 'from child')
+
+    proc = Process(target=publish)
+    proc.start()
+    proc.join()
+
+    channel.consume('q', 1)
+    assert channel.next_delivery(5)[1] == 'from child'
+
+
+def test_zmq_queues():
+
+    pytest.importorskip('zmq')
+
+    transport = get_transport(ZMQ)
+    channel = transport.channel()
+
+    # The consumer binds the queue on the first get, messages published before are
+    # delivered once the producer connected
+    assert channel.get('q1') == (None, None)
+    channel.publish('q1', 'a')
+    channel.publish('q1', 'b')
+    time.sleep(0.1)
+
+    assert channel.get('q1')[1] == 'a'
+
+    channel.consume('q1', 10)
+    assert channel.next_delivery(1)[1] == 'b'
+    assert channel.next_delivery(0.05) == (None, None)
+
+    channel.close()
+    transport.close()
+
+
+def test_zmq_processes():
+
+    pytest.importorskip('zmq')
+
+    transport = get_transport(ZMQ)
+    transport.channel().declare_fanout('fork', ['q1', 'q2'])
+
+    # Queues are bound by their consumers. A channel used by the child does not use the
+    # sockets the parent opened on it.
+    parent = transport.channel()
+    parent.publish('q1', 'from parent')
+
+    def publish():
+        parent.publish('q1', 'from child')
+        parent.publish('', 'fanout', exchange='fork')
+        parent.close()
+
+    channels = [transport.channel() for queue in ['q1', 'q2']]
+    channels[0].consume('q1', 10)
+    channels[1].consume('q2', 10)
+
+    assert channels[0].next_delivery(5)[1] == 'from parent'
+
+    proc = Process(target=publish)
+    proc.start()
+
+    assert channels[0].next_delivery(5)[1] == 'from child'
+    assert channels[0].next_delivery(5)[1] == 'fanout'
+    assert channels[1].next_delivery(5)[1] == 'fanout'
+
+    proc.join()
+
+    for channel in channels + [parent]:
+        channel.close()
+    transport.close()
+
+
+def test_zmq_inherited_sockets():
+
+    pytest.importorskip('zmq')
+
+    transport = get_transport(ZMQ)
+    channel = transport.channel()
+    channel.consume('q1', 10)
+
+    # The child is forked while the queue is bound, e.g. a restarted process. Its
+    # producer does not reconnect to the inherited socket once the consumer closed it,
+    # so it closes without waiting for the linger to expire.
+    def publish():
+        child = transport.channel()
+        child.publish('q1', 'from child')
+        time.sleep(0.5)
+        child.close()
+
+    proc = Process(target=publish)
+    proc.start()
+
+    assert channel.next_delivery(5)[1] == 'from child'
+    channel.close()
+
+    proc.join(transport_module.ZMQ_LINGER/2000.0)
+    alive = proc.is_alive()
+    proc.terminate()
+    transport.close()
+
+    assert not alive
+
+
+def test_shm_queues():
+
+    transport = get_transport(SHM)
+    channel = transport.channel()
+
+    channel.declare_queue('q1')
+    channel.declare_queue('q2')
+
+    channel.publish('q1', 'a')
+    assert channel.get('q1')[1] == 'a'
+    assert channel.get('q1') == (None, None)
+
+    channel.declare_fanout('fork', ['q1', 'q2'])
+    channel.publish('', 'b', exchange='fork')
+
+    channel.consume('q1', 10)
+    channel.consume('q2', 10)
+    assert [channel.next_delivery(1)[1] for i in range(3)] == ['b', 'b', None]
+
+
+def test_shm_full_queue():
+
+    transport = ShmTransport(slots=4, slot_size=16)
+    assert transport.max_in_flight == 1
+    assert ShmTransport().max_in_flight == 4096*256/SHM_TASK_BYTES
+
+    assert LocalTransport().max_in_flight is None
+
+    channel = transport.channel()
+    channel.declare_queue('q')
+
+    for i in range(4):
+        channel.publish('q', 'a', timeout=0)
+
+    with pytest.raises(QueueFullError):
+        channel.publish('q', 'b', timeout=0.01)
+
+    assert channel.get('q')[1] == 'a'
+    channel.publish('q', 'b', timeout=0)
+
+
+def test_unacked_requeued():
+
+    for name in [LOCAL, SHM]:
+
+        transport = get_transport(name)
+        channel = transport.channel()
+        channel.declare_queue('q')
+
+        for body in ['a', 'b', 'c', 'd']:
+            channel.publish('q', body)
+        time.sleep(0.1)
+
+        # Messages delivered and not acknowledged are requeued on close
+        channel.consume('q', 10)
+        tags = [channel.next_delivery(1)[0] for i in range(3)]
+        channel.ack(tags[0])
+        channel.close()
+
+        channel = transport.channel()
+        channel.consume('q', 10)
+        deliveries = [channel.next_delivery(1) for i in range(3)]
+        assert [body for tag, body in deliveries] == ['d', 'b', 'c']
+
+        # All messages up to a tag are acknowledged at once
+        channel.ack(deliveries[-1][0], multiple=True)
+        channel.close()
+
+        channel = transport.channel()
+        assert channel.get('q') == (None, None)
+
+        # Messages of a consumer process that failed are delivered to its successor
+        channel.publish('q', 'e')
+        time.sleep(0.1)
+
+        def consume():
+            channel = transport.channel()
+            channel.consume('q', 10)
+            assert channel.next_delivery(5)[1] == 'e'
+            channel.close()
+
+        proc = Process(target=consume)
+        proc.start()
+        proc.join()
+        assert proc.exitcode == 0
+
+        channel.consume('q', 10)
+        assert channel.next_delivery(5)[1] == 'e'
+
+
+def test_zmq_unacked_lost():
+
+    pytest.importorskip('zmq')
+
+    transport = get_transport(ZMQ)
+    producer = transport.channel()
+    channel = transport.channel()
+
+    channel.consume('q', 10)
+    producer.publish('q', 'a')
+    assert channel.next_delivery(1)[1] == 'a'
+
+    # Messages delivered and not acknowledged are not requeued
+    channel.close()
+    channel = transport.channel()
+    channel.consume('q', 10)
+    producer.publish('q', 'b')
+    assert channel.next_delivery(1)[1] == 'b'
+    assert channel.next_delivery(0.05) == (None, None)
+
+    channel.close()
+    producer.close()
+    transport.close()
+
+
+class FakeMethodFrame(object):
+
+    def __init__(self, delivery_tag):
+        self.delivery_tag = delivery_tag
+
+
+class FakeChannel(object):
+
+    def __init__(self):
+        self.is_open = True
+        self.published = list()
+        self.priorities = list()
+        self.declared = dict()
+        self.acks = list()
+        self.nacks = list()
+        self.fail = False
+
+        # Confirm mode, bodies of the messages the broker rejects
+        self.confirming = False
+        self.rejected = set()
+
+    def confirm_delivery(self):
+        if self.fail:
+            raise pika.exceptions.ConnectionClosed()
+        self.confirming = True
+
+    def queue_declare(self, queue, arguments):
+        self.declared[queue] = arguments
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        if self.fail:
+            raise pika.exceptions.ConnectionClosed()
+        self.published.append((routing_key, body))
+        self.priorities.append(properties.priority if properties else None)
+        return not (self.confirming and body in self.rejected)
+
+    def basic_get(self, queue):
+        return FakeMethodFrame(1), None, 'body'
+
+    def basic_ack(self, delivery_tag, multiple):
+        self.acks.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag, multiple, requeue):
+        self.nacks.append((delivery_tag, multiple, requeue))
+
+
+class FakeConnection(object):
+
+    def __init__(self, parameters):
+        self.is_open = True
+        self._channel = FakeChannel()
+
+    def channel(self):
+        return self._channel
+
+    def process_data_events(self, time_limit=0):
+        if self._channel.fail:
+            raise pika.exceptions.ConnectionClosed()
+
+    def close(self):
+        self.is_open = False
+
+
+def test_rabbitmq_pool(monkeypatch):
+
+    monkeypatch.setattr(transport_module.pika, 'BlockingConnection', FakeConnection)
+
+    transport = get_transport(RABBITMQ)
+
+    # Connections of closed channels are reused
+    channel = transport.channel()
+    channel.close()
+    channel = transport.channel()
+    other = transport.channel()
+    assert transport.stats == {'opened': 2, 'reused': 1, 'reconnects': 0}
+
+    # Broken connections are replaced transparently, not returned to the pool
+    broken = channel._mq_channel
+    delivery_tag, body = channel.get('q')
+    broken.fail = True
+    channel.publish('q', 'a')
+
+    assert channel._mq_channel is not broken
+    assert channel._mq_channel.published == [('q', 'a')]
+    assert transport.stats == {'opened': 2, 'reused': 1, 'reconnects': 1}
+
+    # Messages delivered on the broken connection are not acked
+    channel.ack(delivery_tag)
+    assert broken.acks == [] and channel._mq_channel.acks == []
+
+    channel.close()
+    other.close()
+    assert len(transport._pool._idle) == 2
+
+    # Closed connections are not reused
+    other._mq_connection.close()
+    transport.channel()
+    assert transport.stats == {'opened': 2, 'reused': 2, 'reconnects': 1}
+
+
+def test_rabbitmq_requeue_on_close(monkeypatch):
+
+    monkeypatch.setattr(transport_module.pika, 'BlockingConnection', FakeConnection)
+
+    transport = get_transport(RABBITMQ)
+
+    # A message taken from the channel by a thread that failed before acking it is
+    # requeued before the connection goes back to the pool
+    channel = transport.channel()
+    delivery_tag, body = channel.get('q')
+    mq_channel = channel._mq_channel
+    channel.close()
+    assert mq_channel.nacks == [(0, True, True)]
+    assert mq_channel.acks == []
+    assert transport._pool._idle == [(channel._mq_connection, mq_channel)]
+
+
+def test_rabbitmq_priorities(monkeypatch):
+
+    monkeypatch.setattr(transport_module.pika, 'BlockingConnection', FakeConnection)
+
+    channel = get_transport(RABBITMQ).channel()
+
+    channel.declare_queues(['q1'], priorities=True)
+    channel.declare_queue('q2')
+    assert channel._mq_channel.declared['q1']['x-max-priority'] == MAX_PRIORITY
+    assert 'x-max-priority' not in channel._mq_channel.declared['q2']
+
+    # Priorities above the maximum of the queues are capped
+    channel.publish('q1', 'a')
+    channel.publish('q1', 'b', priority=3)
+    channel.publish('q1', 'c', priority=MAX_PRIORITY + 1)
+    assert channel._mq_channel.priorities == [None, 3, MAX_PRIORITY]
+
+
+def test_rabbitmq_confirms(monkeypatch):
+
+    monkeypatch.setattr(transport_module.pika, 'BlockingConnection', FakeConnection)
+
+    nacked = list()
+
+    channel = get_transport(RABBITMQ).channel()
+    channel.confirm_delivery(2)
+    assert channel._mq_channel.confirming
+
+    # Messages are confirmed as they are published, rejected messages are reported
+    channel._mq_channel.rejected.add('b')
+    for body in ['a', 'b', 'c']:
+        channel.publish('q', body, on_nack=lambda body=body: nacked.append(body))
+    assert nacked == ['b']
+    assert channel.wait_for_confirms(0)
+
+    # Messages that could not be published on a failed connection are published on
+    # the new one, in confirm mode
+    broken = channel._mq_channel
+    broken.fail = True
+    channel.publish('q', 'd', on_nack=lambda: nacked.append('d'))
+    assert channel._mq_channel is not broken
+    assert channel._mq_channel.confirming
+    assert channel._mq_channel.published == [('q', 'd')]
+    assert nacked == ['b']
+
+    # Channels in confirm mode are not returned to the pool
+    channel.close()
+    assert channel._pool._idle == []
+
+
+def _rabbitmq_hostname():
+
+    # Broker backed tests run against the RabbitMQ server on RMQ_HOSTNAME, and are
+    # skipped if there is none
+    hostname = os.environ.get('RMQ_HOSTNAME', 'localhost')
+
+    try:
+        connection = pika.BlockingConnection(pika.ConnectionParameters(host=hostname))
+    except pika.exceptions.AMQPConnectionError:
+        pytest.skip('No RabbitMQ server on %s'%hostname)
+
+    connection.close()
+    return hostname
+
+
+def test_rabbitmq_broker_confirms():
+
+    hostname = _rabbitmq_hostname()
+
+    nacked = list()
+    queue = 'radical.entk.test.confirms.%s'%os.getpid()
+    full = 'radical.entk.test.confirms.full.%s'%os.getpid()
+
+    channel = get_transport(RABBITMQ, hostname).channel()
+    channel.declare_queue(queue)
+
+    # The broker rejects the messages published to a full queue
+    channel._mq_channel.queue_declare(queue=full, arguments={'x-max-length': 1,
+                                                            'x-overflow': 'reject-publish'})
+
+    try:
+        channel.confirm_delivery(4)
+
+        # Acks of more messages than the window
+        for i in range(20):
+            channel.publish(queue, str(i), on_nack=lambda: nacked.append('ack'))
+
+        assert channel.wait_for_confirms(10)
+        assert nacked == []
+        assert [channel.get(queue)[1] for i in range(21)] == [str(i) for i in range(20)] + [None]
+
+        # Nacks
+        for i in range(3):
+            channel.publish(full, str(i), on_nack=lambda i=i: nacked.append(i))
+
+        assert channel.wait_for_confirms(10)
+        assert nacked == [1, 2]
+
+    finally:
+        channel.delete_queue(queue)
+        channel.delete_queue(full)
+        channel.close()
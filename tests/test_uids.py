@@ -0,0 +1,120 @@
+from radical.entk import Pipeline, Stage, Task, uids
+from radical.entk.uids import UidAllocator
+from radical.entk.exceptions import *
+from multiprocessing import Process, Queue
+import subprocess
+import threading
+import pytest
+import sys
+
+
+def test_allocator_types():
+
+    with pytest.raises(TypeError):
+        UidAllocator(1)
+
+    with pytest.raises(TypeError):
+        UidAllocator('radical.entk.test', block_size='4')
+
+    with pytest.raises(ValueError):
+        UidAllocator('radical.entk.test', block_size=0)
+
+    with pytest.raises(TypeError):
+        uids.set_lazy('True')
+
+
+def test_allocator_blocks():
+
+    allocator = UidAllocator('radical.entk.test', block_size=4)
+
+    assert [allocator.new() for i in range(6)] == ['radical.entk.test.%s.%04d'%(uids.SESSION, i)
+                                                    for i in range(6)]
+    assert allocator.format(12345) == 'radical.entk.test.%s.12345'%uids.SESSION
+
+    # Threads draw from blocks of their own
+    numbers = dict()
+
+    def allocate(thread):
+        numbers[thread] = [allocator.number() for i in range(10)]
+
+    threads = [threading.Thread(target=allocate, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    allocated = [n for thread in numbers.values() for n in thread]
+    assert len(set(allocated)) == 40
+    assert min(allocated) >= 6
+    for thread in numbers.values():
+        assert thread == sorted(thread)
+
+
+def test_process_uids():
+
+    allocator = UidAllocator('radical.entk.test', block_size=4)
+    parent = [allocator.number()]
+
+    # Processes share the counter, a child does not continue the block of its parent
+    def allocate(results):
+        results.put([allocator.number() for i in range(6)])
+
+    results = Queue()
+    procs = [Process(target=allocate, args=(results,)) for i in range(2)]
+    for proc in procs:
+        proc.start()
+    children = [results.get() for proc in procs]
+    for proc in procs:
+        proc.join()
+
+    parent += [allocator.number() for i in range(6)]
+
+    allocated = parent + children[0] + children[1]
+    assert len(set(allocated)) == len(allocated)
+
+    # Sessions of different interpreters differ
+    other = subprocess.check_output([sys.executable, '-c',
+                                    'from radical.entk import uids; print uids.SESSION'])
+    assert other.strip() != uids.SESSION
+    assert len(uids.SESSION) == 16
+
+
+def test_uid_format():
+
+    import re
+
+    # Objects of a run share the session, their counters differ
+    for obj, kind in [(Task(), 'task'), (Stage(), 'stage'), (Pipeline(), 'pipeline')]:
+        match = re.match(r'^radical\.entk\.%s\.([0-9a-f]{16})\.(\d{4,})$'%kind, obj.uid)
+        assert match
+        assert match.group(1) == uids.SESSION
+
+
+def test_lazy_uids():
+
+    uids.set_lazy(True)
+
+    try:
+        p = Pipeline()
+        s = Stage()
+        t = Task()
+    finally:
+        uids.set_lazy(False)
+
+    assert isinstance(t._uid, int)
+    assert t.uid == uids.TASK_UIDS.format(t._uid)
+    assert t.uid.startswith('radical.entk.task.')
+    assert t.to_dict()['uid'] == t.uid
+
+    # Uids given to children are formatted
+    s.add_tasks(t)
+    p.add_stages(s)
+    assert t._parent_stage == s.uid
+    assert s._parent_pipeline == p.uid
+    assert p.uid.startswith('radical.entk.pipeline.')
+
+    # Replicas of lazy tasks get uids of the current mode
+    r = Task()
+    r._replicate(t)
+    assert isinstance(r._uid, str) and r.uid != t.uid
+    assert Task().uid != t.uid
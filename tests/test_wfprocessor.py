@@ -1,8 +1,9 @@
 from radical.entk.appman.wfprocessor import WFprocessor
-from radical.entk import Pipeline, Stage, Task
+from radical.entk import Pipeline, Stage, Task, states
 import pytest
 from radical.entk.exceptions import *
-from Queue import Queue
+from radical.entk.appman.shard import get_shard
+from Queue import Queue, PriorityQueue
 
 def test_pending_completed_queue_types():
 
@@ -97,4 +98,283 @@ def test_thread_termination():
     p.start_processor()
     assert p.check_alive() == True
     p.end_processor()
-    assert p.check_alive() == False
\ No newline at end of file
+    assert p.check_alive() == False
+
+def test_setup_ready_queue():
+
+    p1 = Pipeline()
+    p1.add_stages(Stage())
+    p2 = Pipeline()
+    p2.add_stages(Stage())
+    p2._increment_stage()
+
+    p = WFprocessor(set([p1, p2]), ['pendingq'], ['completedq'], 'localhost')
+    p._ready_queues = [Queue()]
+    p._setup_ready_queue()
+
+    # Only the incomplete pipeline is ready
+    priority, ready_time, pipe = p._ready_queues[0].get_nowait()
+    assert pipe is p1
+    assert p._ready_queues[0].empty()
+
+
+def test_requeue_tasks():
+
+    p1 = Pipeline()
+    s = Stage()
+    t1 = Task()
+    t2 = Task()
+    s.add_tasks([t1, t2])
+    p1.add_stages(s)
+
+    p = WFprocessor(set([p1]), ['pendingq'], ['completedq'], 'localhost')
+    p._ready_queues = [Queue()]
+    p._index_workflow()
+    p._setup_ready_queue()
+    p._ready_queues[0].get_nowait()
+
+    # Pipeline is made ready once for all its tasks of a failed batch
+    p._requeue_tasks([t1, t2])
+    priority, ready_time, pipe = p._ready_queues[0].get_nowait()
+    assert pipe is p1
+    assert p._ready_queues[0].empty()
+
+
+def test_sharded_ready_queues():
+
+    pipes = set()
+    for i in range(10):
+        p1 = Pipeline()
+        p1.add_stages(Stage())
+        pipes.add(p1)
+
+    p = WFprocessor(pipes, ['pendingq'], ['completedq-1', 'completedq-2'], 'localhost', 
+                    push_threads=3, pull_threads=4)
+
+    # Dequeue threads beyond the number of completed queues would stay idle
+    assert p._num_pull_threads == 2
+
+    p._ready_queues = [Queue() for i in range(3)]
+    p._setup_ready_queue()
+
+    # Each pipeline is made ready on the queue of the enqueue thread owning it
+    for shard, q in enumerate(p._ready_queues):
+        while not q.empty():
+            priority, ready_time, pipe = q.get_nowait()
+            assert get_shard(pipe.uid, 3) == shard
+            pipes.remove(pipe)
+
+    assert pipes == set()
+
+    with pytest.raises(ValueError):
+        WFprocessor(pipes, ['pendingq'], ['completedq'], 'localhost', push_threads=0)
+
+    with pytest.raises(TypeError):
+        WFprocessor(pipes, ['pendingq'], ['completedq'], 'localhost', pull_threads='1')
+
+
+def test_update_task():
+
+    p1 = Pipeline()
+    s1 = Stage()
+    t1 = Task()
+    t2 = Task()
+    s1.add_tasks([t1, t2])
+    s2 = Stage()
+    s2.add_tasks(Task())
+    p1.add_stages([s1, s2])
+
+    p = WFprocessor(set([p1]), ['pendingq'], ['completedq'], 'localhost')
+    p._ready_queues = [Queue()]
+    p._index_workflow()
+    p._setup_ready_queue()
+    p._ready_queues[0].get_nowait()
+
+    notification = p._update_task({'uid': t1.uid, 'state': states.DONE, 'timestamp': 0, 'exit_code': 0})
+    assert t1.state == states.DONE
+    assert t1.exit_code == 0
+    assert p1._current_stage == 0
+    assert notification['exit_code'] == 0
+    assert notification['stage_state'] == s1.state
+    assert (notification['pipeline'], notification['current_stage'], notification['completed']) == (p1.uid, 0, False)
+
+    # Stage completes with its last task, the next stage is made ready
+    notification = p._update_task({'uid': t2.uid, 'state': states.DONE, 'timestamp': 0})
+    assert t2.exit_code is None
+    assert s1.state == states.DONE
+    assert p1._current_stage == 1
+    priority, ready_time, pipe = p._ready_queues[0].get_nowait()
+    assert pipe is p1
+    assert notification['stage_state'] == states.DONE
+    assert notification['current_stage'] == 1
+
+    # Failed tasks are resubmitted as replicas
+    t3 = list(s2.tasks)[0]
+    p._resubmit_failed = True
+    notification = p._update_task({'uid': t3.uid, 'state': states.FAILED, 'timestamp': 0})
+    assert notification['replica'] in p._task_index
+    assert p._task_index[notification['replica']][1] is s2
+
+    # Unknown tasks and states, repeated and late updates of completed tasks are ignored
+    assert p._update_task({'uid': 'radical.entk.task.unknown', 'state': states.DONE, 'timestamp': 0}) is None
+    assert p._update_task({'uid': t1.uid, 'state': 'CHECKPOINTED', 'timestamp': 0}) is None
+    assert p._update_task({'uid': t2.uid, 'state': states.DONE, 'timestamp': 0}) is None
+    assert p._update_task({'uid': t2.uid, 'state': states.EXECUTING, 'timestamp': 0}) is None
+    assert t2.state == states.DONE
+    assert p1._current_stage == 1
+
+
+def test_submit_stage_credits():
+
+    p1 = Pipeline()
+    s1 = Stage()
+    tasks = [Task() for i in range(5)]
+    s1.add_tasks(tasks)
+    p1.add_stages(s1)
+
+    p = WFprocessor(set([p1]), ['pendingq'], ['completedq'], 'localhost', max_in_flight=2)
+    p._ready_queues = [Queue()]
+    p._index_workflow()
+    p._setup_ready_queue()
+    priority, ready_time, pipe = p._ready_queues[0].get_nowait()
+
+    class FakeBatcher(object):
+        def __init__(self):
+            self.tasks = list()
+        def add(self, task, routing_key, stage_width=1, priority=0):
+            self.tasks.append(task)
+
+    # Tasks are submitted as far as there are credits
+    batcher = FakeBatcher()
+    p._submit_stage(p1, ready_time, batcher, p._ready_queues[0])
+    assert len(batcher.tasks) == 2
+    assert [t.state for t in tasks].count(states.NEW) == 3
+
+    # Completed tasks make the pipeline ready for the next ones
+    p._update_task({'uid': batcher.tasks[0].uid, 'state': states.DONE, 'timestamp': 0})
+    priority, ready_time, pipe = p._ready_queues[0].get_nowait()
+    p._submit_stage(p1, ready_time, batcher, p._ready_queues[0])
+    assert len(batcher.tasks) == 3
+    assert len(set(batcher.tasks)) == 3
+    assert p._credits.in_flight == 2
+
+
+def test_restart_credits():
+
+    p1 = Pipeline()
+    s1 = Stage()
+    tasks = [Task() for i in range(4)]
+    s1.add_tasks(tasks)
+    p1.add_stages(s1)
+
+    # Copy of the workflow of a restarted process, with tasks submitted before
+    for task in tasks[:3]:
+        task.state = states.QUEUED
+
+    p = WFprocessor(set([p1]), ['pendingq'], ['completedq'], 'localhost', max_in_flight=2)
+    p._ready_queues = [Queue()]
+    p._index_workflow()
+    p._setup_ready_queue()
+    priority, ready_time, pipe = p._ready_queues[0].get_nowait()
+    assert p._credits.in_flight == 3
+
+    class FakeBatcher(object):
+        def __init__(self):
+            self.tasks = list()
+        def add(self, task, routing_key, stage_width=1, priority=0):
+            self.tasks.append(task)
+
+    # Only the task not submitted before is submitted, once credits are available
+    batcher = FakeBatcher()
+    p._submit_stage(p1, ready_time, batcher, p._ready_queues[0])
+    assert batcher.tasks == []
+
+    # Repeated completions do not release credits again
+    for task in tasks[:2]:
+        p._update_task({'uid': task.uid, 'state': states.DONE, 'timestamp': 0})
+        p._update_task({'uid': task.uid, 'state': states.DONE, 'timestamp': 0})
+    assert p._credits.in_flight == 1
+
+    priority, ready_time, pipe = p._ready_queues[0].get_nowait()
+    p._submit_stage(p1, ready_time, batcher, p._ready_queues[0])
+    assert batcher.tasks == [tasks[3]]
+    assert p._credits.in_flight == 2
+
+    p._update_task({'uid': tasks[2].uid, 'state': states.DONE, 'timestamp': 0})
+    p._update_task({'uid': tasks[3].uid, 'state': states.DONE, 'timestamp': 0})
+    assert p._credits.in_flight == 0
+    assert s1.state == states.DONE
+
+
+def test_submit_stage_priorities():
+
+    p1 = Pipeline()
+    p1.priority = 2
+    s1 = Stage()
+    tasks = [Task() for i in range(4)]
+    for i, task in enumerate(tasks):
+        task.priority = i
+    s1.add_tasks(tasks)
+    p1.add_stages(s1)
+
+    p = WFprocessor(set([p1]), ['pendingq'], ['completedq'], 'localhost')
+    p._ready_queues = [PriorityQueue()]
+    p._index_workflow()
+    p._setup_ready_queue()
+    priority, ready_time, pipe = p._ready_queues[0].get_nowait()
+
+    class FakeBatcher(object):
+        def __init__(self):
+            self.tasks = list()
+            self.priorities = set()
+        def add(self, task, routing_key, stage_width=1, priority=0):
+            self.tasks.append(task)
+            self.priorities.add(priority)
+
+    # Tasks are submitted highest priority first, with the priority of their pipeline
+    batcher = FakeBatcher()
+    p._submit_stage(p1, ready_time, batcher, p._ready_queues[0])
+    assert batcher.tasks == tasks[::-1]
+    assert batcher.priorities == set([2])
+
+
+def test_dequeue_failure(monkeypatch):
+
+    import threading
+    from radical.entk.appman.transport import Transport
+
+    class Channel(object):
+        def __init__(self, calls):
+            self.calls = calls
+            self.bodies = ['a', 'b']
+        def consume(self, queue, prefetch_count):
+            pass
+        def next_delivery(self, timeout):
+            self.calls.append('deliver')
+            return len(self.calls), self.bodies.pop(0)
+        def ack(self, delivery_tag, multiple=False):
+            self.calls.append(('ack', multiple))
+        def close(self):
+            self.calls.append('close')
+
+    class FakeTransport(Transport):
+        def __init__(self):
+            self.calls = list()
+        def channel(self):
+            return Channel(self.calls)
+
+    # The second update fails the dequeue thread
+    def apply_updates(self, body, mq_channel):
+        if body == 'b':
+            raise Exception('update failed')
+
+    monkeypatch.setattr(WFprocessor, '_apply_updates', apply_updates)
+
+    transport = FakeTransport()
+    p = WFprocessor(set(), ['pendingq'], ['completedq'], 'localhost', transport=transport)
+    p._dequeue_thread_terminate = threading.Event()
+
+    # The ack of the update applied is sent before the channel is closed
+    with pytest.raises(UnknownError):
+        p.dequeue(0)
+    assert transport.calls == ['deliver', 'deliver', ('ack', True), 'close']